@@ -20,6 +20,7 @@ This module handles the reading and writing of csv-files.
 """
 
 import csv
+import os
 
 class CSVFile(object):
     r"""
@@ -28,6 +29,8 @@ class CSVFile(object):
     The class does not cache the files content.
     Every read access accesses the actual file.
     Writing does the file update.
+    The new content gets written into a temporary file that replaces the old file afterwards.
+    So a crash while writing never leaves a partially written file.
 
     The csv files this class works with must have the following dialect:
 
@@ -174,7 +177,8 @@ class CSVFile(object):
         if type(header) != list:
             raise TypeError("The header argument must be of type list!")
 
-        with open(self.path, "w") as csvfile:
+        tmppath = self.path + ".tmp"
+        with open(tmppath, "w") as csvfile:
             writer = csv.writer(csvfile, 
                     delimiter  = self.delimiter,
                     escapechar = self.escapechar,
@@ -189,6 +193,11 @@ class CSVFile(object):
                 csvrow = [row[key] for key in header]
                 writer.writerow(csvrow)
 
+            csvfile.flush()
+            os.fsync(csvfile.fileno())
+
+        # replace the old file in one step
+        os.replace(tmppath, self.path)
         return None
 
 # vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
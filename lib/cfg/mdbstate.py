@@ -41,17 +41,19 @@ class MDBState(Config, object):
 
     The following table shows which method is responsible for which file in the MusicDB State Directory.
 
-        +------------------------+-------------------------+-------------------------+
-        | File Name              | Read Method             | Write Method            |
-        +========================+=========================+=========================+
-        | songqueue.csv          | :meth:`~LoadSongQueue`  | :meth:`~SaveSongQueue`  |
-        +------------------------+-------------------------+-------------------------+
-        | artistblacklist.csv    | :meth:`~LoadBlacklists` | :meth:`~SaveBlacklists` |
-        +------------------------+-------------------------+-------------------------+
-        | albumblacklist.csv     | :meth:`~LoadBlacklists` |                         |
-        +------------------------+-------------------------+-------------------------+
-        | songblacklist.csv      | :meth:`~LoadBlacklists` |                         |
-        +------------------------+-------------------------+-------------------------+
+        +---------------------+---------------------------+---------------------------------------------------------+
+        | File Name           | Read Method               | Write Method                                            |
+        +=====================+===========================+=========================================================+
+        | songqueue.csv       | :meth:`~LoadSongQueue`    | :meth:`~SaveSongQueue`                                  |
+        +---------------------+---------------------------+---------------------------------------------------------+
+        | songqueue.log       | :meth:`~ReadSongQueueLog` | :meth:`~AppendSongQueueLog`, :meth:`~WriteSongQueueLog` |
+        +---------------------+---------------------------+---------------------------------------------------------+
+        | artistblacklist.csv | :meth:`~LoadBlacklists`   | :meth:`~SaveBlacklists`                                 |
+        +---------------------+---------------------------+---------------------------------------------------------+
+        | albumblacklist.csv  | :meth:`~LoadBlacklists`   |                                                         |
+        +---------------------+---------------------------+---------------------------------------------------------+
+        | songblacklist.csv   | :meth:`~LoadBlacklists`   |                                                         |
+        +---------------------+---------------------------+---------------------------------------------------------+
 
     Args:
         path: Absolute path to the MusicDB state directory
@@ -179,6 +181,78 @@ class MDBState(Config, object):
         return
 
 
+    def ReadSongQueueLog(self):
+        """
+        This method reads the operation log of the song queue (see :mod:`mdbapi.songqueue`).
+        Each line of the log is one operation.
+        The elements of an operation are separated by a comma.
+
+        If the last line is incomplete because MusicDB crashed while writing it, this line gets ignored.
+
+        Returns:
+            A list of operations, each a list of strings. ``None`` if there is no log.
+        """
+        path = os.path.join(self.path, "songqueue.log")
+
+        try:
+            with open(path, "r") as logfile:
+                content = logfile.read()
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning("Accessing file \"%s\" failed with error %s", str(path), str(e))
+            return None
+
+        lines = content.split("\n")
+        if lines[-1] != "":
+            logging.warning("Incomplete last entry in the song queue log: \"%s\" \033[1;30m(Entry will be ignored)", lines[-1])
+        return [line.split(",") for line in lines[:-1] if line]
+
+
+    def AppendSongQueueLog(self, operation):
+        """
+        This method appends one operation to the operation log of the song queue.
+        The file gets opened for each operation, so the log can be replaced by :meth:`~WriteSongQueueLog` at any time.
+
+        Args:
+            operation: A tuple of values that get joined by commas. The values must not contain a comma or a line break.
+
+        Returns:
+            *Nothing*
+
+        Raises:
+            OSError: When writing the file fails
+        """
+        path = os.path.join(self.path, "songqueue.log")
+        with open(path, "a") as logfile:
+            logfile.write(",".join([str(value) for value in operation]) + "\n")
+
+
+    def WriteSongQueueLog(self, operations):
+        """
+        This method replaces the operation log of the song queue by a new one with the given operations.
+        The new log gets written into a temporary file that replaces the old log afterwards.
+        So the log is always complete, even if MusicDB crashes while writing.
+
+        Args:
+            operations (list): A list of operations as expected by :meth:`~AppendSongQueueLog`
+
+        Returns:
+            *Nothing*
+
+        Raises:
+            OSError: When writing the file fails
+        """
+        path    = os.path.join(self.path, "songqueue.log")
+        tmppath = path + ".tmp"
+        with open(tmppath, "w") as logfile:
+            for operation in operations:
+                logfile.write(",".join([str(value) for value in operation]) + "\n")
+            logfile.flush()
+            os.fsync(logfile.fileno())
+        os.replace(tmppath, path)
+
+
     def LoadBlacklists(self):
         """
         This method returns a dictionary with the blacklist managed by :class:`mdbapi.randy.Randy`
@@ -196,7 +270,10 @@ class MDBState(Config, object):
     def SaveBlacklists(self, blacklist):
         """
         This method stores the blacklist in the related CSV files.
-        The data structure of the dictionary is expected to be the same, :class:`mdbapi.randy.Randy` uses.
+        The dictionary is expected to have the same keys :class:`mdbapi.randy.Randy` uses.
+        The values can be lists or any other iterable of IDs.
+
+        This method gets called by :func:`mdbapi.randy.SaveBlacklists` in background.
 
         Args:
             blacklist (dict): A dictionary of blacklists.
@@ -139,12 +139,22 @@ class MusicDBConfig(Config):
 
         # [database]
         self.database = DATABASE()
-        self.database.host          = self.GetFile( "database", "dbhost",         "localhost")
-        self.database.port          = self.GetFile( "database", "dbport",         3307)
-        self.database.name          = self.GetFile( "database", "dbname",         "musicdb")
-        self.database.user          = self.GetFile( "database", "dbuser",         "root")
-        self.database.password      = self.GetFile( "database", "dbpass",         "")
-        self.database.charset       = self.GetFile( "database", "charset",        "utf8")
+        self.database.host          = self.Get(str, "database", "dbhost",         "localhost")
+        self.database.port          = self.Get(int, "database", "dbport",         3307)
+        self.database.name          = self.Get(str, "database", "dbname",         "musicdb")
+        self.database.user          = self.Get(str, "database", "dbuser",         "root")
+        self.database.password      = self.Get(str, "database", "dbpass",         "")
+        self.database.charset       = self.Get(str, "database", "charset",        "utf8")
+        self.database.poolminsize   = self.Get(int, "database", "poolminsize",    1)
+        self.database.poolmaxsize   = self.Get(int, "database", "poolmaxsize",    8)
+        self.database.pooltimeout   = self.Get(int, "database", "pooltimeout",    10)
+        self.database.poolpingperiod= self.Get(int, "database", "poolpingperiod", 60)
+        if self.database.poolmaxsize < 1 or self.database.poolminsize > self.database.poolmaxsize:
+            logging.error("Invalid connection pool size in [database]: poolminsize must not exceed poolmaxsize, and poolmaxsize must be at least 1")
+        self.database.entitycache    = self.Get(bool,"database", "entitycache",    True)
+        self.database.entitycachesize= self.Get(int, "database", "entitycachesize",10000)
+        if self.database.entitycachesize < 1:
+            logging.error("Invalid entity cache size in [database]: entitycachesize must be at least 1")
 
 
         # [music]
@@ -152,6 +162,7 @@ class MusicDBConfig(Config):
         self.music.path             = self.GetDirectory("music",    "path",     "/var/music")
         self.music.owner            = self.Get(str, "music",    "owner",        "user")
         self.music.group            = self.Get(str, "music",    "group",        "musicdb")
+        self.music.cache            = self.GetDirectory("music",    "cache",    "/opt/musicdb/data/mp3cache", logging.warning) # the cache is optional
         try:
             pwd.getpwnam(self.music.owner)
         except KeyError:
@@ -195,21 +206,25 @@ class MusicDBConfig(Config):
 
         # [tracker]
         self.tracker = TRACKER()
-        self.tracker.host = self.GetFile("tracker", "dbhost", "localhost")
-        self.tracker.port = self.GetFile("tracker", "dbport", 3307)
-        self.tracker.name = self.GetFile("tracker", "dbname", "tracker")
-        self.tracker.user = self.GetFile("tracker", "dbuser", "root")
-        self.tracker.password = self.GetFile("tracker", "dbpass", "")
-        self.tracker.charset = self.GetFile("tracker", "charset", "utf8")
+        self.tracker.host = self.Get(str, "tracker", "dbhost", "localhost")
+        self.tracker.port = self.Get(int, "tracker", "dbport", 3307)
+        self.tracker.name = self.Get(str, "tracker", "dbname", "tracker")
+        self.tracker.user = self.Get(str, "tracker", "dbuser", "root")
+        self.tracker.password = self.Get(str, "tracker", "dbpass", "")
+        self.tracker.charset = self.Get(str, "tracker", "charset", "utf8")
+        self.tracker.buffered      = self.Get(bool, "tracker", "buffered",      False)
+        self.tracker.flushinterval = self.Get(int,  "tracker", "flushinterval", 60)
+        if self.tracker.flushinterval < 1:
+            logging.error("Invalid [tracker]->flushinterval. The interval must be at least 1 second")
 
         # [lycra]
         self.lycra = LYCRA()
-        self.lycra.host = self.GetFile("lycra", "dbhost", "localhost")
-        self.lycra.port = self.GetFile("lycra", "dbport", 3307)
-        self.lycra.name = self.GetFile("lycra", "dbname", "lycra")
-        self.lycra.user = self.GetFile("lycra", "dbuser", "root")
-        self.lycra.password = self.GetFile("lycra", "dbpass", "")
-        self.lycra.charset = self.GetFile("lycra", "charset", "utf8")
+        self.lycra.host = self.Get(str, "lycra", "dbhost", "localhost")
+        self.lycra.port = self.Get(int, "lycra", "dbport", 3307)
+        self.lycra.name = self.Get(str, "lycra", "dbname", "lycra")
+        self.lycra.user = self.Get(str, "lycra", "dbuser", "root")
+        self.lycra.password = self.Get(str, "lycra", "dbpass", "")
+        self.lycra.charset = self.Get(str, "lycra", "charset", "utf8")
 
 
         # [Icecast]
@@ -242,6 +257,21 @@ class MusicDBConfig(Config):
         self.randy.songbllen        = self.Get(int,  "Randy",   "songbllen",    50)
         self.randy.albumbllen       = self.Get(int,  "Randy",   "albumbllen",   20)
         self.randy.artistbllen      = self.Get(int,  "Randy",   "artistbllen",  10)
+        self.randy.mode             = self.Get(str,  "Randy",   "mode",         "random")
+        if not self.randy.mode in ["random", "relations", "weighted"]:
+            logging.error("Invalid [Randy]->mode. Mode must be one of the following: random, relations, weighted \033[1;30m(Falling back to random)")
+            self.randy.mode = "random"
+        self.randy.neighbours       = self.Get(int,  "Randy",   "neighbours",   20)
+        self.randy.neighbourrefresh = self.Get(int,  "Randy",   "neighbourrefresh", 600)
+        self.randy.favoriteweight   = self.Get(float,"Randy",   "favoriteweight",   2.0)
+        if self.randy.favoriteweight <= 0:
+            logging.error("Invalid [Randy]->favoriteweight. The weight must be greater than 0 \033[1;30m(Falling back to 2.0)")
+            self.randy.favoriteweight = 2.0
+        self.randy.recencyhalflife  = self.Get(int,  "Randy",   "recencyhalflife",  30)
+        self.randy.prefetch         = self.Get(int,  "Randy",   "prefetch",     3)
+        if self.randy.prefetch < 0:
+            logging.error("Invalid [Randy]->prefetch. The number of prefetched songs must not be negative \033[1;30m(Disabling prefetching)")
+            self.randy.prefetch = 0
 
 
         # [log]
@@ -0,0 +1,253 @@
+# MusicDB,  a music manager with web-bases UI that focus on music.
+# Copyright (C) 2017  Ralf Stemmer <ralf.stemmer@gmx.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+This module implements a thread safe cache with *least recently used* eviction.
+It is used by :class:`lib.db.musicdb.MusicDatabase` to cache song, album and artist entries,
+so that reading the same entries over and over again does not need a database round trip each time.
+
+The cache stores copies of the entries and returns copies as well.
+So the caller can modify a returned entry without changing the cache.
+
+The cache can be configured in the ``[database]`` section of the MusicDB Configuration:
+
+    .. code-block:: ini
+
+        [database]
+        entitycache=True
+        entitycachesize=10000
+
+Example:
+
+    .. code-block:: python
+
+        cache = LRUCache(1000)
+
+        song = cache.Get(songid)
+        if song == None:
+            song = ReadSongFromDatabase(songid)
+            cache.Put(songid, song)
+
+        cache.Invalidate(songid)    # after the song changed
+
+        print(cache.GetStatistics()["hitrate"])
+
+Data derived from cached entries can be updated selectively
+by asking the cache which keys were invalidated since a known generation:
+
+    .. code-block:: python
+
+        generation = cache.GetGeneration()
+        view = CreateView(songids)
+
+        # …
+
+        generation, keys = cache.GetInvalidatedKeys(generation)
+        if keys == None:
+            view = CreateView(songids)  # too many changes, recreate everything
+        else:
+            view.Update(keys)           # only recreate the changed parts
+"""
+
+import threading
+from collections import OrderedDict, deque
+
+INVALIDATIONLOG_MAXLEN = 1000   # Number of invalidations GetInvalidatedKeys can look back
+
+
+class LRUCache(object):
+    """
+    A bounded cache for dictionaries or row objects (:mod:`lib.db.records`).
+    The entries must provide a ``copy`` method.
+    When the cache is full, the least recently used entry gets removed.
+
+    Args:
+        maxsize (int): Maximum number of entries
+
+    Raises:
+        ValueError: When *maxsize* is less than 1
+    """
+
+    def __init__(self, maxsize):
+        if type(maxsize) != int or maxsize < 1:
+            raise ValueError("maxsize must be an integer greater than 0")
+
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock    = threading.Lock()
+
+        self.generation    = 0      # gets incremented by each invalidation
+        self.invalidationlog = deque(maxlen=INVALIDATIONLOG_MAXLEN) # invalidated keys, None for Clear
+
+        self.hits          = 0
+        self.misses        = 0
+        self.evictions     = 0
+        self.invalidations = 0
+
+
+
+    def Get(self, key):
+        """
+        Returns a copy of the cached entry.
+
+        Args:
+            key: Key of the entry
+
+        Returns:
+            A copy of the entry or ``None`` if the key is not cached
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry == None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry.copy()
+
+
+    def GetGeneration(self):
+        """
+        Returns the current generation of the cache.
+        The generation changes with each call of :meth:`~Invalidate` or :meth:`~Clear`.
+
+        Read the generation before reading an entry from the database and pass it to :meth:`~Put`.
+        Then the entry does not get cached when it was invalidated in the meantime.
+
+        Returns:
+            An integer
+        """
+        with self.lock:
+            return self.generation
+
+
+    def GetInvalidatedKeys(self, generation):
+        """
+        Returns the keys that were invalidated since *generation* (see :meth:`~GetGeneration`).
+        This allows data derived from cached entries to recreate only the parts that depend on invalidated entries.
+
+        Keys get reported even if they were not cached when they got invalidated.
+        When the cache was cleared since *generation* (see :meth:`~Clear`),
+        or when there were too many invalidations to look back that far,
+        ``None`` is returned instead of the keys and all derived data must be considered as outdated.
+
+        Args:
+            generation (int): Generation the derived data was created with, or ``None``
+
+        Returns:
+            A tuple of the current generation and a set of the invalidated keys (or ``None``)
+        """
+        with self.lock:
+            if generation == None or generation > self.generation:
+                return (self.generation, None)
+
+            count = self.generation - generation
+            if count > len(self.invalidationlog):
+                return (self.generation, None)
+
+            keys = set()
+            for index in range(len(self.invalidationlog) - count, len(self.invalidationlog)):
+                key = self.invalidationlog[index]
+                if key == None:
+                    return (self.generation, None)
+                keys.add(key)
+            return (self.generation, keys)
+
+
+    def Put(self, key, entry, generation=None):
+        """
+        Stores a copy of *entry*.
+        If the cache is full, the least recently used entry gets removed.
+
+        If *generation* is given and does not match the current generation (see :meth:`~GetGeneration`),
+        the entry may be outdated and does not get stored.
+
+        Args:
+            key: Key of the entry
+            entry: The entry to cache (``dict`` or row object)
+            generation (int): Optional generation of the cache from before the entry was read
+
+        Returns:
+            *Nothing*
+        """
+        with self.lock:
+            if generation != None and generation != self.generation:
+                return
+
+            self.entries[key] = entry.copy()
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+
+    def Invalidate(self, key):
+        """
+        Removes an entry from the cache.
+        It is no error if the entry is not cached.
+
+        Args:
+            key: Key of the entry
+
+        Returns:
+            *Nothing*
+        """
+        with self.lock:
+            self.generation += 1
+            self.invalidationlog.append(key)
+            if self.entries.pop(key, None) != None:
+                self.invalidations += 1
+
+
+    def Clear(self):
+        """
+        Removes all entries from the cache.
+
+        Returns:
+            *Nothing*
+        """
+        with self.lock:
+            self.generation    += 1
+            self.invalidationlog.append(None)
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+
+
+    def GetStatistics(self):
+        """
+        Returns a dictionary with the keys ``size``, ``maxsize``, ``hits``, ``misses``, ``hitrate``, ``evictions`` and ``invalidations``.
+
+        Returns:
+            A dictionary with the cache statistics
+        """
+        with self.lock:
+            stats = {}
+            stats["size"]          = len(self.entries)
+            stats["maxsize"]       = self.maxsize
+            stats["hits"]          = self.hits
+            stats["misses"]        = self.misses
+            stats["evictions"]     = self.evictions
+            stats["invalidations"] = self.invalidations
+            lookups = self.hits + self.misses
+            if lookups > 0:
+                stats["hitrate"] = self.hits / lookups
+            else:
+                stats["hitrate"] = 0.0
+        return stats
+
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
@@ -17,7 +17,136 @@
 import sqlite3
 import logging
 import gzip
+import threading
 import pymysql.cursors
+from collections.abc import Mapping
+from contextlib  import contextmanager
+from lib.db.pool import ConnectionPool
+
+# All Database objects connecting to the same database share one pool
+ConnectionPools     = {}
+ConnectionPoolsLock = threading.Lock()
+
+
+class ReadWriteLock(object):
+    """
+    A lock that allows multiple threads to read at the same time while writing is exclusive.
+
+    This lock is used by the database classes instead of a plain ``threading.RLock``.
+    Methods that only read from the database acquire the lock via :meth:`~Read`,
+    methods that write acquire it via :meth:`~Write`.
+    So a slow read does not block other reads, but a multi-statement write is never
+    observed half done by other threads.
+
+    The lock is reentrant for both modes.
+    A thread holding the write lock can also acquire the read lock.
+    Upgrading a read lock to a write lock is not possible and raises a ``RuntimeError``,
+    because two threads trying this at the same time would deadlock.
+
+    Writers are preferred: When a writer is waiting, new readers have to wait until the writer is done.
+    Threads already holding a read lock can still acquire it again.
+
+    Example:
+
+        .. code-block:: python
+
+            lock = ReadWriteLock()
+
+            with lock.Read():
+                song = db.GetFromDatabase("SELECT * FROM songs WHERE songid = ?", songid)
+
+            with lock.Write():
+                db.Execute("DELETE FROM songs WHERE songid = ?", songid)
+                db.Execute("DELETE FROM lyrics WHERE songid = ?", songid)
+    """
+
+    def __init__(self):
+        self.condition      = threading.Condition(threading.Lock())
+        self.readers        = {}    # thread ID -> recursion depth
+        self.writer         = None  # thread ID of the writer
+        self.writerdepth    = 0
+        self.waitingwriters = 0
+
+
+    def AcquireRead(self):
+        me = threading.get_ident()
+        with self.condition:
+            # Reentrant: Never wait when this thread already holds the lock
+            if self.writer == me or me in self.readers:
+                self.readers[me] = self.readers.get(me, 0) + 1
+                return
+
+            while self.writer != None or self.waitingwriters > 0:
+                self.condition.wait()
+            self.readers[me] = 1
+
+
+    def ReleaseRead(self):
+        me = threading.get_ident()
+        with self.condition:
+            depth = self.readers[me] - 1
+            if depth > 0:
+                self.readers[me] = depth
+                return
+
+            del self.readers[me]
+            if not self.readers:
+                self.condition.notify_all()
+
+
+    def AcquireWrite(self):
+        me = threading.get_ident()
+        with self.condition:
+            if self.writer == me:
+                self.writerdepth += 1
+                return
+
+            if me in self.readers:
+                raise RuntimeError("Upgrading a read lock to a write lock is not supported!")
+
+            self.waitingwriters += 1
+            try:
+                while self.writer != None or self.readers:
+                    self.condition.wait()
+            finally:
+                self.waitingwriters -= 1
+
+            self.writer      = me
+            self.writerdepth = 1
+
+
+    def ReleaseWrite(self):
+        with self.condition:
+            self.writerdepth -= 1
+            if self.writerdepth == 0:
+                self.writer = None
+                self.condition.notify_all()
+
+
+    @contextmanager
+    def Read(self):
+        """
+        Context manager for shared read access
+        """
+        self.AcquireRead()
+        try:
+            yield
+        finally:
+            self.ReleaseRead()
+
+
+    @contextmanager
+    def Write(self):
+        """
+        Context manager for exclusive write access.
+        Use it as explicit scope around multi-statement writes that must not be interrupted by other threads.
+        """
+        self.AcquireWrite()
+        try:
+            yield
+        finally:
+            self.ReleaseWrite()
+
 
 
 class Database(object):
@@ -25,6 +154,19 @@ class Database(object):
     This is the base class for all database classes in MusicDB.
     It establishes the connection to the mariadb databases.
 
+    The connections are managed by a :class:`lib.db.pool.ConnectionPool`.
+    All instances that connect to the same database with the same user share one pool.
+    Each call of :meth:`~Execute` or :meth:`~GetFromDatabase` borrows a connection from that pool,
+    so that threads do no longer have to wait for each other.
+
+    By default, each call of :meth:`~Execute` gets committed immediately.
+    Multiple statements can be grouped into one transaction via :meth:`~Transaction`.
+    Then the commit is deferred to the end of the transaction.
+
+    The pool settings are read from *poolconfig*.
+    This is expected to be the ``[database]`` section of the MusicDB Configuration (``MusicDBConfig(...).database``).
+    If it is ``None``, the default settings get used.
+
     Args:
         host (str): host url of database.
         port (int): database port.
@@ -32,12 +174,20 @@ class Database(object):
         user (str): database user id.
         password (str): database user password.
         charset (str): database character set.
+        poolconfig: Optional object with the attributes *poolminsize*, *poolmaxsize*, *pooltimeout* and *poolpingperiod*
+
+    Rows get returned as dictionaries with the column names as keys.
+    Derived classes can set ``CURSORCLASS`` and ``SSCURSORCLASS`` (used by :meth:`~IterateFromDatabase`)
+    to other pymysql cursor classes, for example to get the rows as tuples.
+    The cursor class is chosen per cursor, so instances with different cursor classes can share one pool.
 
     Raises:
         TypeError: When *path* is not a string
     """
+    CURSORCLASS   = pymysql.cursors.DictCursor
+    SSCURSORCLASS = pymysql.cursors.SSDictCursor
 
-    def __init__(self, host, port, name, user, password, charset):
+    def __init__(self, host, port, name, user, password, charset, poolconfig=None):
         # check params
         if type(host) != str:
             raise TypeError("A valid database host is necessary")
@@ -60,11 +210,114 @@ class Database(object):
         # connect to database
         cursorclass = pymysql.cursors.DictCursor
 
-        self.db_connection = pymysql.connect(host=host, user=user, password=password, db=name, port=port, charset=charset, cursorclass=cursorclass)
-        self.db_cursor     = self.db_connection.cursor()
+        def Connector():
+            return pymysql.connect(host=host, user=user, password=password, db=name, port=port, charset=charset, cursorclass=cursorclass)
+
+        if poolconfig:
+            minsize    = poolconfig.poolminsize
+            maxsize    = poolconfig.poolmaxsize
+            timeout    = poolconfig.pooltimeout
+            pingperiod = poolconfig.poolpingperiod
+        else:
+            minsize    = 1
+            maxsize    = 8
+            timeout    = 10
+            pingperiod = 60
+
+        global ConnectionPools
+        global ConnectionPoolsLock
+
+        poolkey = (host, port, name, user)
+        with ConnectionPoolsLock:
+            if poolkey not in ConnectionPools:
+                logging.debug("Creating connection pool for database %s at %s:%i (%i to %i connections)", name, host, port, minsize, maxsize)
+                ConnectionPools[poolkey] = ConnectionPool(Connector, minsize, maxsize, timeout, pingperiod)
+            self.pool = ConnectionPools[poolkey]
+
+        # State of the transaction of the current thread (see Transaction)
+        self.transaction = threading.local()
+
+
+    @contextmanager
+    def Transaction(self):
+        """
+        Context manager that groups all database accesses of the current thread into one transaction.
+
+        Inside the block, :meth:`~Execute`, :meth:`~ExecuteMany`, :meth:`~GetFromDatabase` and :meth:`~Cursor`
+        use the same connection and do not commit.
+        The commit gets done once when the block ends.
+        When the block raises an exception, all changes of the transaction get rolled back and the exception gets passed.
+
+        Transactions can be nested.
+        Only the outermost block commits or rolls back.
+        So methods that use a transaction can be called inside other transactions.
+
+        Only the calling thread is part of the transaction.
+        Other threads still use their own connections.
+
+        Example:
+
+            .. code-block:: python
+
+                with db.Transaction():
+                    db.Execute("DELETE FROM songtags WHERE songid = ?", songid)
+                    db.Execute("DELETE FROM lyrics WHERE songid = ?", songid)
+                    db.Execute("DELETE FROM songs WHERE songid = ?", songid)
+                # all three statements are committed here
+        """
+        if getattr(self.transaction, "connection", None) != None:
+            # Nested transaction: the outermost block commits
+            self.transaction.depth += 1
+            try:
+                yield
+            finally:
+                self.transaction.depth -= 1
+            return
+
+        with self.pool.Connection() as connection:
+            self.transaction.connection = connection
+            self.transaction.depth      = 1
+            try:
+                yield
+            except BaseException as e:
+                connection.rollback()
+                raise e
+            else:
+                connection.commit()
+            finally:
+                self.transaction.connection = None
+                self.transaction.depth      = 0
+
+
+    def InTransaction(self):
+        """
+        Returns:
+            ``True`` if the current thread is inside a :meth:`~Transaction` block of this database
+        """
+        return getattr(self.transaction, "connection", None) != None
+
+
+    @contextmanager
+    def __Connection(self):
+        # Yields the connection of the current transaction, or a connection from the pool.
+        # The second value tells if the caller has to commit or roll back.
+        connection = getattr(self.transaction, "connection", None)
+        if connection != None:
+            yield connection, False
+        else:
+            with self.pool.Connection() as connection:
+                yield connection, True
+
+
+    def GetPoolStatistics(self):
+        """
+        This method returns the statistics of the connection pool this database uses.
+        See :meth:`lib.db.pool.ConnectionPool.GetStatistics` for details.
 
-    def __del__(self):
-        self.db_connection.close()
+        Returns:
+            A dictionary with wait-time and utilization counters
+        """
+        return self.pool.GetStatistics()
 
     def Compress(self, string):
         """
@@ -102,8 +355,9 @@ class Database(object):
         This method executes a SQL command.
         When the command fails, the database gets rolled back.
         Otherwise the changes gets committed.
+        Inside a :meth:`~Transaction` block, committing and rolling back is deferred to the end of the block.
 
-        *values* can be a single value, a list, a dictionary or a tuple.
+        *values* can be a single value, a list, a dictionary (or any other mapping) or a tuple.
 
         Args:
             sql (str): SQL command
@@ -141,23 +395,178 @@ class Database(object):
             raise TypeError("Invalid sql-type. String expected!")
 
         if values:
-            if type(values) != tuple and type(values) != list and type(values) != dict:
+            if isinstance(values, Mapping) and type(values) != dict:
+                values = dict(values)   # row objects like lib.db.records.Song
+            elif type(values) != tuple and type(values) != list and type(values) != dict:
                 values = [values]   # create a one element list because mariadb:execute expects one
 
-        try:
-            if values:
-                self.db_cursor.execute(sql, values)
-            else:
-                self.db_cursor.execute(sql)
+        with self.__Connection() as (connection, autocommit):
+            cursor = connection.cursor(self.CURSORCLASS)
+            try:
+                if values:
+                    cursor.execute(sql, values)
+                else:
+                    cursor.execute(sql)
+
+            except Exception as e:
+                if autocommit:
+                    connection.rollback()
+                raise e
+            finally:
+                cursor.close()
+
+            if autocommit:
+                connection.commit()
+        return None
+
+
+    def ExecuteMany(self, sql, valueslist):
+        """
+        This method executes a SQL command once for each set of values in *valueslist*.
+        All executions are done inside a single transaction that gets committed once at the end.
+        When one of the executions fails, the whole transaction gets rolled back.
+
+        Args:
+            sql (str): SQL command
+            valueslist: A list of tuples, lists or dictionaries with the arguments for each execution
+
+        Returns:
+            ``None``
 
-        except Exception as e:
-            self.db_connection.rollback()
-            raise e
+        Raises:
+            TypeError: When *sql* is not a string
+
+        Example:
 
-        self.db_connection.commit()
+            .. code-block:: python
+
+                sql    = "INSERT INTO valuetable (name, content) VALUES (?, ?)"
+                values = [("Name1", 1000), ("Name2", 2000)]
+
+                db.ExecuteMany(sql, values)
+        """
+        if type(sql) != str:
+            raise TypeError("Invalid sql-type. String expected!")
+
+        valueslist = list(valueslist)
+        if not valueslist:
+            return None
+
+        with self.Cursor() as cursor:
+            cursor.executemany(sql, valueslist)
         return None
 
 
+    @contextmanager
+    def Cursor(self):
+        """
+        Context manager that provides a cursor of a connection borrowed from the connection pool.
+        All commands executed with this cursor belong to one transaction.
+        When the block ends, the transaction gets committed.
+        If the block raises an exception, the whole transaction gets rolled back.
+        Inside a :meth:`~Transaction` block, the cursor belongs to that transaction and committing is up to it.
+
+        This is the way to execute multiple dependent statements atomically,
+        for example inserting a row and using ``cursor.lastrowid`` for the next statement.
+
+        Example:
+
+            .. code-block:: python
+
+                with db.Cursor() as cursor:
+                    cursor.execute("INSERT INTO albums (name) VALUES (?)", ("Album",))
+                    albumid = cursor.lastrowid
+                    cursor.executemany("INSERT INTO songs (albumid, name) VALUES (?, ?)",
+                            [(albumid, "Song 1"), (albumid, "Song 2")])
+        """
+        with self.__Connection() as (connection, autocommit):
+            cursor = connection.cursor(self.CURSORCLASS)
+            try:
+                yield cursor
+            except Exception as e:
+                if autocommit:
+                    connection.rollback()
+                raise e
+            else:
+                if autocommit:
+                    connection.commit()
+            finally:
+                cursor.close()
+
+
+
+    def IterateFromDatabase(self, sql, values=None, batchsize=1000):
+        """
+        This method works like :meth:`~GetFromDatabase` but returns a generator instead of a list.
+        The rows get read from the server with an unbuffered cursor in batches of *batchsize* rows.
+        So only one batch is held in memory at a time, independent of the size of the result.
+
+        While iterating, the generator holds a connection of the pool.
+        It gets given back when the iteration ends or the generator gets closed.
+        Inside a :meth:`~Transaction` block, the connection of the transaction cannot be blocked by an unbuffered cursor.
+        Then the result gets fetched at once like :meth:`~GetFromDatabase` does.
+
+        Args:
+            sql (str): SQL command
+            values: Optional arguments used in the command
+            batchsize (int): Number of rows that get fetched from the server at once
+
+        Returns:
+            A generator that yields the rows of the result
+
+        Raises:
+            TypeError: When *sql* is not a string
+            ValueError: When *batchsize* is not a positive integer
+
+        Example:
+
+            .. code-block:: python
+
+                for entry in db.IterateFromDatabase("SELECT path FROM songs"):
+                    print(entry["path"])
+        """
+        if type(sql) != str:
+            raise TypeError("Invalid sql-type. String expected!")
+        if type(batchsize) != int or batchsize < 1:
+            raise ValueError("batchsize must be a positive integer")
+
+        if values:
+            if type(values) != tuple and type(values) != list:
+                values = [values]
+
+        if self.InTransaction():
+            for entry in self.GetFromDatabase(sql, values):
+                yield entry
+            return
+
+        with self.pool.Connection() as connection:
+            cursor = connection.cursor(self.SSCURSORCLASS)
+            try:
+                if values:
+                    cursor.execute(sql, values)
+                else:
+                    cursor.execute(sql)
+
+                while True:
+                    batch = cursor.fetchmany(batchsize)
+                    if not batch:
+                        break
+                    for entry in batch:
+                        yield entry
+
+            except BaseException as e:
+                # Also reached when the generator gets closed before all rows were read.
+                # Closing the cursor reads the remaining rows, so that the connection can be reused.
+                cursor.close()
+                connection.rollback()
+                raise e
+            else:
+                cursor.close()
+                # End the implicit transaction, see GetFromDatabase
+                connection.commit()
+
+
+
     # get some data from the database
     def GetFromDatabase(self, sql, values=None):
         """
@@ -206,17 +615,27 @@ class Database(object):
             if type(values) != tuple and type(values) != list:
                 values = [values]   # create a one element list because splite3:execute expects one
 
-        try:
-            if values:
-                self.db_cursor.execute(sql, values)
-            else:
-                self.db_cursor.execute(sql)
-
-            data = self.db_cursor.fetchall()
-
-        except Exception as e:
-            self.db_connection.rollback()
-            raise e
+        with self.__Connection() as (connection, autocommit):
+            cursor = connection.cursor(self.CURSORCLASS)
+            try:
+                if values:
+                    cursor.execute(sql, values)
+                else:
+                    cursor.execute(sql)
+
+                data = cursor.fetchall()
+
+                # End the implicit transaction, otherwise the pooled connection
+                # keeps its snapshot and would return outdated data next time.
+                if autocommit:
+                    connection.commit()
+
+            except Exception as e:
+                if autocommit:
+                    connection.rollback()
+                raise e
+            finally:
+                cursor.close()
 
         return data
 
@@ -56,16 +56,19 @@ class LycraDatabase(Database):
         ValueError: When the version of the database does not match the expected version. (Updating MusicDB may failed)
     """
 
-    def __init__(self, host, port, name, user, password, charset):
-        Database.__init__(self, host, port, name, user, password, charset)
+    def __init__(self, host, port, name, user, password, charset, poolconfig=None):
+        Database.__init__(self, host, port, name, user, password, charset, poolconfig)
         try:
-            result = self.GetFromDatabase("SELECT value FROM meta WHERE key = 'version'")
-            version = int(result[0][0])
+            result = self.GetFromDatabase("SELECT value FROM meta WHERE `key` = 'version'")
+            version = int(result[0]["value"])
         except Exception as e:
             raise ValueError("Unable to read version number from Lycra Database")
 
-        if version != 2:
-            raise ValueError("Unexpected version number of Lycra Database. Got %i, expected %i", version, 2)
+        # Version 3 only adds indices, so version 2 databases are still usable
+        if version == 2:
+            logging.warning("Lycra Database is outdated and has no indices. \033[1;30m(Run musicdb upgrade to speed up the database)")
+        elif version != 3:
+            raise ValueError("Unexpected version number of Lycra Database. Got %i, expected %i", version, 3)
 
 
 
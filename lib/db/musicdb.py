@@ -27,6 +27,8 @@ This database handles the following components:
 
 All database entries (= rows) are handled as dictionaries.
 The key of the dictionary corresponds to the column name of the database.
+Songs, albums, artists and tags are returned as compact row objects (:mod:`lib.db.records`) that behave like dictionaries.
+Use :meth:`lib.db.records.Record.ToDict` when a real ``dict`` is necessary.
 
 If an entry of this dictionary got changed directly, the following methods can be used to store the changes in the database.
 This is not the recommended way because the content gets not checked.
@@ -114,14 +116,20 @@ The following methods exist to handle song entries in the database:
     * :meth:`~lib.db.musicdb.MusicDatabase.AddSong`
     * :meth:`~lib.db.musicdb.MusicDatabase.AddFullSong`
     * :meth:`~lib.db.musicdb.MusicDatabase.GetSongById`
+    * :meth:`~lib.db.musicdb.MusicDatabase.GetSongsWithParents`
     * :meth:`~lib.db.musicdb.MusicDatabase.GetSongByPath`
     * :meth:`~lib.db.musicdb.MusicDatabase.GetSongsByArtistId`
     * :meth:`~lib.db.musicdb.MusicDatabase.GetSongsByAlbumId`
     * :meth:`~lib.db.musicdb.MusicDatabase.GetAllSongs`
+    * :meth:`~lib.db.musicdb.MusicDatabase.IterateSongs`
     * :meth:`~lib.db.musicdb.MusicDatabase.GetSongs`
     * :meth:`~lib.db.musicdb.MusicDatabase.GetRandomSong`
+    * :meth:`~lib.db.musicdb.MusicDatabase.InvalidateRandomCandidates`
     * :meth:`~lib.db.musicdb.MusicDatabase.GetSongIdsByAlbumIds`
     * :meth:`~lib.db.musicdb.MusicDatabase.UpdateSongStatistic`
+    * :meth:`~lib.db.musicdb.MusicDatabase.UpdateLastPlayed`
+    * :meth:`~lib.db.musicdb.MusicDatabase.GetSongStatistics`
+    * :meth:`~lib.db.musicdb.MusicDatabase.GetSongStatisticChanges`
     * :meth:`~lib.db.musicdb.MusicDatabase.RemoveSong`
 
 
@@ -147,6 +155,7 @@ Album Related Methods
     * :meth:`~lib.db.musicdb.MusicDatabase.GetAlbumByPath`
     * :meth:`~lib.db.musicdb.MusicDatabase.GetAlbumById`
     * :meth:`~lib.db.musicdb.MusicDatabase.GetAllAlbums`
+    * :meth:`~lib.db.musicdb.MusicDatabase.IterateAlbums`
     * :meth:`~lib.db.musicdb.MusicDatabase.GetAlbumsByArtistId`
     * :meth:`~lib.db.musicdb.MusicDatabase.GetAlbums`
     * :meth:`~lib.db.musicdb.MusicDatabase.GetAllAlbumIds`
@@ -180,6 +189,7 @@ Database structure:
 
     * :meth:`~lib.db.musicdb.MusicDatabase.AddArtist`
     * :meth:`~lib.db.musicdb.MusicDatabase.GetAllArtists`
+    * :meth:`~lib.db.musicdb.MusicDatabase.IterateArtists`
     * :meth:`~lib.db.musicdb.MusicDatabase.GetArtistByPath`
     * :meth:`~lib.db.musicdb.MusicDatabase.GetArtistById`
     * :meth:`~lib.db.musicdb.MusicDatabase.RemoveArtist`
@@ -347,6 +357,7 @@ Database API
     * :meth:`~lib.db.musicdb.MusicDatabase.SetTargetTag`
     * :meth:`~lib.db.musicdb.MusicDatabase.RemoveTargetTag`
     * :meth:`~lib.db.musicdb.MusicDatabase.GetTargetTags`
+    * :meth:`~lib.db.musicdb.MusicDatabase.GetTargetTagsForMany`
     * :meth:`~lib.db.musicdb.MusicDatabase.SplitTagsByClass`
 
 The following tag classes exist:
@@ -361,7 +372,11 @@ A target can be "song" or "album".
 import random
 import logging
 import threading
-from lib.db.database import Database
+import pymysql.cursors
+from collections     import deque
+from lib.db.database import Database, ReadWriteLock
+from lib.db.cache    import LRUCache
+from lib.db.records  import Artist, Album, Song, Tag
 
 SONG_LYRICSSTATE_EMPTY    = 0
 SONG_LYRICSSTATE_FROMFILE = 1
@@ -369,7 +384,22 @@ SONG_LYRICSSTATE_FROMNET  = 2
 SONG_LYRICSSTATE_FROMUSER = 3
 SONG_LYRICSSTATE_NONE     = 4 # for instrumental songs
 
-MusicDatabaseLock = threading.RLock() # RLock is mandatory for nested calles!
+MusicDatabaseLock = ReadWriteLock() # Reentrant, readers share the lock, writers are exclusive
+
+# Entity caches for songs, albums and artists, shared by all instances that access the same database
+EntityCaches     = {}
+EntityCachesLock = threading.Lock()
+
+# Candidate song IDs for GetRandomSong, shared by all instances that access the same database
+RandomCandidates     = {}
+RandomCandidatesLock = threading.Lock()
+RandomCandidatesGenerations = {}    # Incremented with each invalidation of the candidates
+RANDOMCANDIDATES_MAXSETS = 32   # Maximum number of cached constraint combinations per database
+
+# IDs of songs whose statistics changed, shared by all instances that access the same database
+StatisticChanges     = {}   # {"sequence": number of changes, "songids": deque of (sequence, songid)}
+StatisticChangesLock = threading.Lock()
+STATISTICCHANGES_MAXLEN = 10000 # Maximum number of remembered changes per database
 
 class MusicDatabase(Database):
     """
@@ -382,6 +412,10 @@ class MusicDatabase(Database):
     Raises:
         ValueError: When the version of the database does not match the expected version. (Updating MusicDB may failed)
     """
+    # Rows are read as tuples and get translated into the compact row objects of lib.db.records
+    CURSORCLASS   = pymysql.cursors.Cursor
+    SSCURSORCLASS = pymysql.cursors.SSCursor
+
     ARTIST_ID     = 0
     ARTIST_NAME   = 1
     ARTIST_PATH   = 2
@@ -450,77 +484,229 @@ class MusicDatabase(Database):
     SUBGENRE_NAME       = 1
     SUBGENRE_MAINGENRE  = 2
 
-    def __init__(self, host, port, name, user, password, charset):
-        Database.__init__(self, host, port, name, user, password, charset)
+    def __init__(self, host, port, name, user, password, charset, poolconfig=None):
+        Database.__init__(self, host, port, name, user, password, charset, poolconfig)
         try:
-            result = self.GetFromDatabase("SELECT value FROM meta WHERE key = 'version'")
+            result = self.GetFromDatabase("SELECT value FROM meta WHERE `key` = 'version'")
             version = int(result[0][0])
         except Exception as e:
             raise ValueError("Unable to read version number from Music Database")
 
-        if version != 2:
-            raise ValueError("Unexpected version number of Music Database. Got %i, expected %i", version, 2)
+        # Entity cache
+        if poolconfig:
+            cacheenabled = poolconfig.entitycache
+            cachesize    = poolconfig.entitycachesize
+        else:
+            cacheenabled = True
+            cachesize    = 10000
+
+        global EntityCaches
+        global EntityCachesLock
+
+        if cacheenabled:
+            cachekey = (host, port, name)
+            with EntityCachesLock:
+                if cachekey not in EntityCaches:
+                    EntityCaches[cachekey] = {target: LRUCache(cachesize) for target in ["song", "album", "artist"]}
+                self.cache = EntityCaches[cachekey]
+        else:
+            self.cache = None
+
+        # Candidates of GetRandomSong
+        global RandomCandidates
+        global RandomCandidatesLock
+
+        with RandomCandidatesLock:
+            candidateskey = (host, port, name)
+            if candidateskey not in RandomCandidates:
+                RandomCandidates[candidateskey] = {}
+                RandomCandidatesGenerations[candidateskey] = 0
+            self.candidates    = RandomCandidates[candidateskey]
+            self.candidateskey = candidateskey
+
+        with StatisticChangesLock:
+            if candidateskey not in StatisticChanges:
+                StatisticChanges[candidateskey] = {"sequence": 0, "songids": deque(maxlen=STATISTICCHANGES_MAXLEN)}
+            self.statisticchanges = StatisticChanges[candidateskey]
+
+        # Version 3 only adds indices, so version 2 databases are still usable
+        if version == 2:
+            logging.warning("Music Database is outdated and has no indices. \033[1;30m(Run musicdb upgrade to speed up the database)")
+        elif version != 3:
+            raise ValueError("Unexpected version number of Music Database. Got %i, expected %i", version, 3)
         
 
+    def __CacheKey(self, targetid):
+        try:
+            return int(targetid)
+        except (TypeError, ValueError):
+            return None
+
+    def __GetFromCache(self, target, targetid):
+        if not self.cache:
+            return None
+        key = self.__CacheKey(targetid)
+        if key == None:
+            return None
+        return self.cache[target].Get(key)
+
+    def __GetCacheGeneration(self, target):
+        if not self.cache:
+            return None
+        return self.cache[target].GetGeneration()
+
+    def __PutIntoCache(self, target, targetid, entry, generation=None):
+        # Uncommitted data must not get into the cache
+        if not self.cache or self.InTransaction():
+            return
+        key = self.__CacheKey(targetid)
+        if key != None:
+            self.cache[target].Put(key, entry, generation)
+
+
+    def InvalidateCache(self, target=None, targetid=None):
+        """
+        Removes entries from the entity cache of :meth:`~GetSongById`, :meth:`~GetAlbumById` and :meth:`~GetArtistById`.
+        All methods of this class that modify songs, albums or artists do this automatically.
+        This method is only necessary when the database was changed by another process.
+
+        Args:
+            target (str): ``"song"``, ``"album"``, ``"artist"`` or ``None`` to invalidate all caches
+            targetid (int): ID of the entry to invalidate, or ``None`` to invalidate all entries of *target*
+
+        Returns:
+            *Nothing*
+
+        Raises:
+            ValueError: When *target* is invalid
+        """
+        if target == None:
+            self.InvalidateRandomCandidates()
+
+        if not self.cache:
+            return
+
+        if target == None:
+            for cache in self.cache.values():
+                cache.Clear()
+            return
+
+        if target not in self.cache:
+            raise ValueError("target must be \"song\", \"album\", \"artist\" or None!")
+
+        if targetid == None:
+            self.cache[target].Clear()
+            return
+
+        key = self.__CacheKey(targetid)
+        if key != None:
+            self.cache[target].Invalidate(key)
+
+
+    def InvalidateRandomCandidates(self):
+        """
+        Removes all precomputed candidate lists of :meth:`~GetRandomSong`.
+        The lists get rebuilt with the next call of :meth:`~GetRandomSong`.
+        All methods of this class that change songs, album tags or song tags do this automatically.
+        This method is only necessary when the database was changed by another process.
+        Calling :meth:`~InvalidateCache` without arguments invalidates the candidates as well.
+
+        Each call increments the generation returned by :meth:`~GetRandomCandidatesGeneration`.
+
+        Returns:
+            *Nothing*
+        """
+        with RandomCandidatesLock:
+            self.candidates.clear()
+            RandomCandidatesGenerations[self.candidateskey] += 1
+
+
+    def GetRandomCandidatesGeneration(self):
+        """
+        Returns the generation of the candidate lists of :meth:`~GetRandomSong`.
+        The generation changes whenever the candidates get invalidated (see :meth:`~InvalidateRandomCandidates`).
+        So data derived from the candidates is outdated when the generation changed since the data was created.
+
+        Returns:
+            An integer
+        """
+        with RandomCandidatesLock:
+            return RandomCandidatesGenerations[self.candidateskey]
+
+
+    def GetCacheGeneration(self):
+        """
+        Returns the generations of the entity caches (see :meth:`lib.db.cache.LRUCache.GetGeneration`).
+        The generations change whenever a song, album or artist gets invalidated, for example because it was changed.
+        So data derived from songs, albums or artists is outdated when the generations changed since the data was created.
+
+        Returns:
+            A tuple of the generations of the song, album and artist cache, or ``None`` if the cache is disabled
+        """
+        if not self.cache:
+            return None
+        return tuple(self.cache[target].GetGeneration() for target in ["song", "album", "artist"])
+
+
+    def GetInvalidatedEntries(self, generations):
+        """
+        Returns the IDs of the songs, albums and artists that were invalidated since *generations*
+        (see :meth:`lib.db.cache.LRUCache.GetInvalidatedKeys`).
+        So data derived from songs, albums or artists only needs to be recreated for the entries that changed.
+
+        When an entire cache was invalidated since *generations*, or there were too many invalidations to look back that far,
+        ``None`` is returned instead of the IDs and all derived data must be considered as outdated.
+        This is also the case when the cache is disabled.
+
+        Args:
+            generations (tuple): Generations as returned by :meth:`~GetCacheGeneration` or by this method, or ``None``
+
+        Returns:
+            A tuple of the current generations (or ``None`` if the cache is disabled) and a dictionary with the keys ``"song"``, ``"album"`` and ``"artist"`` and sets of invalidated IDs (or ``None``)
+        """
+        if not self.cache:
+            return (None, None)
+
+        if generations == None:
+            generations = (None, None, None)
+
+        current     = []
+        invalidated = {}
+        for target, generation in zip(["song", "album", "artist"], generations):
+            generation, keys = self.cache[target].GetInvalidatedKeys(generation)
+            current.append(generation)
+            invalidated[target] = keys
+
+        if None in invalidated.values():
+            invalidated = None
+        return (tuple(current), invalidated)
+
+
+    def GetCacheStatistics(self):
+        """
+        Returns the statistics of the entity caches.
+        See :meth:`lib.db.cache.LRUCache.GetStatistics` for details.
+
+        Returns:
+            A dictionary with the keys ``"song"``, ``"album"`` and ``"artist"`` and their cache statistics, or ``None`` if the cache is disabled
+        """
+        if not self.cache:
+            return None
+        return {target: cache.GetStatistics() for target, cache in self.cache.items()}
+
+
+
     def __ArtistEntryToDict(self, entry):
-        artist = {}
-        artist["id"]   = entry[self.ARTIST_ID]
-        artist["name"] = entry[self.ARTIST_NAME]
-        artist["path"] = entry[self.ARTIST_PATH]
-        return artist
+        return Artist(*entry[:len(Artist.FIELDS)])
         
     def __AlbumEntryToDict(self, entry):
-        album = {}
-        album["id"]         = entry[self.ALBUM_ID]
-        album["artistid"]   = entry[self.ALBUM_ARTISTID]
-        album["name"]       = entry[self.ALBUM_NAME]
-        album["path"]       = entry[self.ALBUM_PATH]
-        album["numofsongs"] = entry[self.ALBUM_NUMOFSONGS]
-        album["numofcds"]   = entry[self.ALBUM_NUMOFCDS]
-        album["origin"]     = entry[self.ALBUM_ORIGIN]
-        album["release"]    = entry[self.ALBUM_RELEASE]
-        album["artworkpath"]= entry[self.ALBUM_ARTWORKPATH]
-        album["bgcolor"]    = entry[self.ALBUM_BGCOLOR]
-        album["fgcolor"]    = entry[self.ALBUM_FGCOLOR]
-        album["hlcolor"]    = entry[self.ALBUM_HLCOLOR]
-        return album
+        return Album(*entry[:len(Album.FIELDS)])
 
     def __SongEntryToDict(self, entry):
-        song = {}
-        song["id"]          = entry[self.SONG_ID]
-        song["albumid"]     = entry[self.SONG_ALBUMID]
-        song["artistid"]    = entry[self.SONG_ARTISTID]
-        song["name"]        = entry[self.SONG_NAME]
-        song["path"]        = entry[self.SONG_PATH]
-        song["number"]      = entry[self.SONG_NUMBER]
-        song["cd"]          = entry[self.SONG_CD]
-        song["disabled"]    = entry[self.SONG_DISABLED]
-        song["playtime"]    = entry[self.SONG_PLAYTIME]
-        song["bitrate"]     = entry[self.SONG_BITRATE]
-        song["likes"]       = entry[self.SONG_LIKES]
-        song["dislikes"]    = entry[self.SONG_DISLIKES]
-        song["qskips"]      = entry[self.SONG_QSKIPS]
-        song["qadds"]       = entry[self.SONG_QADDS]
-        song["qremoves"]    = entry[self.SONG_QREMOVES]
-        song["favorite"]    = entry[self.SONG_FAVORITE]
-        song["qrndadds"]    = entry[self.SONG_QRNDADDS]
-        song["lyricsstate"] = entry[self.SONG_LYRICSSTATE]
-        song["checksum"]    = entry[self.SONG_CHECKSUM]
-        song["lastplayed"]  = entry[self.SONG_LASTPLAYED]
-        return song
+        return Song(*entry[:len(Song.FIELDS)])
 
     def __TagEntryToDict(self, entry):
-        tag = {}
-        tag["id"]           = entry[self.TAG_ID]
-        tag["name"]         = entry[self.TAG_NAME]
-        tag["class"]        = entry[self.TAG_CLASS]
-        tag["parentid"]     = entry[self.TAG_PARENTID]
-        tag["icontype"]     = entry[self.TAG_ICONTYPE]
-        tag["icon"]         = entry[self.TAG_ICON]
-        tag["color"]        = entry[self.TAG_COLOR]
-        tag["posx"]         = entry[self.TAG_POSX]
-        tag["posy"]         = entry[self.TAG_POSY]
-        return tag
+        return Tag(*entry[:len(Tag.FIELDS)])
 
     def __AlbumTagEntryToDict(self, entry):
         return self.__TagMapToDict(entry, "albumid")
@@ -555,8 +741,9 @@ class MusicDatabase(Database):
         WHERE
             artistid=:id
         """
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Write():
             self.Execute(sql, artist)
+            self.InvalidateCache("artist", artist["id"])
         return None
 
     def WriteAlbum(self, album):
@@ -579,8 +766,9 @@ class MusicDatabase(Database):
         WHERE
             albumid=:id
         """
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Write():
             self.Execute(sql, album)
+            self.InvalidateCache("album", album["id"])
         return None
 
     def WriteSong(self, song):
@@ -617,8 +805,10 @@ class MusicDatabase(Database):
         WHERE
             songid=:id
         """
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Write():
             self.Execute(sql, song)
+            self.InvalidateCache("song", song["id"])
+            self.InvalidateRandomCandidates()
         return None
 
     def WriteTag(self, tag):
@@ -638,7 +828,7 @@ class MusicDatabase(Database):
         WHERE
             tagid=:id
         """
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Write():
             self.Execute(sql, tag)
         return None
 
@@ -670,7 +860,7 @@ class MusicDatabase(Database):
         # create new entry
         values = (name, path)
         sql = "INSERT INTO artists (name, path) VALUES ( ?, ?)"
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Write():
             self.Execute(sql, values)
         return None
 
@@ -684,7 +874,7 @@ class MusicDatabase(Database):
             List of all artists
         """
         sql = "SELECT * FROM artists"
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Read():
             result = self.GetFromDatabase(sql)
 
         artists = []
@@ -696,6 +886,23 @@ class MusicDatabase(Database):
         return artists
 
 
+    def IterateArtists(self):
+        """
+        Like :meth:`~GetAllArtists` but returns a generator that yields one artist after the other.
+        The artists get streamed from the database (see :meth:`lib.db.database.Database.IterateFromDatabase`),
+        so the memory usage does not depend on the number of artists.
+
+        The generator does not hold the database lock while iterating.
+        It yields the artists as they were when the iteration started.
+
+        Returns:
+            A generator of artists
+        """
+        sql = "SELECT * FROM artists"
+        for entry in self.IterateFromDatabase(sql):
+            yield self.__ArtistEntryToDict(entry)
+
+
 
     def GetArtistByPath(self, path):
         """
@@ -717,7 +924,7 @@ class MusicDatabase(Database):
 
         # check if this artist exists
         sql = "SELECT * FROM artists WHERE path = ?"
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Read():
             result = self.GetFromDatabase(sql, path)
 
         # check result
@@ -756,20 +963,25 @@ class MusicDatabase(Database):
         if type(artistid) != int:
             raise TypeError("ArtistID must be of type int or str and is a decimal number!")
 
+        artist = self.__GetFromCache("artist", artistid)
+        if artist:
+            return artist
+
         # check if this artist exists
         sql = "SELECT * FROM artists WHERE artistid = ?"
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Read():
             result = self.GetFromDatabase(sql, artistid)
 
-        # check result
-        if not result:
-            return None
-        
-        if len(result) > 1:
-            raise AssertionError("Multiple Artist entries for one ID in database!")
+            # check result
+            if not result:
+                return None
+            
+            if len(result) > 1:
+                raise AssertionError("Multiple Artist entries for one ID in database!")
 
-        entry = result[0] # remove the list thing, now it's just a tuple
-        retval = self.__ArtistEntryToDict(entry)
+            entry = result[0] # remove the list thing, now it's just a tuple
+            retval = self.__ArtistEntryToDict(entry)
+            self.__PutIntoCache("artist", artistid, retval)
         return retval
 
 
@@ -793,9 +1005,12 @@ class MusicDatabase(Database):
         if type(artistid) != str and type(artistid) != int:
             raise TypeError("artistid must be a decimal number of type integer or string")
 
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Write():
             sql = "DELETE FROM albums WHERE artistid = ?"
             self.Execute(sql, artistid)
+            self.InvalidateCache("artist", artistid)
+            self.InvalidateCache("album")
+            self.InvalidateRandomCandidates()
 
         return None
 
@@ -839,7 +1054,7 @@ class MusicDatabase(Database):
 
         values = (artistid, name, path)
         sql = "INSERT INTO albums (artistid, name, path) VALUES (?, ?, ?)"
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Write():
             self.Execute(sql, values)
         return None
 
@@ -862,7 +1077,7 @@ class MusicDatabase(Database):
             raise TypeError("Path must have a string-value!")
 
         sql = "SELECT * FROM albums WHERE path = ?"
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Read():
             result = self.GetFromDatabase(sql, path)
 
         # check result
@@ -895,19 +1110,24 @@ class MusicDatabase(Database):
         if type(albumid) != str and type(albumid) != int:
             raise TypeError("AlbumID must have a decimal value!")
 
+        album = self.__GetFromCache("album", albumid)
+        if album:
+            return album
+
         sql = "SELECT * FROM albums WHERE albumid = ?"
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Read():
             result = self.GetFromDatabase(sql, albumid)
 
-        # check result
-        if not result:
-            return None
+            # check result
+            if not result:
+                return None
 
-        if len(result) > 1:
-            raise AssertionError("Multiple Album entries for one ID in the database!")
+            if len(result) > 1:
+                raise AssertionError("Multiple Album entries for one ID in the database!")
 
-        entry = result[0]
-        retval = self.__AlbumEntryToDict(entry)
+            entry = result[0]
+            retval = self.__AlbumEntryToDict(entry)
+            self.__PutIntoCache("album", albumid, retval)
         return retval
 
 
@@ -917,6 +1137,22 @@ class MusicDatabase(Database):
         """
         return self.GetAlbums()
 
+    def IterateAlbums(self):
+        """
+        Like :meth:`~GetAllAlbums` but returns a generator that yields one album after the other.
+        The albums get streamed from the database (see :meth:`lib.db.database.Database.IterateFromDatabase`),
+        so the memory usage does not depend on the number of albums.
+
+        The generator does not hold the database lock while iterating.
+        It yields the albums as they were when the iteration started.
+
+        Returns:
+            A generator of albums
+        """
+        sql = "SELECT * FROM albums"
+        for entry in self.IterateFromDatabase(sql):
+            yield self.__AlbumEntryToDict(entry)
+
     def GetAlbumsByArtistId(self, artistid):
         """
         See :meth:`~lib.db.musicdb.MusicDatabase.GetAlbums` (``GetAlbums(artistid, withsongs=False``)
@@ -961,7 +1197,7 @@ class MusicDatabase(Database):
             sql   = "SELECT * FROM albums"
             value = None
 
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Read():
             result = self.GetFromDatabase(sql, value)
 
             albums = []
@@ -982,7 +1218,7 @@ class MusicDatabase(Database):
             Returns a list of all album IDs
         """
         sql = "SELECT albumid FROM albums"
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Read():
             albumids = self.GetFromDatabase(sql)
         retval = [x[0] for x in albumids] # do not use tuples
         return retval
@@ -1009,11 +1245,13 @@ class MusicDatabase(Database):
         if type(albumid) != str and type(albumid) != int:
             raise TypeError("albumid must be a decimal number of type integer or string")
 
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Write(), self.Transaction():
             sql = "DELETE FROM albums WHERE albumid = ?"
             self.Execute(sql, albumid)
             sql = "DELETE FROM albumtags WHERE albumid = ?"
             self.Execute(sql, albumid)
+            self.InvalidateCache("album", albumid)
+            self.InvalidateRandomCandidates()
 
         return None
 
@@ -1044,8 +1282,9 @@ class MusicDatabase(Database):
             raise TypeError("ArtworkName must have a value of type string!")
 
         sql = "UPDATE albums SET artworkpath = ? WHERE albumid = ?"
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Write():
             self.Execute(sql, (artworkpath, albumid))
+            self.InvalidateCache("album", albumid)
         return None
 
 
@@ -1087,8 +1326,9 @@ class MusicDatabase(Database):
         data["color"]   = color
         data["albumid"] = albumid
         sql = "UPDATE albums SET " + colorname + "=:color WHERE albumid=:albumid"
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Write():
             self.Execute(sql, data)
+            self.InvalidateCache("album", albumid)
         return None
 
 
@@ -1125,7 +1365,7 @@ class MusicDatabase(Database):
             raise TypeError("All parameters must have a value!")
 
         # Check if song already exists
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Write():
             song = self.GetSongByPath(path)
             if song:
                 if song["artistid"] != artistid or song["albumid"] != albumid or song["name"] != name:
@@ -1137,6 +1377,7 @@ class MusicDatabase(Database):
 
             sql = "INSERT INTO songs (albumid, artistid, name, path) VALUES (?, ?, ?, ?)"
             self.Execute(sql, (albumid, artistid, name, path))
+            self.InvalidateRandomCandidates()
         return None
 
 
@@ -1159,7 +1400,7 @@ class MusicDatabase(Database):
         Returns:
             ``True`` on success, otherwise ``False`` which indicates that nothing changed in the database.
         """
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Write(), self.Transaction():
             self.AddSong(song["artistid"], song["albumid"], song["name"], song["path"])
 
             try:
@@ -1172,11 +1413,104 @@ class MusicDatabase(Database):
                 # At this point, it is better to only rely on the path
                 sql = "DELETE FROM songs WHERE path = ?"
                 self.Execute(sql, song["path"])
+                self.InvalidateRandomCandidates()
                 return False
 
         return True
         
 
+    def AddFullAlbum(self, album, songs):
+        """
+        This method adds an album with all its songs, their lyrics and tags to the database in one transaction.
+        Compared to adding the album via :meth:`~lib.db.musicdb.MusicDatabase.AddAlbum` and each song via
+        :meth:`~lib.db.musicdb.MusicDatabase.AddFullSong` this needs only a few statements and a single commit.
+
+        If anything fails, the whole transaction gets rolled back.
+        So either the whole album gets added, or nothing changes in the database.
+
+        The *album* dictionary must have the keys ``artistid``, ``name``, ``path``, ``numofsongs``, ``numofcds``, ``origin`` and ``release``.
+        The songs are dictionaries with all keys of a MusicDB Song entry except ``id`` and ``albumid``.
+        Both IDs get set by this method.
+        Furthermore, a song dictionary can have the following optional keys:
+
+            * ``"lyrics"``: Lyrics of the song as string. The *lyricsstate* of the song should be set accordingly.
+            * ``"tags"``: A list of dictionaries with the keys ``"tagid"``, ``"confidence"`` and ``"approval"``.
+
+        Args:
+            album: Dictionary with the album information
+            songs: List of song dictionaries
+
+        Returns:
+            The ID of the new album
+
+        Raises:
+            TypeError: When *album* is not a dictionary or *songs* not a list
+            ValueError: When the album already exists in the database
+
+        Example:
+
+            .. code-block:: python
+
+                album = {"artistid": 1, "name": "Album", "path": "Artist/2018 - Album",
+                         "numofsongs": 1, "numofcds": 1, "origin": "CD", "release": 2018}
+                song  = {"artistid": 1, "name": "Song", "path": "Artist/2018 - Album/01 Song.mp3", …,
+                         "lyrics": "La la la", "tags": [{"tagid": 1, "confidence": 1.0, "approval": 1}]}
+                albumid = database.AddFullAlbum(album, [song])
+        """
+        if type(album) != dict:
+            raise TypeError("album must be a dictionary")
+        if type(songs) != list:
+            raise TypeError("songs must be a list")
+
+        songcolumns = ["albumid", "artistid", "name", "path", "number", "cd", "disabled", "playtime", "bitrate",
+                "likes", "dislikes", "qskips", "qadds", "qremoves", "favorite", "qrndadds",
+                "lyricsstate", "checksum", "lastplayed"]
+
+        with MusicDatabaseLock.Write():
+            if self.GetAlbumByPath(album["path"]) != None:
+                raise ValueError("Album " + album["path"] + " does already exist in the database!")
+
+            with self.Cursor() as cursor:
+                # Album
+                sql    = "INSERT INTO albums (artistid, name, path, numofsongs, numofcds, origin, release) VALUES (?, ?, ?, ?, ?, ?, ?)"
+                values = (album["artistid"], album["name"], album["path"], album["numofsongs"], album["numofcds"], album["origin"], album["release"])
+                cursor.execute(sql, values)
+                albumid = cursor.lastrowid
+
+                # Songs
+                sql    = "INSERT INTO songs (" + ", ".join(songcolumns) + ") VALUES (" + ", ".join(["?"] * len(songcolumns)) + ")"
+                values = []
+                for song in songs:
+                    song["albumid"] = albumid
+                    values.append([song[column] for column in songcolumns])
+                cursor.executemany(sql, values)
+
+                # Get the new song IDs
+                cursor.execute("SELECT songid, path FROM songs WHERE albumid = ?", (albumid,))
+                songids = { entry[1]: entry[0] for entry in cursor.fetchall() }
+                for song in songs:
+                    song["id"] = songids[song["path"]]
+
+                # Lyrics
+                sql    = "INSERT INTO lyrics (songid, lyrics) VALUES (?, ?)"
+                values = [(song["id"], song["lyrics"]) for song in songs if song.get("lyrics")]
+                if values:
+                    cursor.executemany(sql, values)
+
+                # Tags
+                sql    = "INSERT INTO songtags (songid, tagid, confidence, approval) VALUES (?, ?, ?, ?)"
+                values = []
+                for song in songs:
+                    for tag in song.get("tags", []):
+                        values.append((song["id"], tag["tagid"], tag["confidence"], tag["approval"]))
+                if values:
+                    cursor.executemany(sql, values)
+
+            self.InvalidateRandomCandidates()
+
+        return albumid
+
+
     def GetSongById(self, songid):
         """
         Returns a song from the database that matches the *songid*
@@ -1194,20 +1528,95 @@ class MusicDatabase(Database):
         if type(songid) != str and type(songid) != int:
             raise TypeError("SongID must be a decimal number of type integer or string!")
 
+        song = self.__GetFromCache("song", songid)
+        if song:
+            return song
+
+        # Statistics get updated without the lock (see UpdateSongStatistic).
+        # The generation makes sure that an entry read before such an update does not get cached after it.
+        generation = self.__GetCacheGeneration("song")
+
         sql    = "SELECT * FROM songs WHERE songid = ?"
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Read():
             result = self.GetFromDatabase(sql, (songid))
 
-        if not result:
-            return None
+            if not result:
+                return None
 
-        if len(result) > 1:
-            raise AssertionError("Multiple Song entries for one ID in the database!")
+            if len(result) > 1:
+                raise AssertionError("Multiple Song entries for one ID in the database!")
 
-        song   = self.__SongEntryToDict(result[0])
+            song   = self.__SongEntryToDict(result[0])
+            self.__PutIntoCache("song", songid, song, generation)
         return song
 
 
+    def GetSongsWithParents(self, songids):
+        """
+        Returns the songs with the IDs *songids* together with their albums and artists.
+        Songs, albums and artists that are in the entity cache get taken from the cache.
+        All others get read by a single query that joins the songs, albums and artists table for up to 1000 songs.
+        The read entries get cached.
+
+        Songs that do not exist are not in the returned dictionary.
+
+        Args:
+            songids (list): IDs of the songs
+
+        Returns:
+            A dictionary with song IDs as key and a tuple ``(song, album, artist)`` as value
+
+        Example:
+
+            .. code-block:: python
+
+                entries = database.GetSongsWithParents([1000, 1001])
+                for songid, (song, album, artist) in entries.items():
+                    print(song["name"] + " by " + artist["name"])
+        """
+        entries = {}
+        missing = []
+        for songid in set(songids):
+            song   = self.__GetFromCache("song", songid)
+            album  = self.__GetFromCache("album",  song["albumid"])  if song  else None
+            artist = self.__GetFromCache("artist", song["artistid"]) if album else None
+            if artist:
+                entries[int(songid)] = (song, album, artist)
+            else:
+                missing.append(songid)
+
+        if not missing:
+            return entries
+
+        songcolumns   = ["songs.songid"]     + ["songs."   + field for field in Song.FIELDS[1:]]
+        albumcolumns  = ["albums.albumid"]   + ["albums."  + field for field in Album.FIELDS[1:]]
+        artistcolumns = ["artists.artistid"] + ["artists." + field for field in Artist.FIELDS[1:]]
+        sql  = "SELECT " + ", ".join(songcolumns + albumcolumns + artistcolumns)
+        sql += " FROM songs"
+        sql += " JOIN albums  ON songs.albumid  = albums.albumid"
+        sql += " JOIN artists ON songs.artistid = artists.artistid"
+        sql += " WHERE songs.songid IN "
+
+        numsong   = len(Song.FIELDS)
+        numalbum  = len(Album.FIELDS)
+        chunksize = 1000    # keep the statements at a reasonable size
+        generations = {target: self.__GetCacheGeneration(target) for target in ["song", "album", "artist"]}
+        with MusicDatabaseLock.Read():
+            for index in range(0, len(missing), chunksize):
+                chunk  = missing[index : index + chunksize]
+                result = self.GetFromDatabase(sql + "(" + ", ".join(["?"] * len(chunk)) + ")", chunk)
+
+                for row in result:
+                    song   = self.__SongEntryToDict(row[:numsong])
+                    album  = self.__AlbumEntryToDict(row[numsong:numsong+numalbum])
+                    artist = self.__ArtistEntryToDict(row[numsong+numalbum:])
+                    self.__PutIntoCache("song",   song["id"],   song,   generations["song"])
+                    self.__PutIntoCache("album",  album["id"],  album,  generations["album"])
+                    self.__PutIntoCache("artist", artist["id"], artist, generations["artist"])
+                    entries[song["id"]] = (song, album, artist)
+        return entries
+
+
     def GetSongByPath(self, path):
         """
         Returns a song from the database that matches the *path*
@@ -1226,7 +1635,7 @@ class MusicDatabase(Database):
             raise TypeError("Path must have a value of type string!")
 
         sql = "SELECT * FROM songs WHERE path = ?"
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Read():
             result = self.GetFromDatabase(sql, (path))
 
         # check result
@@ -1258,7 +1667,7 @@ class MusicDatabase(Database):
             raise TypeError("Artist ID must have be a decimal number of type integer or string!")
 
         sql    = "SELECT * FROM songs WHERE artistid = ?"
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Read():
             result = self.GetFromDatabase(sql, artistid)
 
         songs = []
@@ -1282,6 +1691,31 @@ class MusicDatabase(Database):
         """
         return self.GetSongs()
 
+    def IterateSongs(self):
+        """
+        Like :meth:`~GetAllSongs` but returns a generator that yields one song after the other.
+        The songs get streamed from the database (see :meth:`lib.db.database.Database.IterateFromDatabase`),
+        so the memory usage does not depend on the number of songs.
+
+        The generator does not hold the database lock while iterating.
+        It yields the songs as they were when the iteration started.
+        So the songs can be modified while iterating.
+
+        Returns:
+            A generator of songs
+
+        Example:
+
+            .. code-block:: python
+
+                for song in musicdb.IterateSongs():
+                    if song["checksum"] == "":
+                        print(song["path"])
+        """
+        sql = "SELECT * FROM songs"
+        for entry in self.IterateFromDatabase(sql):
+            yield self.__SongEntryToDict(entry)
+
     def GetSongs(self, albumid = None):
         """
         This method returns all songs in the database if *albumid* is ``None``, or all songs of an album if *albumid* is set.
@@ -1299,7 +1733,7 @@ class MusicDatabase(Database):
             sql   = "SELECT * FROM songs"
             value = None
 
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Read():
             result = self.GetFromDatabase(sql, value)
 
         songs = []
@@ -1325,38 +1759,40 @@ class MusicDatabase(Database):
 
         Getting a random song is done by the following steps, visualized in the flow chart below:
 
-            #. Get album IDs of all albums in the database
-            #. Translate *filterlist* into a list of tag IDs
-            #. For each album, get its tags and compare that with the set of tag IDs from the filter. (If there is no filter list set, all album IDs are selected)
-            #. Get all song IDs that are related to the filtered album IDs by calling :meth:`~lib.db.musicdb.MusicDatabase.GetSongIdsByAlbumIds`
+            #. Translate *filterlist* into a set of genre tag IDs
+            #. Get the list of candidate song IDs for the tag IDs and the other constraints.
+               This list gets created by a single query that joins the songs with the album tags.
+               The list gets cached, so that further calls with the same constraints do not need to access the database.
             #. Select a random song ID and get its song entry from the database
 
+        So the costs of selecting a song do not depend on the number of albums in the database.
+        Only creating the candidate list needs to touch all songs.
+        The cached candidate lists get invalidated by all methods that change songs, their *favorite* or *disabled* state, album tags or song tags.
+        Song tags do not change the candidates, but :class:`mdbapi.randy.Randy` derives its candidate pool from them (see :meth:`~GetRandomCandidatesGeneration`).
+        They can also be invalidated explicitly via :meth:`~InvalidateRandomCandidates`.
+
         .. graphviz::
 
             digraph hierarchy {
                 size="5,8"
                 start           [label="Start"];
                 hasalbumid      [shape=diamond, label="albumid == None"];
-                getallalbums    [shape=box,     label="Get all Album IDs"]
-                getalltags      [shape=box,     label="Get list of Tag IDs\nfrom filterlist"]
-                hasfilterlist   [shape=diamond, label="Is there a filter list"];
-                removealbums    [shape=box,     label="Remove albums without\ntags of filter"]
-                getallsongs     [shape=box,     label="Get all songs of selected albums"]
+                getalltags      [shape=box,     label="Get set of Tag IDs\nfrom filterlist"]
+                hascandidates   [shape=diamond, label="Candidates cached"];
+                querycandidates [shape=box,     label="Query and cache\nall candidate songs"]
+                getallsongs     [shape=box,     label="Get all songs of the album"]
                 selectsong      [shape=box,     label="Select random song"]
 
 
                 start           -> hasalbumid;
 
                 hasalbumid      -> getallsongs      [label="No"];
-                hasalbumid      -> getallalbums     [label="Yes"];
-                getallalbums    -> getalltags
-
-                getalltags      -> hasfilterlist
-                hasfilterlist   -> removealbums     [label="Yes"];
-                hasfilterlist   -> getallsongs      [label="No"];
+                hasalbumid      -> getalltags       [label="Yes"];
 
-                removealbums    -> removealbums     [label="For each album"]
-                removealbums    -> getallsongs
+                getalltags      -> hascandidates
+                hascandidates   -> querycandidates  [label="No"];
+                hascandidates   -> selectsong       [label="Yes"];
+                querycandidates -> selectsong
 
                 getallsongs     -> selectsong
             }
@@ -1376,6 +1812,7 @@ class MusicDatabase(Database):
             TypeError: When *nodisabled* or *nohated* are not of type ``bool``
             TypeError: When *minlen* is not ``None`` and not of type integer
             TypeError: When *filterlist* is not a list and not ``None``
+            ValueError: When *minlen* is less than ``0``
         """
         if type(nodisabled) != bool:
             raise TypeError("nodisabled must be of type bool")
@@ -1395,61 +1832,119 @@ class MusicDatabase(Database):
             logging.warning("Ignoring tag filter because there was an Album ID given. \033[1;30m(This may be a symptom of a bug!)")
 
 
-        # Create a list of tagids that limits the set of albums
-        if albumid == None:
-            with MusicDatabaseLock:
-                tagids = []
-                if len(filterlist) > 0:
-                    for filterentry in filterlist:
-                        if type(filterentry) == str:
-                            tag   = self.GetTagByName(filterentry, self.TAG_CLASS_GENRE)
-                            tagid = tag["id"]
-                        else:
-                            tagid = filterentry
-
-                        tagids.append(tagid)
-
-                # create a set from the list to compare it with a set of albumtags
-                tagids = set(tagids)
-
-                # Get IDs of all albums existing in the database
-                sql      = "SELECT albumid FROM albums"
-                retval   = self.GetFromDatabase(sql, None)
-                albumids = [entry[self.ALBUM_ID] for entry in retval]
-
-                # Only select albums that have a tag listed in the tagids list
-                selectedalbumids = []
-                if len(tagids) > 0:
-                    for albumid in albumids:
-                        # Get tags of the album
-                        albumtags = self.GetTargetTags("album", albumid, self.TAG_CLASS_GENRE)
-                        if not albumtags:
-                            continue
-
-                        # Check if one tag matches the filter
-                        albumtagids = { albumtag["id"] for albumtag in albumtags }
-                        if not tagids & albumtagids:
-                            continue
-
-                        selectedalbumids.append(albumid)
-                else:
-                    selectedalbumids = albumids
+        with MusicDatabaseLock.Read():
+            if albumid == None:
+                tagids  = self.__GetGenreTagIds(filterlist)
+                songids = self.__GetRandomCandidates(tagids, nodisabled, nohated, minlen)
+            else:
+                # use the predefined album ID
+                songids = self.GetSongIdsByAlbumIds([albumid], nodisabled, nohated, minlen)
 
-        else:
-            # use the predefined album ID
-            selectedalbumids = [albumid]
+            if len(songids) == 0:
+                return None
 
-        # Get all Songs that may be candidate
-        with MusicDatabaseLock:
-            songids = self.GetSongIdsByAlbumIds(selectedalbumids, nodisabled, nohated, minlen)
+            # Choose a random one
+            songid = random.choice(songids)
+            song   = self.GetSongById(songid)
+        return song
 
-        if len(songids) == 0:
-            return None
 
-        # Choose a random one
-        songid   = songids[random.randrange(0, len(songids))]
-        song     = self.GetSongById(songid)
-        return song
+    def GetRandomCandidates(self, filterlist=None, nodisabled=True, nohated=False, minlen=None, withparents=False):
+        """
+        This method returns the list of song IDs :meth:`~GetRandomSong` chooses from.
+        The arguments are the same as for :meth:`~GetRandomSong`.
+
+        The list gets cached like described for :meth:`~GetRandomSong`.
+        The returned list is the cached one, so it must not be changed.
+
+        If *withparents* is ``True``, a list of ``(songid, albumid, artistid)`` tuples gets returned instead.
+        This list does not get cached.
+
+        Args:
+            filterlist: Optional, default value is ``[]``. A list of genre names or genre tag IDs that limits the search set.
+            nodisabled (bool): If ``True`` no disables songs will be selected
+            nohated (bool): If ``True`` no hated songs will be selected
+            minlen (int): If set, no songs with less than *minlen* seconds will be selected
+            withparents (bool): If ``True`` the album ID and artist ID get returned with each song ID
+
+        Returns:
+            A list of song IDs, or a list of ``(songid, albumid, artistid)`` tuples
+        """
+        if filterlist == None:
+            filterlist = []
+
+        with MusicDatabaseLock.Read():
+            tagids = self.__GetGenreTagIds(filterlist)
+            if not withparents:
+                return self.__GetRandomCandidates(tagids, nodisabled, nohated, minlen)
+
+            sql, values = self.__RandomCandidatesQuery(tagids, nodisabled, nohated, minlen, "songs.songid, songs.albumid, songs.artistid")
+            return [tuple(entry) for entry in self.GetFromDatabase(sql, values)]
+
+
+    def __GetGenreTagIds(self, filterlist):
+        tagids = set()
+        for filterentry in filterlist:
+            if type(filterentry) == str:
+                tag = self.GetTagByName(filterentry, self.TAG_CLASS_GENRE)
+                if not tag:
+                    logging.warning("Genre \"%s\" of the filter list does not exist. \033[1;30m(It will be ignored)", filterentry)
+                    continue
+                tagids.add(tag["id"])
+            else:
+                tagids.add(int(filterentry))
+        return tagids
+
+
+    def __GetRandomCandidates(self, tagids, nodisabled, nohated, minlen):
+        # Returns the cached list of song IDs fulfilling the constraints.
+        # If the list does not exist yet, it gets created by a single query.
+        # The caller must hold the read lock so that no writer changes the songs while the list gets created.
+        key = (tuple(sorted(tagids)), nodisabled, nohated, minlen)
+        with RandomCandidatesLock:
+            songids = self.candidates.get(key)
+        if songids != None:
+            return songids
+
+        sql, values = self.__RandomCandidatesQuery(tagids, nodisabled, nohated, minlen, "songs.songid")
+        result  = self.GetFromDatabase(sql, values)
+        songids = [entry[0] for entry in result]
+
+        # Uncommitted data must not get into the candidates
+        if self.InTransaction():
+            return songids
+
+        with RandomCandidatesLock:
+            if len(self.candidates) >= RANDOMCANDIDATES_MAXSETS:
+                self.candidates.clear()
+            self.candidates[key] = songids
+        return songids
+
+
+    def __RandomCandidatesQuery(self, tagids, nodisabled, nohated, minlen, columns):
+        # Returns the SQL statement and its values that select the candidate songs
+        sql    = "SELECT DISTINCT " + columns + " FROM songs"
+        values = []
+        if tagids:
+            sql += " JOIN albumtags ON albumtags.albumid = songs.albumid"
+            sql += " JOIN tags ON tags.tagid = albumtags.tagid AND tags.class = ?"
+            sql += " WHERE albumtags.tagid IN (" + ", ".join(["?"] * len(tagids)) + ")"
+            values.append(self.TAG_CLASS_GENRE)
+            values.extend(sorted(tagids))
+        else:
+            sql += " WHERE 1"
+
+        if nodisabled:
+            sql += " AND songs.disabled != 1"
+        if nohated:
+            sql += " AND songs.favorite >= 0"
+        if minlen:
+            if minlen < 0:
+                raise ValueError("minlen must be >= 0")
+            sql += " AND songs.playtime >= ?"
+            values.append(minlen)
+
+        return sql, values
 
 
     def GetSongIdsByAlbumIds(self, albumids, nodisabled=True, nohated=False, minlen=None):
@@ -1498,7 +1993,7 @@ class MusicDatabase(Database):
                 raise ValueError("minlen must be >= 0")
             sql += " AND playtime >= " + str(minlen)
 
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Read():
             songids = []
             for albumid in albumids:
                 # returns a list of tuples with one element: [(id1,), .., (idn,)]
@@ -1531,7 +2026,7 @@ class MusicDatabase(Database):
             raise TypeError("songid must be a decimal number of type integer or string")
 
         sql    = "SELECT lyrics FROM lyrics WHERE songid = ?"
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Read():
             result = self.GetFromDatabase(sql, (songid))
 
         # check result
@@ -1593,7 +2088,7 @@ class MusicDatabase(Database):
 
         # try to get old lyrics to see if there exists an entry already
         sql    = "SELECT lyrics FROM lyrics WHERE songid = ?"
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Write(), self.Transaction():
             result = self.GetFromDatabase(sql, (songid))
             if len(result) > 1:
                 raise AssertionError("Multiple lyrics entries for one songid in the database! (" + songid + ")")
@@ -1644,6 +2139,11 @@ class MusicDatabase(Database):
 
         ``lastplayed`` expects the unix time as integer given as value.
 
+        Each update is a single SQL statement like ``UPDATE songs SET likes = likes + 1 WHERE songid = ?``.
+        So the database applies it atomically and concurrent updates do not get lost.
+        Only updating ``favorite`` and ``disable`` acquires the database lock, because they change the candidates of :meth:`~GetRandomSong`.
+        To set the ``lastplayed`` statistic of many songs at once, use :meth:`~UpdateLastPlayed`.
+
         Args:
             songid (int): ID of the song
             stat (str): Name of the statistics to update
@@ -1679,35 +2179,162 @@ class MusicDatabase(Database):
             logging.warning("The statistic \"%s\" is deprecated! It will be removed in April 2019.") # DEPRECATED
             return
 
-        # Get song entry
-        with MusicDatabaseLock:
-            song = self.GetSongById(songid)
+        # generate modifier
+        if stat == "lastplayed":
+            modifier = value
+        elif value in ["inc", "love", "yes"]:
+            modifier = int(+1)
+        elif value in ["dec", "hate"]:
+            modifier = int(-1)
+        elif value in ["reset", "none", "no"]:
+            modifier = int(0)
+
+        # Create a single statement, so the database applies the modification atomically
+        if stat == "disable":
+            column = "disabled"
+        else:
+            column = stat
 
-            # generate modifier
-            if value in ["inc", "love", "yes"]:
-                modifier = int(+1)
-            elif value in ["dec", "hate"]:
-                modifier = int(-1)
-            elif value in ["reset", "none", "no"]:
-                modifier = int(0)
-
-            # apply modifier
-            if stat == "favorite":
-                song["favorite"] = modifier
-            elif stat == "disable":
-                song["disabled"] = modifier
-            elif stat == "lastplayed":
-                song["lastplayed"] = value
-            elif modifier == 0:
-                song[stat]       = 0
-            else:
-                song[stat]      += modifier
+        if stat in ["favorite", "disable", "lastplayed"] or modifier == 0:
+            sql = "UPDATE songs SET " + column + " = ? WHERE songid = ?"
+        else:
+            sql = "UPDATE songs SET " + column + " = " + column + " + ? WHERE songid = ?"
+
+        # Only these statistics decide whether a song is a candidate of GetRandomSong.
+        # They are rarely changed, so the candidate lists can be updated under the write lock.
+        if stat in ["favorite", "disable"]:
+            with MusicDatabaseLock.Write():
+                self.Execute(sql, (modifier, songid))
+                self.InvalidateCache("song", songid)
+                self.InvalidateRandomCandidates()
+        else:
+            self.Execute(sql, (modifier, songid))
+            self.InvalidateCache("song", songid)
+        self.__AddStatisticChanges([songid])
+        return None
 
-            # Write Song
-            self.WriteSong(song)
+
+    def UpdateLastPlayed(self, lastplayed):
+        """
+        This method sets the *lastplayed* statistic of many songs at once.
+        All updates are done in one transaction with a single ``executemany`` call.
+        Like :meth:`~UpdateSongStatistic` this method does not need the database lock.
+
+        Args:
+            lastplayed: A dictionary with song IDs as keys and unix timestamps as values, or a list of ``(songid, timestamp)`` tuples
+
+        Returns:
+            ``None``
+
+        Raises:
+            TypeError: When a timestamp is not an integer
+            ValueError: When a timestamp is less than 0
+
+        Example:
+
+            .. code-block:: python
+
+                musicdb.UpdateLastPlayed({1000: 1530000000, 1001: 1530000240})
+        """
+        if type(lastplayed) == dict:
+            lastplayed = list(lastplayed.items())
+
+        values = []
+        for songid, timestamp in lastplayed:
+            if type(timestamp) != int:
+                raise TypeError("For statistic lastplayed, an integer as value is expected! (containing a unix timestamp)")
+            if timestamp < 0:
+                raise ValueError("Unix time must be greater than 0!")
+            values.append((timestamp, songid))
+
+        sql = "UPDATE songs SET lastplayed = ? WHERE songid = ?"
+        self.ExecuteMany(sql, values)
+        for timestamp, songid in values:
+            self.InvalidateCache("song", songid)
+        self.__AddStatisticChanges([songid for timestamp, songid in values])
         return None
 
 
+    def __AddStatisticChanges(self, songids):
+        with StatisticChangesLock:
+            for songid in songids:
+                self.statisticchanges["sequence"] += 1
+                self.statisticchanges["songids"].append((self.statisticchanges["sequence"], int(songid)))
+
+
+    def GetSongStatisticChanges(self, sequence=None):
+        """
+        Returns the IDs of the songs whose statistics changed via :meth:`~UpdateSongStatistic` or :meth:`~UpdateLastPlayed`
+        since the changes had the sequence number *sequence*.
+        This allows to update data derived from the statistics incrementally, like the weights of :class:`mdbapi.randy.Randy`.
+
+        Only the last changes get remembered.
+        If changes got lost since *sequence*, or if *sequence* is ``None``, no song IDs get returned.
+        Then all derived data must be recreated.
+
+        Args:
+            sequence (int): Sequence number returned by the previous call, or ``None``
+
+        Returns:
+            A tuple of the current sequence number and a set of song IDs, or ``None`` instead of the set when the changes are not known.
+
+        Example:
+
+            .. code-block:: python
+
+                sequence, songids = musicdb.GetSongStatisticChanges()
+                stats = musicdb.GetSongStatistics()
+                # …
+                sequence, songids = musicdb.GetSongStatisticChanges(sequence)
+                if songids == None:
+                    stats = musicdb.GetSongStatistics()
+                elif songids:
+                    stats = musicdb.GetSongStatistics(songids)
+        """
+        with StatisticChangesLock:
+            current = self.statisticchanges["sequence"]
+            changes = self.statisticchanges["songids"]
+            if sequence == None:
+                return current, None
+            if sequence == current:
+                return current, set()
+
+            # The changes since sequence must still be remembered
+            if not changes or changes[0][0] > sequence + 1:
+                return current, None
+            songids = {songid for number, songid in changes if number > sequence}
+        return current, songids
+
+
+    def GetSongStatistics(self, songids=None):
+        """
+        Returns the statistics of songs that are relevant for choosing random songs:
+        ``favorite``, ``likes``, ``dislikes`` and ``lastplayed``.
+        Unlike :meth:`~GetSongById` this method reads only these columns without creating song objects.
+        So it can read the statistics of the whole collection fast.
+
+        Args:
+            songids (list): IDs of the songs to read. If ``None``, the statistics of all songs get returned.
+
+        Returns:
+            A list of tuples ``(songid, favorite, likes, dislikes, lastplayed)``
+        """
+        sql = "SELECT songid, favorite, likes, dislikes, lastplayed FROM songs"
+        if songids == None:
+            with MusicDatabaseLock.Read():
+                return [tuple(entry) for entry in self.GetFromDatabase(sql)]
+
+        songids   = list(songids)
+        stats     = []
+        chunksize = 1000    # keep the statements at a reasonable size
+        with MusicDatabaseLock.Read():
+            for index in range(0, len(songids), chunksize):
+                chunk = songids[index : index + chunksize]
+                result = self.GetFromDatabase(sql + " WHERE songid IN (" + ", ".join(["?"] * len(chunk)) + ")", chunk)
+                stats.extend(tuple(entry) for entry in result)
+        return stats
+
+
     def RemoveSong(self, songid):
         """
         This method removes a song entry and all related data from all tables.
@@ -1731,13 +2358,15 @@ class MusicDatabase(Database):
         if type(songid) != str and type(songid) != int:
             raise TypeError("songid must be a decimal number of type integer or string")
 
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Write(), self.Transaction():
             sql = "DELETE FROM songs WHERE songid = ?"
             self.Execute(sql, songid)
             sql = "DELETE FROM lyrics WHERE songid = ?"
             self.Execute(sql, songid)
             sql = "DELETE FROM songtags WHERE songid = ?"
             self.Execute(sql, songid)
+            self.InvalidateCache("song", songid)
+            self.InvalidateRandomCandidates()
 
         return None
 
@@ -1761,7 +2390,7 @@ class MusicDatabase(Database):
             ValueError: If *tagclass* is set (not ``None``) with an invalid value
 
         """
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Read():
             if tagclass == None:
                 sql     = "SELECT * FROM tags"
                 taglist = self.GetFromDatabase(sql)
@@ -1808,7 +2437,7 @@ class MusicDatabase(Database):
         elif tagclass != self.TAG_CLASS_SUBGENRE and parentid != None:
             raise TypeError("When not creating a subgenre, the parent ID must be  None!")
 
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Write():
             if self.GetTagByName(tagname, tagclass):
                 logging.warning("Tag \"%s\" (class=%i) already exists!", tagname, tagclass)
                 return None
@@ -1847,7 +2476,7 @@ class MusicDatabase(Database):
         logging.debug("Deleting tag \"%s\" of class %i from tags-table!", tagname, tagclass)
 
         sql = "DELETE FROM tags WHERE name = ? AND class = ?"
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Write():
             self.Execute(sql, (tagname, tagclass))
         return None
 
@@ -1900,7 +2529,7 @@ class MusicDatabase(Database):
         data["name"]  = tagname
         data["class"] = tagclass
         sql = "UPDATE tags SET " + columnname + "=:value WHERE name=:name AND class=:class"
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Write():
             self.Execute(sql, data)
         return None
 
@@ -1959,7 +2588,7 @@ class MusicDatabase(Database):
 
         # check if already tagged
         sql = "SELECT * FROM " + tablename + " WHERE " + idname + " = ? AND tagid = ?"
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Write(), self.Transaction():
             result = self.GetFromDatabase(sql, (targetid, tagid))
             if len(result) > 1:
                 raise AssertionError("More that one tag entry found!")
@@ -1980,10 +2609,14 @@ class MusicDatabase(Database):
                 data["confidence"] = confidence
                 sql = "UPDATE " + tablename + " SET confidence=:confidence, approval=:approval WHERE entryid=:entryid"
                 self.Execute(sql, data)
+                # Randy only considers song tags with a certain approval
+                if target == "song":
+                    self.InvalidateRandomCandidates()
             # create new entry
             else:
                 sql = "INSERT INTO " + tablename + " (" + idname + ", tagid, confidence, approval) VALUES (?, ?, ?, ?)"
                 self.Execute(sql, (targetid, tagid, confidence, approval))
+                self.InvalidateRandomCandidates()
 
         return None
 
@@ -2019,8 +2652,9 @@ class MusicDatabase(Database):
             raise ValueError("target must be \"song\" or \"album\"!")
 
         sql = "DELETE FROM " + tablename + " WHERE " + idname + " = ? AND tagid = ?"
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Write():
             self.Execute(sql, (targetid, tagid))
+            self.InvalidateRandomCandidates()
         return None
 
 
@@ -2035,6 +2669,9 @@ class MusicDatabase(Database):
         So, each element in the list is a merged dictionary of the table row of the mapping and the tag itself.
         The ``id`` entry in the dictionary is the ID of the Tag and identical to the entry ``tagid``.
         The ID of the ID of the entry in the mapping-table is ``entryid``.
+
+        The mapping and the tags get read with a single query.
+        To get the tags of many targets, use :meth:`~lib.db.musicdb.MusicDatabase.GetTargetTagsForMany`.
         
         Args:
             target (str):   Target that shall be tagged (``"song"`` for a song, ``"album"`` for an album)
@@ -2076,39 +2713,125 @@ class MusicDatabase(Database):
         else:
             raise ValueError("target must be \"song\" or \"album\"!")
 
-        with MusicDatabaseLock:
-            # get all tagids assigned to the target
-            sql    = "SELECT * FROM " + tablename + " WHERE " + idname + " = ?"
-            result = self.GetFromDatabase(sql, targetid)
+        sql = self.__TargetTagsQuery(tablename, idname, "map." + idname + " = ?", tagclass)
+        if tagclass:
+            values = (targetid, tagclass)
+        else:
+            values = targetid
 
-            # returns a list of tuples with one element: [(id1,), .., (idn,)]
-            if not result:
-                return None # no tags set
+        with MusicDatabaseLock.Read():
+            result = self.GetFromDatabase(sql, values)
 
-            # for each tagid
-            retval = []
-            for entry in result:
-                # Translate mapping 
-                mapping = self.__TagMapEntryToDict(entry, idname)
-
-                # Get mapped tag
-                sql      = "SELECT * FROM tags WHERE tagid = ?"
-                tagentry = self.GetFromDatabase(sql, mapping["tagid"])
-                if len(tagentry) == 0:
-                    logging.warning("\033[1;33mUnknown tag ID " + str(mapping["tagid"]) + " for " + target + " ID " + str(songid))
-                    continue
+        if not result:
+            return None # no tags set
 
-                tag = self.__TagEntryToDict(tagentry[0])
+        retval = []
+        for entry in result:
+            tag = self.__TargetTagEntryToDict(entry, target, idname)
+            if tag:
+                retval.append(tag)
 
-                # Check if it shall be filtered
-                if tagclass and tag["class"] != tagclass:
-                    continue
+        return retval
 
-                # Add tag-information to mapping
-                mapping.update(tag)
-                retval.append(mapping)
 
-        return retval
+
+    def GetTargetTagsForMany(self, target, targetids, tagclass=None):
+        """
+        Returns the tags of multiple targets.
+        This is the bulk version of :meth:`~lib.db.musicdb.MusicDatabase.GetTargetTags`.
+        Instead of one query per target, all tags get read with one query for up to 1000 targets.
+
+        The returned dictionary maps each target ID to a list of its tags.
+        Each tag is a dictionary as returned by :meth:`~lib.db.musicdb.MusicDatabase.GetTargetTags`.
+        Targets without tags are not included in the dictionary.
+
+        Args:
+            target (str):   Target that tags shall be returned (``"song"`` for songs, ``"album"`` for albums)
+            targetids (list): IDs of the targets (song IDs or album IDs)
+            tagclass (int): If not ``None`` only tags of a specific class will be returned
+
+        Returns:
+            A dictionary with target IDs as key and a list of tags as value
+
+        Raises:
+            TypeError: If *targetids* is ``None``
+            ValueError: If *tagclass* is set to an invalid value (``None`` is valid)
+            ValueError: If *target* not in *{"song", "album"}*
+
+        Example:
+
+            .. code-block:: python
+                
+                songids = [song["id"] for song in database.GetSongsByAlbumId(albumid)]
+                tagmap  = database.GetTargetTagsForMany("song", songids)
+                for songid in songids:
+                    tags = tagmap.get(songid, [])
+                    print("Song %i has %i tags"%(songid, len(tags)))
+
+        """
+        if targetids == None:
+            raise TypeError("Target IDs must have a value!")
+        if tagclass not in [None, self.TAG_CLASS_GENRE, self.TAG_CLASS_SUBGENRE, self.TAG_CLASS_MOOD]:
+            raise ValueError("Invalid tag class")
+
+        # select table
+        if target == "song":
+            tablename = "songtags"
+            idname    = "songid"
+        elif target == "album":
+            tablename = "albumtags"
+            idname    = "albumid"
+        else:
+            raise ValueError("target must be \"song\" or \"album\"!")
+
+        targetids = list(targetids)
+        tagmap    = {}
+        chunksize = 1000    # keep the statements at a reasonable size
+
+        with MusicDatabaseLock.Read():
+            for index in range(0, len(targetids), chunksize):
+                chunk = targetids[index : index + chunksize]
+
+                condition = "map." + idname + " IN (" + ", ".join(["?"] * len(chunk)) + ")"
+                sql       = self.__TargetTagsQuery(tablename, idname, condition, tagclass)
+                values = list(chunk)
+                if tagclass:
+                    values.append(tagclass)
+
+                result = self.GetFromDatabase(sql, values)
+                for entry in result:
+                    tag = self.__TargetTagEntryToDict(entry, target, idname)
+                    if not tag:
+                        continue
+                    tagmap.setdefault(tag[idname], []).append(tag)
+
+        return tagmap
+
+
+
+    def __TargetTagsQuery(self, tablename, idname, condition, tagclass):
+        # The first five columns are the mapping, followed by the tag entry.
+        # The left join keeps mappings to unknown tags so that they can be reported.
+        sql  = "SELECT map.entryid, map." + idname + ", map.tagid, map.confidence, map.approval, tags.*"
+        sql += " FROM " + tablename + " AS map LEFT JOIN tags ON tags.tagid = map.tagid"
+        sql += " WHERE " + condition
+        if tagclass:
+            sql += " AND tags.class = ?"
+        return sql
+
+
+    def __TargetTagEntryToDict(self, entry, target, idname):
+        # Translate mapping 
+        mapping  = self.__TagMapEntryToDict(entry, idname)
+        tagentry = entry[5:]
+
+        if tagentry[self.TAG_ID] == None:
+            logging.warning("\033[1;33mUnknown tag ID " + str(mapping["tagid"]) + " for " + target + " ID " + str(mapping[idname]))
+            return None
+
+        # Add tag-information to mapping
+        mapping.update(self.__TagEntryToDict(tagentry))
+        return mapping
 
 
 
@@ -2180,7 +2903,7 @@ class MusicDatabase(Database):
             raise ValueError("Invalid tag class")
 
         sql = "SELECT * FROM tags WHERE name = ? AND class = ?"
-        with MusicDatabaseLock:
+        with MusicDatabaseLock.Read():
             result = self.GetFromDatabase(sql, (tagname, tagclass))
 
         # check result
@@ -0,0 +1,337 @@
+# MusicDB,  a music manager with web-bases UI that focus on music.
+# Copyright (C) 2017  Ralf Stemmer <ralf.stemmer@gmx.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+This module implements a thread safe pool of database connections.
+It is used by :class:`lib.db.database.Database` so that each call of
+:meth:`~lib.db.database.Database.Execute` or :meth:`~lib.db.database.Database.GetFromDatabase`
+borrows its own connection instead of sharing one connection and one cursor between all threads.
+
+The pool holds at least *minsize* and at most *maxsize* connections.
+When all connections are in use, a thread that wants to check out a connection waits up to *timeout* seconds.
+If there is still no connection available after that time, a ``TimeoutError`` gets raised.
+
+Idle connections get checked before they get handed out again.
+When a connection was idle for longer than *pingperiod* seconds, it gets pinged.
+If the ping fails, the connection gets dropped and a new one will be established.
+
+The pool settings can be configured in the ``[database]`` section of the MusicDB Configuration:
+
+    .. code-block:: ini
+
+        [database]
+        poolminsize=1
+        poolmaxsize=8
+        pooltimeout=10
+        poolpingperiod=60
+
+Example:
+
+    .. code-block:: python
+
+        pool = ConnectionPool(lambda: pymysql.connect(host="localhost", db="musicdb"), 1, 8)
+
+        with pool.Connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute("SELECT * FROM songs")
+
+        print(pool.GetStatistics()["utilization"])
+"""
+
+import time
+import logging
+import threading
+from collections import deque
+from contextlib  import contextmanager
+
+
+class ConnectionPool(object):
+    """
+    A pool of database connections.
+
+    The connections get created by calling *connector*.
+    The returned objects must provide the methods ``ping``, ``rollback`` and ``close`` like the pymysql connections do.
+
+    Args:
+        connector: A callable without arguments that returns a new database connection
+        minsize (int): Number of connections that get opened when the pool gets created
+        maxsize (int): Maximum number of connections that can be open at the same time
+        timeout (int/float): Time in seconds a checkout waits for a free connection
+        pingperiod (int/float): Idle time in seconds after that a connection gets pinged before checkout. ``0`` pings on every checkout.
+
+    Raises:
+        TypeError: When *connector* is not callable
+        ValueError: When the sizes are invalid
+    """
+
+    def __init__(self, connector, minsize=1, maxsize=8, timeout=10, pingperiod=60):
+        if not callable(connector):
+            raise TypeError("connector must be a callable returning a new connection")
+        if type(minsize) != int or type(maxsize) != int:
+            raise TypeError("minsize and maxsize must be of type int")
+        if minsize < 0 or maxsize < 1 or minsize > maxsize:
+            raise ValueError("Invalid pool size: 0 <= minsize (%i) <= maxsize (%i) and maxsize >= 1 expected"%(minsize, maxsize))
+
+        self.connector  = connector
+        self.minsize    = minsize
+        self.maxsize    = maxsize
+        self.timeout    = timeout
+        self.pingperiod = pingperiod
+
+        self.condition  = threading.Condition(threading.Lock())
+        self.idle       = deque()   # (connection, timestamp of release)
+        self.numopen    = 0
+        self.numinuse   = 0
+        self.closed     = False
+
+        # Statistics
+        self.stats = {}
+        self.stats["checkouts"]     = 0
+        self.stats["waits"]         = 0     # checkouts that had to wait for a free connection
+        self.stats["timeouts"]      = 0
+        self.stats["totalwaittime"] = 0.0   # in seconds
+        self.stats["maxwaittime"]   = 0.0   # in seconds
+        self.stats["peakinuse"]     = 0
+        self.stats["created"]       = 0
+        self.stats["dropped"]       = 0     # connections closed because of failed health checks or errors
+
+        for i in range(self.minsize):
+            connection = self.connector()
+            self.stats["created"] += 1
+            self.numopen += 1
+            self.idle.append((connection, time.time()))
+
+
+
+    def __IsHealthy(self, connection, idlesince):
+        if time.time() - idlesince < self.pingperiod:
+            return True
+
+        try:
+            connection.ping(reconnect=False)
+        except Exception as e:
+            logging.debug("Pooled database connection failed health check: %s \033[1;30m(Connection will be replaced)", str(e))
+            return False
+        return True
+
+
+    def __Drop(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+
+    def Acquire(self):
+        """
+        This method checks out a connection from the pool.
+        The connection must be given back by calling :meth:`~Release`.
+        Better use :meth:`~Connection` that does this automatically.
+
+        Returns:
+            A database connection
+
+        Raises:
+            TimeoutError: When no connection became available within the configured timeout
+        """
+        t_start  = time.time()
+        deadline = t_start + self.timeout
+        waited   = False
+        created  = False
+
+        # Connecting and pinging can take long.
+        # So a slot gets reserved while holding the lock, and the connection gets opened or checked after releasing the lock.
+        while True:
+            with self.condition:
+                while True:
+                    # Take an idle connection, it gets checked below
+                    if self.idle:
+                        connection, idlesince = self.idle.pop()
+                        break
+
+                    # Reserve a slot for a new connection if the limit is not reached yet
+                    if self.numopen < self.maxsize:
+                        connection, idlesince = None, None
+                        self.numopen += 1
+                        break
+
+                    # Wait for a connection getting released
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self.stats["timeouts"] += 1
+                        raise TimeoutError("No database connection available after %.1fs (%i connections in use)"%(self.timeout, self.numinuse))
+
+                    waited = True
+                    self.condition.wait(remaining)
+
+                self.numinuse += 1
+
+            # Open a new connection
+            if connection == None:
+                try:
+                    connection = self.connector()
+                except Exception as e:
+                    with self.condition:
+                        self.numopen  -= 1
+                        self.numinuse -= 1
+                        self.condition.notify()
+                    raise e
+
+                created = True
+                break
+
+            # Reuse the idle connection if it is healthy
+            if self.__IsHealthy(connection, idlesince):
+                break
+
+            self.__Drop(connection)
+            with self.condition:
+                self.numopen  -= 1
+                self.numinuse -= 1
+                self.stats["dropped"] += 1
+                self.condition.notify()
+
+        with self.condition:
+            waittime = time.time() - t_start
+            if created:
+                self.stats["created"] += 1
+            self.stats["checkouts"] += 1
+            if waited:
+                self.stats["waits"] += 1
+            self.stats["totalwaittime"] += waittime
+            self.stats["maxwaittime"]    = max(self.stats["maxwaittime"], waittime)
+            self.stats["peakinuse"]      = max(self.stats["peakinuse"], self.numinuse)
+
+        return connection
+
+
+
+    def Release(self, connection, broken=False):
+        """
+        This method gives a connection back to the pool.
+
+        If the connection is *broken*, it gets closed instead of being reused.
+        A new connection will be created on demand.
+        After :meth:`~Close` was called, released connections get closed as well.
+
+        Args:
+            connection: A connection checked out via :meth:`~Acquire`
+            broken (bool): ``True`` if the connection shall not be reused
+
+        Returns:
+            *Nothing*
+        """
+        with self.condition:
+            self.numinuse -= 1
+            drop = broken or self.closed
+            if drop:
+                self.numopen -= 1
+                if broken:
+                    self.stats["dropped"] += 1
+            else:
+                self.idle.append((connection, time.time()))
+            self.condition.notify()
+
+        # Closing a connection may block, so it is done without holding the lock
+        if drop:
+            self.__Drop(connection)
+
+
+
+    @contextmanager
+    def Connection(self):
+        """
+        Context manager that checks out a connection and gives it back afterwards.
+
+        When the block raises an exception that is not a regular SQL error,
+        the connection is considered broken and gets closed.
+
+        Example:
+
+            .. code-block:: python
+
+                with pool.Connection() as connection:
+                    cursor = connection.cursor()
+                    cursor.execute(sql)
+        """
+        connection = self.Acquire()
+        broken     = False
+        try:
+            yield connection
+        except (ConnectionError, OSError) as e:
+            broken = True
+            raise e
+        except Exception as e:
+            # pymysql signals lost connections with OperationalError/InterfaceError
+            if type(e).__name__ in ["OperationalError", "InterfaceError"]:
+                broken = True
+            raise e
+        finally:
+            self.Release(connection, broken)
+
+
+
+    def Close(self):
+        """
+        Closes all idle connections.
+        Connections that are currently in use will be closed when they get released after calling this method.
+
+        Returns:
+            *Nothing*
+        """
+        with self.condition:
+            self.closed = True
+            connections = [connection for connection, _ in self.idle]
+            self.numopen -= len(connections)
+            self.idle.clear()
+
+        for connection in connections:
+            self.__Drop(connection)
+
+
+
+    def GetStatistics(self):
+        """
+        This method returns the wait-time and utilization counters of the pool.
+
+        The returned dictionary has the following keys:
+
+            * ``open``, ``inuse``, ``idle``, ``maxsize``: Current state of the pool
+            * ``utilization``: ``inuse/maxsize``
+            * ``checkouts``, ``waits``, ``timeouts``: Number of checkouts, how many of them had to wait and how many failed
+            * ``totalwaittime``, ``maxwaittime``, ``avgwaittime``: Time in seconds spent waiting for a connection
+            * ``peakinuse``: Maximum number of connections that were in use at the same time
+            * ``created``, ``dropped``: Number of connections opened and closed by the pool
+
+        Returns:
+            A dictionary with the pool statistics
+        """
+        with self.condition:
+            stats = dict(self.stats)
+            stats["open"]       = self.numopen
+            stats["inuse"]      = self.numinuse
+            stats["idle"]       = len(self.idle)
+            stats["maxsize"]    = self.maxsize
+            stats["utilization"]= self.numinuse / self.maxsize
+            if stats["checkouts"] > 0:
+                stats["avgwaittime"] = stats["totalwaittime"] / stats["checkouts"]
+            else:
+                stats["avgwaittime"] = 0.0
+        return stats
+
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
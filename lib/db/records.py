@@ -0,0 +1,194 @@
+# MusicDB,  a music manager with web-bases UI that focus on music.
+# Copyright (C) 2017  Ralf Stemmer <ralf.stemmer@gmx.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+This module implements compact row objects for the entries of the Music Database.
+:class:`lib.db.musicdb.MusicDatabase` returns songs, albums, artists and tags as :class:`Song`, :class:`Album`, :class:`Artist` and :class:`Tag` objects.
+
+The objects store the columns in slots instead of a dictionary per row.
+They are created directly from the tuples returned by the database cursor.
+So loading many rows needs much less memory than creating a dictionary for each row.
+
+Still, the objects behave like dictionaries.
+The columns can be read and written via ``row["name"]``,
+and all mapping methods like ``keys()``, ``items()``, ``get()`` or ``update()`` are available.
+Keys that are not a column can be set as well, for example ``album["songs"]``.
+They get stored in a small dictionary that only gets created when needed.
+
+Rows are no ``dict`` instances.
+When a real dictionary is necessary, for example to serialize a row to JSON, call :meth:`~Record.ToDict`.
+
+Example:
+
+    .. code-block:: python
+
+        song = Song(1000, 10, 1, "Song", "Artist/2018 - Album/01 Song.mp3", 1, 1, 0, 240, 320000,
+                    0, 0, 0, 0, 0, 0, 0, 0, "", 0)
+
+        print(song["name"])
+        song["favorite"] = 1
+        song["tags"]     = []       # not a column, stored as extra key
+        print(song.ToDict())
+"""
+
+from collections.abc import MutableMapping
+
+
+class Record(MutableMapping):
+    """
+    Base class of all row objects.
+    Derived classes define the column names in ``FIELDS`` and the same names in ``__slots__``.
+
+    The constructor expects the values of all columns in the order of ``FIELDS``,
+    like a row returned by a tuple cursor.
+
+    Args:
+        values: Values of the columns
+
+    Raises:
+        TypeError: When the number of values does not match the number of columns
+    """
+    __slots__ = ("_extra",)
+    FIELDS    = ()
+
+    def __init__(self, *values):
+        if len(values) != len(self.FIELDS):
+            raise TypeError("%s expects %i values, got %i"%(type(self).__name__, len(self.FIELDS), len(values)))
+        for field, value in zip(self.FIELDS, values):
+            setattr(self, field, value)
+        self._extra = None
+
+
+    @classmethod
+    def FromDict(cls, data):
+        """
+        Creates a row object from a dictionary.
+        Keys that are not a column get stored as extra keys.
+
+        Args:
+            data: A dictionary with at least all columns as keys
+
+        Returns:
+            A new row object
+        """
+        record = cls(*[data[field] for field in cls.FIELDS])
+        for key in data:
+            if key not in cls.FIELDS:
+                record[key] = data[key]
+        return record
+
+
+    def ToDict(self):
+        """
+        Returns:
+            A new dictionary with all columns and extra keys
+        """
+        return dict(self.items())
+
+
+    def copy(self):
+        """
+        Returns:
+            A shallow copy of the row, like ``dict.copy``
+        """
+        record = type(self)(*[getattr(self, field) for field in self.FIELDS])
+        if self._extra:
+            record._extra = dict(self._extra)
+        return record
+
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            return getattr(self, key)
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+
+    def __setitem__(self, key, value):
+        if key in self.FIELDS:
+            setattr(self, key, value)
+            return
+        if self._extra == None:
+            self._extra = {}
+        self._extra[key] = value
+
+
+    def __delitem__(self, key):
+        if key in self.FIELDS:
+            raise KeyError("The column \"%s\" cannot be removed"%(str(key)))
+        if not self._extra or key not in self._extra:
+            raise KeyError(key)
+        del self._extra[key]
+
+
+    def __contains__(self, key):
+        return key in self.FIELDS or bool(self._extra and key in self._extra)
+
+
+    def __iter__(self):
+        yield from self.FIELDS
+        if self._extra:
+            yield from list(self._extra)
+
+
+    def __len__(self):
+        if self._extra:
+            return len(self.FIELDS) + len(self._extra)
+        return len(self.FIELDS)
+
+
+    def __repr__(self):
+        return "%s(%s)"%(type(self).__name__, repr(self.ToDict()))
+
+
+
+class Artist(Record):
+    """
+    An entry of the *artists* table
+    """
+    FIELDS    = ("id", "name", "path")
+    __slots__ = FIELDS
+
+
+class Album(Record):
+    """
+    An entry of the *albums* table
+    """
+    FIELDS    = ("id", "artistid", "name", "path", "numofsongs", "numofcds", "origin", "release",
+                 "artworkpath", "bgcolor", "fgcolor", "hlcolor")
+    __slots__ = FIELDS
+
+
+class Song(Record):
+    """
+    An entry of the *songs* table
+    """
+    FIELDS    = ("id", "albumid", "artistid", "name", "path", "number", "cd", "disabled", "playtime", "bitrate",
+                 "likes", "dislikes", "qskips", "qadds", "qremoves", "favorite", "qrndadds",
+                 "lyricsstate", "checksum", "lastplayed")
+    __slots__ = FIELDS
+
+
+class Tag(Record):
+    """
+    An entry of the *tags* table
+    """
+    FIELDS    = ("id", "name", "class", "parentid", "icontype", "icon", "color", "posx", "posy")
+    __slots__ = FIELDS
+
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
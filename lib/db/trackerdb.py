@@ -44,19 +44,20 @@ targetida / targetidb:
 weight:
     Gets incremented whenever the xida/xidb relation occures.
 
-This classes uses a global lock (using Python ``threading.RLock``) to avoid that relations change during complex operation.
+This classes uses a global read/write lock (:class:`lib.db.database.ReadWriteLock`) to avoid that relations change during complex operation.
 For example, when removing a songs relation, the artists relation weight must be decreased.
 There are multiple database accesses necessary to do so.
 Meanwhile, nothing should be changed by other threads.
+Reading relations only needs the shared read lock, so multiple threads can read at the same time.
 """
 
 import logging
 import sqlite3
-import threading
-from lib.db.database import Database
+import pymysql.cursors
+from lib.db.database import Database, ReadWriteLock
 from lib.db.musicdb  import MusicDatabase
 
-TrackerDatabaseLock = threading.RLock() # RLock is mandatory for nested calles!
+TrackerDatabaseLock = ReadWriteLock() # Reentrant, readers share the lock, writers are exclusive
 
 class TrackerDatabase(Database):
     """
@@ -65,23 +66,33 @@ class TrackerDatabase(Database):
     Args:
         path (str): Absolute path to the tracker database file.
 
+    The database must be at version 3, because adding relations relies on the unique key of the ID pairs.
+    Older databases can be updated with ``musicdb upgrade``.
+
     Raises:
         ValueError: When the version of the database does not match the expected version. (Updating MusicDB may failed)
     """
+    # The relations get unpacked as tuples
+    CURSORCLASS   = pymysql.cursors.Cursor
+    SSCURSORCLASS = pymysql.cursors.SSCursor
 
-    def __init__(self, host, port, name, user, password, charset):
-        Database.__init__(self, host, port, name, user, password, charset)
+    def __init__(self, host, port, name, user, password, charset, poolconfig=None):
+        Database.__init__(self, host, port, name, user, password, charset, poolconfig)
         try:
-            result = self.GetFromDatabase("SELECT value FROM meta WHERE key = 'version'")
+            result = self.GetFromDatabase("SELECT value FROM meta WHERE `key` = 'version'")
             version = int(result[0][0])
         except Exception as e:
             raise ValueError("Unable to read version number from Tracker Database")
 
-        if version != 2:
-            raise ValueError("Unexpected version number of Tracker Database. Got %i, expected %i", version, 2)
+        # Version 3 adds the unique key on the ID pairs that AddRelations relies on
+        if version == 2:
+            logging.error("Tracker Database is outdated and has no unique key on its relations! \033[1;30m(Run musicdb upgrade to update the database)")
+            raise ValueError("Tracker Database is outdated. Run musicdb upgrade to update it to version 3")
+        elif version != 3:
+            raise ValueError("Unexpected version number of Tracker Database. Got %i, expected %i", version, 3)
         
 
-    def AddRelation(self, target, ida, idb):
+    def AddRelation(self, target, ida, idb, weight=1):
         """
         This method adds a relation between two targets.
         A target can be a song or an artist.
@@ -90,10 +101,14 @@ class TrackerDatabase(Database):
         This gets handled automatically.
         If *ida* and *idb* are the same ID, they get ignored.
 
+        The relation gets inserted or its weight incremented by a single ``INSERT … ON DUPLICATE KEY UPDATE`` statement.
+        This relies on the unique index of the ID pair that gets created by ``musicdb upgrade``.
+
         Args:
             target (str): ``song`` or ``artist``
             ida (int): Song ID or Artist ID, depending on the target string
             ida (int): Song ID or Artist ID, depending on the target string
+            weight (int): Weight that gets added to the relation
 
         Returns:
             ``None``
@@ -102,36 +117,68 @@ class TrackerDatabase(Database):
             ValueError: If *target* not ``"song"`` or ``"artist"``
             TypeError: If *ida* or *idb* is not of type int
         """
+        return self.AddRelations(target, [(ida, idb, weight)])
+
+
+    def AddRelations(self, target, relations):
+        """
+        This method adds many relations at once.
+        Each relation is a tuple ``(ida, idb)`` or ``(ida, idb, weight)``.
+        Relations with the same pair of IDs get merged before they get written, independent of the order of the IDs.
+        All relations get written with one ``executemany`` call in one transaction.
+
+        See :meth:`~AddRelation` for details.
+
+        Args:
+            target (str): ``song`` or ``artist``
+            relations (list): List of relation tuples
+
+        Returns:
+            ``None``
+
+        Raises:
+            ValueError: If *target* not ``"song"`` or ``"artist"``
+            TypeError: If an ID is not of type int
+
+        Example:
+
+            .. code-block:: python
+
+                trackerdb.AddRelations("song", [(1000, 1001), (1001, 1000, 2), (1001, 1002)])
+                # songrelations: 1000↔1001 +3, 1001↔1002 +1
+        """
         if target not in ["song", "artist"]:
             raise ValueError("Unknown target \"%s\"! Only \"song\" and \"artist\" allowed.", target)
 
-        if type(ida) != int or type(idb) != int:
-            raise TypeError("IDs must be of type int!")
+        weights = {}
+        for relation in relations:
+            ida, idb = relation[0], relation[1]
+            weight   = relation[2] if len(relation) > 2 else 1
 
-        if ida == idb:
-            logging.debug("%s IDs are the same. They will be ignored", target)
-            return None
+            if type(ida) != int or type(idb) != int:
+                raise TypeError("IDs must be of type int!")
 
-        # ida must be less than idb, if not, exchange the values
-        if ida > idb:
-            idb, ida = ida, idb
+            if ida == idb:
+                logging.debug("%s IDs are the same. They will be ignored", target)
+                continue
 
-        with TrackerDatabaseLock:
-            # Get edge if it already exists
-            sql    = "SELECT id, weight FROM "+target+"relations WHERE "+target+"ida = ? AND "+target+"idb = ?"
-            result = self.GetFromDatabase(sql, (ida, idb))
+            # ida must be less than idb, if not, exchange the values
+            if ida > idb:
+                idb, ida = ida, idb
 
-            # Define new weight - new edges have weight 1
-            # if there is a result, increas the weight
-            if result:
-                relationid = result[0][0]# [(id, weight)]
-                weight     = result[0][1]# [(id, weight)]
+            weights[(ida, idb)] = weights.get((ida, idb), 0) + weight
 
-                sql = "UPDATE "+target+"relations SET weight = ? WHERE id = ?"
-                self.Execute(sql, (weight + 1, relationid))
-            else:
-                sql = "INSERT INTO "+target+"relations ("+target+"ida, "+target+"idb) VALUES (?, ?)"
-                self.Execute(sql, (ida, idb))
+        if not weights:
+            return None
+
+        sql  = "INSERT INTO "+target+"relations ("+target+"ida, "+target+"idb, weight) VALUES (?, ?, ?)"
+        sql += " ON DUPLICATE KEY UPDATE weight = weight + VALUES(weight)"
+        values = [(ida, idb, weight) for (ida, idb), weight in weights.items()]
+
+        # The upsert is atomic, so relations can be added concurrently.
+        # It only must not interfere with the multi statement operations that hold the write lock.
+        with TrackerDatabaseLock.Read():
+            self.ExecuteMany(sql, values)
 
         return None
 
@@ -210,7 +257,7 @@ class TrackerDatabase(Database):
             idb, ida = ida, idb
 
         # Remove relation
-        with TrackerDatabaseLock:
+        with TrackerDatabaseLock.Write():
             sql = "DELETE FROM "+target+"relations WHERE "+target+"ida = ? AND "+target+"idb = ?"
             self.Execute(sql, (ida, idb))
 
@@ -259,7 +306,7 @@ class TrackerDatabase(Database):
         # be sure the order fulfills the constraint that ID A is smaller than ID B
         [songida, songidb] = sorted([songida, songidb])
 
-        with TrackerDatabaseLock:
+        with TrackerDatabaseLock.Write(), self.Transaction():
             # Get weight
             sql    = "SELECT weight FROM songrelations WHERE songida = ? AND songidb = ?"
             result = self.GetFromDatabase(sql, (songida, songidb))
@@ -326,7 +373,7 @@ class TrackerDatabase(Database):
         if type(songid) != int:
             raise TypeError("Song IDs must be of type int!")
 
-        with TrackerDatabaseLock:
+        with TrackerDatabaseLock.Write():
             sql = "DELETE FROM songrelations WHERE songida = ? OR songidb = ?"
             self.Execute(sql, (songid, songid))
 
@@ -361,7 +408,7 @@ class TrackerDatabase(Database):
         if type(artistida) != int or type(artistidb) != int:
             raise TypeError("Artist IDs must be of type int!")
 
-        with TrackerDatabaseLock:
+        with TrackerDatabaseLock.Write(), self.Transaction():
             # Remove artist connection
             self.RemoveRelation("artist", artistida, artistidb)
 
@@ -370,9 +417,9 @@ class TrackerDatabase(Database):
             songlistb = musicdb.GetSongsByArtistId(artistidb)
 
             # Try remove all possible song connections
-            for songa in songlista:
-                for songb in songlistb:
-                    self.RemoveRelation("song", songa["id"], songb["id"])
+            pairs = [sorted([songa["id"], songb["id"]]) for songa in songlista for songb in songlistb]
+            sql   = "DELETE FROM songrelations WHERE songida = ? AND songidb = ?"
+            self.ExecuteMany(sql, pairs)
 
         return None
 
@@ -398,7 +445,7 @@ class TrackerDatabase(Database):
         if type(artistid) != int:
             raise TypeError("Song IDs must be of type int!")
 
-        with TrackerDatabaseLock:
+        with TrackerDatabaseLock.Write():
             sql = "DELETE FROM artistrelations WHERE artistida = ? OR artistidb = ?"
             self.Execute(sql, (artistid, artistid))
 
@@ -439,7 +486,7 @@ class TrackerDatabase(Database):
         if type(targetid) != int:
             raise TypeError("targetid must be of type int!")
 
-        with TrackerDatabaseLock:
+        with TrackerDatabaseLock.Read():
             sqla    = "SELECT "+target+"ida, weight FROM "+target+"relations WHERE "+target+"idb = ?"
             sqlb    = "SELECT "+target+"idb, weight FROM "+target+"relations WHERE "+target+"ida = ?"
 
@@ -466,5 +513,37 @@ class TrackerDatabase(Database):
         return results
 
 
+
+    def IterateRelations(self, target):
+        """
+        This method returns a generator that yields all relations of the songs or artists, depending on the value of *target*.
+        Each relation is a tuple ``(ida, idb, weight)`` with ``ida < idb``.
+        The relations get streamed from the database (see :meth:`lib.db.database.Database.IterateFromDatabase`),
+        so the whole table does not need to be held in memory.
+
+        Args:
+            target (str): ``song`` or ``artist``
+
+        Returns:
+            A generator of relation tuples
+
+        Raises:
+            ValueError: If *target* not ``"song"`` or ``"artist"``
+
+        Example:
+
+            .. code-block:: python
+
+                for ida, idb, weight in trackerdatabase.IterateRelations("artist"):
+                    print("%d ↔ %d: %d"%(ida, idb, weight))
+        """
+        if target not in ["song", "artist"]:
+            raise ValueError("Unknown target \"%s\"! Only \"song\" and \"artist\" allowed.", target)
+
+        sql = "SELECT "+target+"ida, "+target+"idb, weight FROM "+target+"relations"
+        for ida, idb, weight in self.IterateFromDatabase(sql):
+            yield (ida, idb, weight)
+
+
 # vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
 
@@ -327,11 +327,15 @@ class IcecastInterface(object):
 
 
 
-    def StreamFile(self, path):
+    def StreamFile(self, path, mp3stream=None):
         """
         This is a generator that sends a mp3 file to the Icecast server.
         The mp3 file gets split into its frames, and sent frame wise.
 
+        The frames get read from an :class:`lib.stream.mp3stream.MP3Stream` object for *path*.
+        Alternatively an already created stream like a :class:`lib.stream.mp3stream.BufferedMP3Stream` object can be given by *mp3stream*.
+        Then *path* is only used for log messages.
+
         After sending one chunk, the generator returns a dictionary with exact the keys and values
         that gets returned by :meth:`lib.stream.mp3stream.MP3Stream.Frames` and  :meth:`lib.stream.mp3stream.MP3Stream.AnalyzeHeader`
 
@@ -387,6 +391,7 @@ class IcecastInterface(object):
 
         Args:
             path (str): Absolute path to the mp3 file to stream. The encoding must be the same for all files!
+            mp3stream: Optional object providing the frames of the file via a ``Frames`` method
 
         Returns:
             Returns a generator that returns the currently streamed frame.
@@ -409,7 +414,10 @@ class IcecastInterface(object):
         """
 
         try:
-            mp3 = MP3Stream(path)
+            if mp3stream:
+                mp3 = mp3stream
+            else:
+                mp3 = MP3Stream(path)
         except Exception as e:
             logging.error("Loading \"%s\" failed with error: %s", str(path), str(e))
             return
@@ -433,7 +441,7 @@ class IcecastInterface(object):
                 frame["muted"] = False
                 yield frame
 
-        except ValueError as e:
+        except (ValueError, TypeError) as e:
             logging.error("Decoding \"%s\" failed with error: %s", str(path), str(e))
             return
 
@@ -17,8 +17,14 @@
 """
 This module provides a class to read mp3 files frame wise.
 Decoding is not part of it.
+
+The :class:`~MP3FileStream` class reads the frames of an mp3 file directly from the file mapped into memory.
+It is used to stream mp3 files that already have the encoding of the stream, like the files of the :doc:`/mdbapi/musiccache`,
+without transcoding them.
 """
 import sys
+import mmap
+import logging
 
 BitrateTable = [ # in kilo
             [ # MPEG-2 & 2.5
@@ -333,13 +339,14 @@ class MP3File(object):
         elif layer == 3:
             infos["layer"] = 1
         else:
-            raise ValueError("Invalid MPEG layer code. $i ∉ {1,2,3}"%(layer))
+            raise ValueError("Invalid MPEG layer code. %i ∉ {1,2,3}"%(layer))
 
-        infos["bitrate"]    = BitrateTable[mpeg_version & 1][infos["layer"] - 1][bitrateindex] * 1000
+        infos["bitrate"]    = BitrateTable[mpeg_version & 1][infos["layer"] - 1][bitrateindex]
         infos["samplerate"] = SamplerateTable[mpeg_version][samplerateindex]
 
         if infos["bitrate"] is None:
             raise ValueError("Invalid bit rate code %i"%(bitrateindex))
+        infos["bitrate"] *= 1000
         
         if infos["samplerate"] is None:
             raise ValueError("Invalid sample rate code %i"%(samplerateindex))
@@ -367,6 +374,210 @@ class MP3File(object):
 
 
 
+class MP3FileStream(MP3File):
+    """
+    This class provides the frames of an mp3 file like :meth:`lib.stream.mp3stream.MP3Stream.Frames`,
+    but without transcoding the file.
+    The file gets mapped into memory via :mod:`mmap` and the frames get read one by one when they are needed.
+    So the file does not get loaded completely like by :meth:`MP3File.Load`.
+
+    An ID3v2 Tag at the beginning of the file gets skipped.
+    Data that is not a valid MP3 Frame gets skipped until the next valid MP3 Frame Header (see :meth:`~Resync`).
+    So reading stops at an ID3v1 Tag at the end of the file.
+    Each different MP3 Frame Header gets analyzed only once.
+
+    The file gets opened when the object gets created.
+    When the frames are not needed anymore, :meth:`~Cancel` must be called to close the file.
+
+    Args:
+        path (str): An absolute path to an mp3 file
+
+    Raises:
+        OSError: When the file cannot be opened
+        ValueError: When the file is empty
+
+    Example:
+
+        .. code-block:: python
+
+            mp3stream = MP3FileStream("/data/mp3cache/1/23/456:checksum.mp3")
+            if mp3stream.IsCompatible():
+                for frame in mp3stream.Frames():
+                    print(frame["header"])
+            mp3stream.Cancel()
+    """
+
+    def __init__(self, path):
+        self.path    = path
+        self.id3tag  = None
+        self.frames  = []
+        self.headers = {}   # MP3 Frame Header → information as returned by AnalyzeHeader
+
+        self.file    = open(self.path, "rb")
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self.file.close()
+            raise
+
+        # Skip ID3v2 Tag
+        self.start = 0
+        if self.data[:3] == b"ID3" and len(self.data) >= 10:
+            id3header   = self.data[:10]
+            id3tagsize  = id3header[6]<<21 | id3header[7]<<14 | id3header[8]<<7 | id3header[9]
+            self.start  = 10 + id3tagsize
+            if id3header[5] & 0x10:
+                self.start += 10    # Footer
+
+
+
+    def GetFrame(self, offset):
+        """
+        Returns the frame at position *offset* in the file.
+
+        Args:
+            offset (int): Position of the MP3 Frame Header in the file
+
+        Returns:
+            A dictionary with the frame like :meth:`~Frames`, or ``None`` if there is no valid frame at that position
+        """
+        mp3header = self.data[offset:offset+4]
+        if len(mp3header) < 4 or mp3header[0] != 0xFF or (mp3header[1] & 0xE0) != 0xE0:
+            return None
+
+        infos = self.headers.get(mp3header)
+        if infos == None:
+            # Reject reserved and invalid codes before analyzing the header
+            header = int.from_bytes(mp3header, byteorder='big', signed=False)
+            if (header >> 19) & 3 == 1:             # reserved MPEG version
+                return None
+            if (header >> 17) & 3 == 0:             # reserved layer
+                return None
+            if (header >> 12) & 15 in [0, 15]:      # free or bad bit rate
+                return None
+            if (header >> 10) & 3 == 3:             # reserved sample rate
+                return None
+
+            try:
+                infos = self.AnalyzeHeader(mp3header)
+            except (ValueError, TypeError):
+                return None
+            self.headers[mp3header] = infos
+
+        framesize = infos["framesize"]
+        if framesize < 4 or offset + framesize > len(self.data):
+            return None
+
+        frame = {}
+        frame["frame"]  = self.data[offset:offset+framesize]
+        frame["header"] = infos
+        return frame
+
+
+
+    def IsCompatible(self, bitrate=320000, samplerate=44100):
+        """
+        This method checks if the file can be streamed without transcoding.
+        This is the case when the first frame is an MPEG Layer III frame with the given bit rate and sample rate in stereo or joint stereo mode.
+        Files with variable bit rate, indicated by a *Xing* header in the first frame, are not compatible.
+
+        The default values are the encoding of the :doc:`/lib/mp3transcoder` that is also used for the :doc:`/mdbapi/musiccache`.
+
+        Args:
+            bitrate (int): Expected bit rate in bit/s
+            samplerate (int): Expected sample rate in Hz
+
+        Returns:
+            ``True`` if the file has the expected encoding, otherwise ``False``
+        """
+        frame = self.GetFrame(self.start)
+        if frame == None:
+            return False
+
+        infos = frame["header"]
+        if infos["mpeg version"] != 1 or infos["layer"] != 3:
+            return False
+        if infos["bitrate"] != bitrate or infos["samplerate"] != samplerate:
+            return False
+        if infos["mode"] not in ["stereo", "joint stereo"]:
+            return False
+        if b"Xing" in frame["frame"]:
+            return False
+        return True
+
+
+
+    def Frames(self):
+        """
+        This is a generator that returns a frame from the mp3 file and information about that frame.
+        The returned dictionary contains the same information like the one returned by :meth:`lib.stream.mp3stream.MP3Stream.Frames`:
+
+            * ``"frame"`` (bytes): A complete MP3 Frame including the Frame Header and the Frame Data
+            * ``"header"`` (dict): The interpretation of the MP3 Frame Header as returned by :meth:`~MP3File.AnalyzeHeader`
+
+        The ``"header"`` dictionary is shared by all frames with the same MP3 Frame Header and must not be changed.
+
+        Returns:
+            A generator that returns a dictionary including a mp3 frame
+        """
+        offset = self.start
+        while True:
+            frame = self.GetFrame(offset)
+            if frame == None:
+                nextoffset = self.Resync(offset)
+                if nextoffset == None:
+                    break
+                logging.debug("%i bytes of \"%s\" at offset %i are not part of an MP3 frame. \033[1;30m(They were skipped)", nextoffset - offset, self.path, offset)
+                offset = nextoffset
+                continue
+
+            yield frame
+            offset += frame["header"]["framesize"]
+
+        # Anything else than an ID3v1 Tag behind the last frame indicates a broken file
+        rest = len(self.data) - offset
+        if rest > 0 and not (rest == 128 and self.data[offset:offset+3] == b"TAG"):
+            logging.debug("%i bytes at the end of \"%s\" are not part of an MP3 frame. \033[1;30m(They were skipped)", rest, self.path)
+
+
+
+    def Resync(self, offset):
+        """
+        Searches for the next valid MP3 Frame behind *offset*.
+        To not take random data for a frame, the frame must be followed by another valid frame or the end of the file.
+
+        Args:
+            offset (int): Position of the invalid data
+
+        Returns:
+            The position of the next valid MP3 Frame, or ``None`` if there is none
+        """
+        offset = self.data.find(b"\xFF", offset + 1)
+        while offset >= 0:
+            frame = self.GetFrame(offset)
+            if frame != None:
+                nextoffset = offset + frame["header"]["framesize"]
+                if nextoffset == len(self.data) or self.GetFrame(nextoffset) != None:
+                    return offset
+            offset = self.data.find(b"\xFF", offset + 1)
+        return None
+
+
+
+    def Cancel(self):
+        """
+        Closes the file.
+        This method has the same name as :meth:`lib.stream.mp3stream.BufferedMP3Stream.Cancel`,
+        so that both classes can be used the same way.
+
+        Returns:
+            *Nothing*
+        """
+        self.data.close()
+        self.file.close()
+
+
+
 if __name__ == "__main__":
 
     mp3file = MP3File("./test2.mp3")
@@ -17,9 +17,14 @@
 """
 This module provides a class to read any audio file and provide it as mp3 frames.
 Transcoding is done by the :doc:`/lib/mp3transcoder` module.
+
+The :class:`~BufferedMP3Stream` class transcodes a file in background into a bounded buffer of frames.
+So a file can be prepared while another one gets streamed.
 """
 import sys
+import queue
 import logging
+import threading
 from lib.stream.mp3transcoder import MP3Transcoder
 
 BitrateTable = [ # in kilo
@@ -295,13 +300,14 @@ class MP3Stream(object):
         elif layer == 3:
             infos["layer"] = 1
         else:
-            raise ValueError("Invalid MPEG layer code. $i ∉ {1,2,3}"%(layer))
+            raise ValueError("Invalid MPEG layer code. %i ∉ {1,2,3}"%(layer))
 
-        infos["bitrate"]    = BitrateTable[mpeg_version & 1][infos["layer"] - 1][bitrateindex] * 1000
+        infos["bitrate"]    = BitrateTable[mpeg_version & 1][infos["layer"] - 1][bitrateindex]
         infos["samplerate"] = SamplerateTable[mpeg_version][samplerateindex]
 
         if infos["bitrate"] is None:
             raise ValueError("Invalid bit rate code %i"%(bitrateindex))
+        infos["bitrate"] *= 1000
         
         if infos["samplerate"] is None:
             raise ValueError("Invalid sample rate code %i"%(samplerateindex))
@@ -329,5 +335,106 @@ class MP3Stream(object):
 
 
 
+class BufferedMP3Stream(object):
+    """
+    This class provides the same frames as :class:`~MP3Stream`,
+    but the transcoding is done by a background thread as soon as the object gets created.
+    The frames get stored in a buffer of at most *maxframes* frames.
+    When the buffer is full, the transcoding pauses until frames got read via :meth:`~Frames`.
+
+    So the transcoding of a file can be started some seconds before its frames are needed.
+    Then starting the GStreamer Pipeline does not delay the first frames.
+
+    If the frames are not needed anymore, :meth:`~Cancel` must be called to stop the background thread.
+
+    Args:
+        path (str): An absolute path to a valid audio file
+        maxframes (int): Maximum number of frames in the buffer
+
+    Example:
+
+        .. code-block:: python
+
+            mp3stream = BufferedMP3Stream("/tmp/test.m4a", 500)  # Start transcoding
+            # …
+            for frame in mp3stream.Frames():                    # Access mp3 frames
+                print(frame["header"])
+            mp3stream.Cancel()
+    """
+
+    def __init__(self, path, maxframes=500):
+        self.path      = path
+        self.buffer    = queue.Queue(maxsize=maxframes)
+        self.cancelled = threading.Event()
+        self.error     = None
+
+        self.thread    = threading.Thread(target=self.__Transcode, daemon=True)
+        self.thread.start()
+
+
+
+    def __Transcode(self):
+        # Fills the buffer with the frames from MP3Stream. None marks the end of the stream.
+        frames = MP3Stream(self.path).Frames()
+        try:
+            for frame in frames:
+                if not self.__Put(frame):
+                    return
+        except Exception as e:
+            self.error = e
+        finally:
+            frames.close()  # Stops the transcoder
+
+        self.__Put(None)
+
+
+    def __Put(self, frame):
+        # Waits until there is space in the buffer. Returns False when the stream got canceled.
+        while not self.cancelled.is_set():
+            try:
+                self.buffer.put(frame, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+
+
+    def Frames(self):
+        """
+        This is a generator that returns the mp3 frames from the buffer.
+        If the buffer is empty, it waits for the next frame.
+        The frames are the same as returned by :meth:`MP3Stream.Frames`.
+
+        Returns:
+            A generator that returns a dictionary including a mp3 frame
+
+        Raises:
+            The exception raised while transcoding, for example ``ValueError`` when the MP3 Sync Bits are not correct
+        """
+        while True:
+            frame = self.buffer.get()
+            if frame == None:
+                break
+            yield frame
+
+        if self.error:
+            raise self.error
+
+
+
+    def Cancel(self):
+        """
+        Stops transcoding and waits until the background thread finished.
+        Calling this method after all frames were read is no error.
+
+        Returns:
+            *Nothing*
+        """
+        self.cancelled.set()
+        self.thread.join()
+
+
+
 # vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
 
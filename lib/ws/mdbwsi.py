@@ -48,6 +48,7 @@ Songs
 Queue
 ^^^^^
 * :meth:`~lib.ws.mdbwsi.MusicDBWebSocketInterface.GetQueue`
+* :meth:`~lib.ws.mdbwsi.MusicDBWebSocketInterface.GetQueueState`
 * :meth:`~lib.ws.mdbwsi.MusicDBWebSocketInterface.AddSongToQueue`
 * :meth:`~lib.ws.mdbwsi.MusicDBWebSocketInterface.AddRandomSongToQueue`
 * :meth:`~lib.ws.mdbwsi.MusicDBWebSocketInterface.AddAlbumToQueue`
@@ -95,18 +96,29 @@ from mdbapi.database    import MusicDBDatabase
 from mdbapi.mise        import MusicDBMicroSearchEngine
 from mdbapi.tags        import MusicDBTags
 from mdbapi.stream      import StreamManager
-from mdbapi.songqueue   import SongQueue
+from mdbapi.songqueue   import SongQueue, QUEUECHANGES_MAXLEN
 import logging
-from threading          import Thread
+from threading          import Thread, Lock
 import traceback
 
+# Entries of GetQueue, shared by all connections.
+# Each entry gets created once when it enters the queue, and gets recreated when its song, album or artist changed.
+QueueViewLock = Lock()
+QueueView     = {"generations": None, "entries": {}}  # entries: entry ID → entry as returned by GetQueue
+
+# Changes of the queue as sent to the clients, shared by all connections.
+# Each change gets created once, no matter how many clients get notified.
+QueueDeltasLock = Lock()
+QueueDeltas     = {}    # version → change as sent by onQueueEvent
+
 class MusicDBWebSocketInterface(object):
 
     def __init__(self):
         # Import global variables from the server
-        from mdbapi.server import database, mise, cfg
+        from mdbapi.server import database, mise, relationgraph, cfg
         self.database   = database
         self.mise       = mise
+        self.graph      = relationgraph
         self.cfg        = cfg
 
         # The autobahn framework silently hides all exceptions - that sucks
@@ -120,6 +132,8 @@ class MusicDBWebSocketInterface(object):
             logging.exception(e)
             raise e
 
+        self.queueversion = None    # Version of the queue the client knows, set by GetQueue and GetQueueState
+
 
     def onWSConnect(self):
         self.stream.RegisterCallback(self.onStreamEvent)
@@ -146,8 +160,13 @@ class MusicDBWebSocketInterface(object):
         return success
 
     def onQueueEvent(self, event, data):
-        # This function is called from a different thread. Therefore NO sqlite3-access is allowed.
-        # So there will be just a notification so that the clients can request related functions.
+        # This function is called from a different thread.
+        # When the queue changed, the client gets only the changes since the version of the queue it knows.
+        if event == "QueueChanged":
+            data = self.GetQueueDelta()
+            if data == None:
+                return True # Nothing new for this client
+
         response    = {}
         response["method"]      = "notification"
         response["fncname"]     = "MusicDB:Queue"
@@ -158,6 +177,120 @@ class MusicDBWebSocketInterface(object):
         return success
 
 
+    def GetQueueDelta(self):
+        """
+        This method returns the changes of the song queue since the version the client knows.
+        It gets called on the ``QueueChanged`` event of the song queue to create the argument of the ``onQueueChanged`` notification.
+        The known version gets set by :meth:`~GetQueue` and :meth:`~GetQueueState`, and gets updated by this method.
+
+        The returned dictionary has the following entries:
+
+            * **version:** The current version of the queue
+            * **changes:** A list of changes (see below) that lead from the version known by the client to the current version
+            * **resync:** ``True`` if the changes are not available. Then there is no *changes* entry and the client must call :meth:`~GetQueueState`.
+
+        Each change is a dictionary with the entries **version**, the version of the queue after the change, and **operation**.
+        Depending on the operation, the change has further entries.
+        All entry IDs are strings, like in :meth:`~GetQueue`.
+
+            * ``"insert"``: A new entry got inserted behind the entry **afterid**, or at the beginning if **afterid** is ``null``.
+              The entry is given as **entry** with the same content as an entry returned by :meth:`~GetQueue`
+            * ``"remove"``: The entry **entryid** got removed
+            * ``"move"``: The entry **entryid** got moved behind the entry **afterid**
+            * ``"advance"``: The first entry **entryid** got removed because the next song gets played
+
+        The changes are created only once for all clients (see :meth:`mdbapi.songqueue.SongQueue.GetQueueChanges`).
+        A client should ignore changes with a version it already knows,
+        and must call :meth:`~GetQueueState` if the version of the first new change is not the next version of the queue it knows.
+
+        Returns:
+            A dictionary as described above, or ``None`` if the client already knows the current queue
+
+        Example:
+            .. code-block:: javascript
+
+                MusicDB_Request("GetQueueState", "ShowQueue");
+
+                // …
+
+                function onMusicDBNotification(fnc, sig, data)
+                {
+                    if(fnc == "MusicDB:Queue" && sig == "onQueueChanged")
+                    {
+                        if(data.resync)
+                            MusicDB_Request("GetQueueState", "ShowQueue");
+                        else
+                            for(let change of data.changes)
+                                console.log(change.operation + " " + change.entryid);
+                    }
+                }
+        """
+        if self.queueversion == None:
+            version, queue = self.queue.GetVersionedQueue()
+            self.queueversion = version
+            return {"version": version, "resync": True}
+
+        result = self.queue.GetQueueChanges(self.queueversion)
+        if result == None:
+            version, queue = self.queue.GetVersionedQueue()
+            self.queueversion = version
+            return {"version": version, "resync": True}
+
+        version, changes = result
+        if not changes:
+            return None
+
+        deltas = self.__GetQueueDeltas(changes)
+        if deltas == None:
+            self.queueversion = version
+            return {"version": version, "resync": True}
+
+        self.queueversion = version
+        return {"version": version, "changes": deltas}
+
+
+    def __GetQueueDeltas(self, changes):
+        # Translates the changes from SongQueue.GetQueueChanges into the changes sent to the clients.
+        # Already translated changes get reused. Returns None if an inserted song does not exist.
+        global QueueDeltasLock
+        global QueueDeltas
+        global QueueViewLock
+        global QueueView
+
+        with QueueDeltasLock:
+            missing = [(version, change) for version, change in changes if version not in QueueDeltas]
+            if missing:
+                inserts = [(change[1], change[2]) for version, change in missing if change[0] == "insert"]
+                entries = self.__GetQueueEntries(inserts)
+
+                for version, change in missing:
+                    delta = {}
+                    delta["version"]   = version
+                    delta["operation"] = change[0]
+                    delta["entryid"]   = str(change[1]) if change[1] != None else None
+                    if change[0] == "insert":
+                        delta["afterid"] = str(change[3]) if change[3] != None else None
+                        delta["entry"]   = entries.get(change[1])
+                        if delta["entry"] == None:
+                            return None
+                    elif change[0] == "move":
+                        delta["afterid"] = str(change[2])
+                    QueueDeltas[version] = delta
+
+                # Entries that left the queue get dropped from the view
+                with QueueViewLock:
+                    for version, change in missing:
+                        if change[0] in ["remove", "advance"]:
+                            QueueView["entries"].pop(change[1], None)
+
+                # Only changes that can still be requested from the song queue are needed
+                latest = changes[-1][0]
+                for version in [v for v in QueueDeltas if v <= latest - QUEUECHANGES_MAXLEN]:
+                    del QueueDeltas[version]
+
+            return [QueueDeltas[version] for version, change in changes]
+
+
     def HandleCall(self, fncname, method, fncsig, args, passthrough):
         retval = None
 
@@ -190,6 +323,8 @@ class MusicDBWebSocketInterface(object):
             retval = self.GetStreamState()
         elif fncname == "GetQueue":
             retval = self.GetQueue()
+        elif fncname == "GetQueueState":
+            retval = self.GetQueueState()
         elif fncname == "Find":
             retval = self.Find(args["searchstring"], args["limit"])
         elif fncname == "GetSongRelationship":
@@ -450,9 +585,10 @@ class MusicDBWebSocketInterface(object):
             filterset = set(self.mdbstate.GetFilterList())
 
         # assign tags to albums
+        tagmap    = self.database.GetTargetTagsForMany("album", [album["id"] for album in albums])
         albumlist = []
         for album in albums:
-            tags   = self.GetAlbumTags(album["id"])
+            tags   = self.__SortTagsByClass("albumid", album["id"], tagmap.get(album["id"]))
             genres = tags["genres"]
 
             # if no tags are available, show the album!
@@ -497,9 +633,10 @@ class MusicDBWebSocketInterface(object):
             return []
 
         # annotate all songs with additional infos like genre-tags
+        tagmap   = self.database.GetTargetTagsForMany("song", [song["id"] for song in songs])
         songlist = []
         for song in songs:
-            tags = self.GetSongTags(song["id"])
+            tags = self.__SortTagsByClass("songid", song["id"], tagmap.get(song["id"]))
             songentry = {}
             songentry["song"]      = song
             songentry["tags"]      = tags
@@ -724,13 +861,7 @@ class MusicDBWebSocketInterface(object):
                 }
         """
         tags = self.database.GetTargetTags("song", songid)
-        genres, subgenres, moods = self.database.SplitTagsByClass(tags)
-        tags = {}
-        tags["songid"]    = songid  # this is necessary to not loose context
-        tags["genres"]    = genres
-        tags["subgenres"] = subgenres
-        tags["moods"]     = moods
-        return tags
+        return self.__SortTagsByClass("songid", songid, tags)
 
 
     def GetAlbumTags(self, albumid):
@@ -739,9 +870,15 @@ class MusicDBWebSocketInterface(object):
         This method returns the tags for an Album.
         """
         tags = self.database.GetTargetTags("album", albumid)
+        return self.__SortTagsByClass("albumid", albumid, tags)
+
+
+    def __SortTagsByClass(self, idname, targetid, tags):
+        # Creates the dictionary returned by GetSongTags and GetAlbumTags.
+        # Methods that need tags of many songs or albums read them in bulk and use this method directly.
         genres, subgenres, moods = self.database.SplitTagsByClass(tags)
         tags = {}
-        tags["albumid"]   = albumid  # this is necessary to not loose context
+        tags[idname]      = targetid  # this is necessary to not loose context
         tags["genres"]    = genres
         tags["subgenres"] = subgenres
         tags["moods"]     = moods
@@ -813,6 +950,7 @@ class MusicDBWebSocketInterface(object):
         So each client gets informed about the new state.
 
         The category must be ``"albumfilter"``!
+        Changing the filter drops the random songs prefetched by :class:`~mdbapi.randy.Randy`.
 
         Args:
             category (str): Category of the state
@@ -828,6 +966,8 @@ class MusicDBWebSocketInterface(object):
                 MusicDB_Call("SetMDBState", {category:"albumfilter", name:"Metal", value:true});
         """
         self.mdbstate.Set(category, name, value)
+        if category == "albumfilter":
+            self.queue.randy.InvalidatePrefetch()   # Prefetched random songs may not match the new filter
         return None
 
 
@@ -957,6 +1097,17 @@ class MusicDBWebSocketInterface(object):
             * **album:** The related album entry from the database
             * **artist:** The related artist entry from the database
 
+        The entries are kept in a view that is shared by all clients.
+        Only entries that are new in the queue get created,
+        reading their songs, albums and artists with one query via :meth:`lib.db.musicdb.MusicDatabase.GetSongsWithParents`.
+        When a song, album or artist changed (see :meth:`lib.db.musicdb.MusicDatabase.GetInvalidatedEntries`),
+        only the entries that contain it get recreated.
+        Entries of songs that do not exist anymore are not in the returned list.
+
+        The version of the returned queue becomes the version the client knows.
+        Later changes get sent as ``onQueueChanged`` notification as described in :meth:`~GetQueueDelta`.
+        Use :meth:`~GetQueueState` to get the version as well.
+
         Returns:
             A list of song, album and artist information for each song in the song queue
 
@@ -978,27 +1129,114 @@ class MusicDBWebSocketInterface(object):
                     }
                 }
         """
-        entries = self.queue.GetQueue()
+        version, queue = self.__GetVersionedQueue()
+        return queue
+
+
+    def __GetVersionedQueue(self):
+        # Returns the version of the queue and the entries as returned by GetQueue.
+        # The version becomes the version the client knows.
+        version, entries = self.queue.GetVersionedQueue()
+        self.queueversion = version
 
         # return empty list if there is no queue
         if not entries:
-            return []
+            return (version, [])
+
+        view  = self.__GetQueueEntries(entries, prune=True)
+        queue = [view[entryid] for entryid, songid in entries if entryid in view]
+        return (version, queue)
+
+
+    def __GetQueueEntries(self, entries, prune=False):
+        # Returns a dictionary entry ID → entry as returned by GetQueue for the (entryid, songid) tuples in entries.
+        # Entries that are not yet in the view get created and added to the view.
+        # If prune is True, entries is the whole queue and all other entries get dropped from the view.
+        # Entries of songs that do not exist anymore are not in the returned dictionary.
+        global QueueViewLock
+        global QueueView
+
+        with QueueViewLock:
+            # The generations must be read before the entries, so a concurrent change leads to new entries with the next call
+            generations, invalidated = self.database.GetInvalidatedEntries(QueueView["generations"])
+            QueueView["generations"] = generations
+            if invalidated == None:
+                QueueView["entries"] = {}
+            else:
+                # Only entries that contain a changed song, album or artist get dropped
+                for entryid, entry in list(QueueView["entries"].items()):
+                    if (entry["song"]["id"]   in invalidated["song"]
+                     or entry["album"]["id"]  in invalidated["album"]
+                     or entry["artist"]["id"] in invalidated["artist"]):
+                        del QueueView["entries"][entryid]
+            view = QueueView["entries"]
+
+            missing = [songid for entryid, songid in entries if entryid not in view]
+            if missing:
+                songs = self.database.GetSongsWithParents(missing)
+            else:
+                songs = {}
+
+            result = {}
+            for entryid, songid in entries:
+                entry = view.get(entryid)
+                if not entry:
+                    if songid not in songs:
+                        logging.warning("Song %s of the queue does not exist! \033[1;30m(Entry will be ignored)", str(songid))
+                        continue
+                    song, album, artist = songs[songid]
+
+                    entry = {}
+                    entry["entryid"] = str(entryid)
+                    entry["song"]    = song.ToDict()
+                    entry["album"]   = album.ToDict()
+                    entry["artist"]  = artist.ToDict()
+                    view[entryid]    = entry
+
+                result[entryid] = entry
+
+            # Entries that left the queue get dropped
+            if prune:
+                QueueView["entries"] = dict(result)
 
-        queue = []
-        for entryid, songid in entries:
-            song    = self.database.GetSongById(songid)
-            album   = self.database.GetAlbumById(song["albumid"])
-            artist  = self.database.GetArtistById(song["artistid"])
+        return result
 
-            entry = {}
-            entry["entryid"] = str(entryid)
-            entry["song"]    = song
-            entry["album"]   = album
-            entry["artist"]  = artist
 
-            queue.append(entry)
+    def GetQueueState(self):
+        """
+        This method returns the song queue as returned by :meth:`~GetQueue` together with its version.
+        Clients that follow the changes of the queue via the ``onQueueChanged`` notification (see :meth:`~GetQueueDelta`)
+        use this method to get the whole queue when they start or when they missed changes.
+
+        The returned dictionary has the following entries:
 
-        return queue
+            * **version:** The version of the queue
+            * **queue:** The list of entries as returned by :meth:`~GetQueue`
+
+        Returns:
+            A dictionary with the version and the entries of the song queue
+
+        Example:
+            .. code-block:: javascript
+
+                MusicDB_Request("GetQueueState", "ShowQueue");
+
+                // …
+
+                function onMusicDBMessage(fnc, sig, args, pass)
+                {
+                    if(fnc == "GetQueueState" && sig == "ShowQueue")
+                    {
+                        queueversion = args.version;
+                        ShowQueue("RightContentBox", args.queue);
+                    }
+                }
+        """
+        version, queue = self.__GetVersionedQueue()
+        state = {}
+        state["version"] = version
+        state["queue"]   = queue
+        return state
 
 
     def Find(self, searchstring, limit):
@@ -1364,6 +1602,10 @@ class MusicDBWebSocketInterface(object):
         The ``tags`` of that song will also be returned separated into ``genre``, ``subgenre`` and ``mood``.
         See :meth:`~GetSongTags` for details how they are returned.
 
+        The relations get read from the in-memory relation graph (see :doc:`/mdbapi/relationgraph`),
+        so the Tracker Database does not get accessed.
+        The songs are sorted by weight, strongest relation first.
+
         Args:
             songid (int): ID so a song
 
@@ -1390,24 +1632,29 @@ class MusicDBWebSocketInterface(object):
                 }
         """
         # get raw relationship
-        trackerdb = TrackerDatabase(self.cfg.tracker.dbpath)
-        results   = trackerdb.GetRelations("song", songid)
+        results   = self.graph.GetNeighbours("song", songid)
         parentsid = songid  # store for return value
 
         # get all songs
+        tagmap  = self.database.GetTargetTagsForMany("song", [result[0] for result in results])
+        albums  = {}    # related songs are often from the same album or artist
+        artists = {}
         entries = []
-        #for songid in songids:
-        for result in results:
+        for songid, weight in results:
             entry = {}
-            songid = result["id"]
-            weight = result["weight"]
             song   = self.database.GetSongById(songid)
-            tags   = self.GetSongTags(songid)
+            if not song:
+                continue
+            tags   = self.__SortTagsByClass("songid", songid, tagmap.get(songid))
+            if song["albumid"] not in albums:
+                albums[song["albumid"]] = self.database.GetAlbumById(song["albumid"])
+            if song["artistid"] not in artists:
+                artists[song["artistid"]] = self.database.GetArtistById(song["artistid"])
             entry["song"]    = song
             entry["tags"]    = tags
             entry["weight"]  = weight
-            entry["album"]   = self.database.GetAlbumById(song["albumid"])
-            entry["artist"]  = self.database.GetArtistById(song["artistid"])
+            entry["album"]   = albums[song["albumid"]]
+            entry["artist"]  = artists[song["artistid"]]
 
             entries.append(entry)
 
@@ -1465,7 +1712,7 @@ class MusicDBWebSocketInterface(object):
             The songid and a list of cached lyrics.
         """
         # Get names from separate database to be threadsafe
-        musicdb = MusicDatabase(self.cfg.database.path)
+        musicdb = MusicDatabase(self.cfg.database.host, self.cfg.database.port, self.cfg.database.name, self.cfg.database.user, self.cfg.database.password, self.cfg.database.charset, self.cfg.database)
         song   = musicdb.GetSongById(songid)
         album  = musicdb.GetAlbumById(song["albumid"])
         artist = musicdb.GetArtistById(song["artistid"])
@@ -1717,8 +1964,9 @@ class MusicDBWebSocketInterface(object):
             return None
 
         try:
-            trackerdb = TrackerDatabase(self.cfg.tracker.dbpath)
+            trackerdb = TrackerDatabase(self.cfg.tracker.host, self.cfg.tracker.port, self.cfg.tracker.name, self.cfg.tracker.user, self.cfg.tracker.password, self.cfg.tracker.charset, self.cfg.database)
             trackerdb.RemoveSongRelations(self.database, songid, relatedsongid)
+            self.graph.RemoveSongRelations(self.database, songid, relatedsongid)
         except Exception as e:
             logging.warning("Removing song relations failed with error: %s", str(e))
         return None
@@ -28,6 +28,7 @@ import json
 import time
 import traceback
 import logging
+from collections.abc import Mapping
 
 
 class MusicDBWebSocketFactory(WebSocketServerFactory):
@@ -131,6 +132,13 @@ class WebSocket(WebSocketServerProtocol):
 
 
 
+    def __SerializeObject(self, obj):
+        # Rows of the Music Database are mappings, but no dictionaries (see lib.db.records)
+        if isinstance(obj, Mapping):
+            return dict(obj)
+        raise TypeError("Object of type %s is not JSON serializable"%(type(obj).__name__))
+
+
     def SendPacket(self, packet):
         """
         This method sends a packet via to the connected client.
@@ -180,7 +188,7 @@ class WebSocket(WebSocketServerProtocol):
             logging.warning("Socket not conneced! \033[1;30m(message will be discard) %s", str(self))
             return False
 
-        rawdata = json.dumps(packet)
+        rawdata = json.dumps(packet, default=self.__SerializeObject)
         rawdata = rawdata.encode("utf-8")
         
         if not hasattr(self, "state"):
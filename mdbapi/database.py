@@ -28,6 +28,7 @@ from lib.namedpipe      import NamedPipe
 from lib.cfg.musicdb    import MusicDBConfig
 from lib.db.musicdb     import *
 from lib.db.trackerdb   import TrackerDatabase      # To update when a song gets removed
+from mdbapi.relationgraph import RelationGraph      # To update when a song gets removed
 
 
 class MusicDBDatabase(object):
@@ -89,6 +90,7 @@ class MusicDBDatabase(object):
         Entries with invalid paths gets returned in three lists: ``artists, albums, songs``
 
         This method does not check if the song is cached in the Song Cache.
+        The entries get streamed from the database, so only the lost entries are kept in memory.
 
         Returns:
             A three lists of database entries with invalid paths. Empty lists if there is no invalid entrie.
@@ -98,20 +100,17 @@ class MusicDBDatabase(object):
         lostsongs   = []
 
         # Check Artists
-        artists = self.db.GetAllArtists()
-        for artist in artists:
+        for artist in self.db.IterateArtists():
             if not self.fs.IsDirectory(artist["path"]):
                 lostartists.append(artist)
 
         # Check Albums
-        albums = self.db.GetAllAlbums()
-        for album in albums:
+        for album in self.db.IterateAlbums():
             if not self.fs.IsDirectory(album["path"]):
                 lostalbums.append(album)
 
         # Check Songs
-        songs = self.db.GetAllSongs()
-        for song in songs:
+        for song in self.db.IterateSongs():
             if not self.fs.IsFile(song["path"]):
                 lostsongs.append(song)
 
@@ -145,27 +144,26 @@ class MusicDBDatabase(object):
         newsongs   = []
 
         # Check Artists
-        artists          = self.db.GetAllArtists()
-        knownartistpaths = [artist["path"] for artist in artists if self.fs.IsDirectory(artist["path"])]
+        knownartistpaths = [artist["path"] for artist in self.db.IterateArtists() if self.fs.IsDirectory(artist["path"])]
         artistpaths      = self.fs.GetSubdirectories(None, self.ignoreartists)
 
+        knownartistset   = set(knownartistpaths)
         for path in artistpaths:
             path = self.fs.RemoveRoot(path)
-            if path not in knownartistpaths:
+            if path not in knownartistset:
                 newartists.append(path)
 
         # Check Albums
-        albums          = self.db.GetAllAlbums()
-        knownalbumpaths = [album["path"] for album in albums if self.fs.IsDirectory(album["path"])]
+        knownalbumpaths = [album["path"] for album in self.db.IterateAlbums() if self.fs.IsDirectory(album["path"])]
         albumpaths      = self.fs.GetSubdirectories(knownartistpaths, self.ignorealbums)
         
+        knownalbumset   = set(knownalbumpaths)
         for path in albumpaths:
-            if path not in knownalbumpaths:
+            if path not in knownalbumset:
                 newalbums.append(path)
 
         # Check Songs
-        songs           = self.db.GetAllSongs()
-        knownsongpaths  = [song["path"] for song in songs if self.fs.IsFile(song["path"])]
+        knownsongpaths  = {song["path"] for song in self.db.IterateSongs() if self.fs.IsFile(song["path"])}
         songpaths       = self.fs.GetFiles(knownalbumpaths, self.ignoresongs)
 
         for path in songpaths:
@@ -443,11 +441,8 @@ class MusicDBDatabase(object):
         except:
             pass
 
-        artist     = self.db.GetArtistById(artistid)
-        artist["path"] = newpath
-        artist["name"] = os.path.basename(newpath)
-        self.db.WriteArtist(artist)
-
+        # Read the files of all albums before locking the database
+        albumupdates = []
         albums = self.db.GetAlbumsByArtistId(artistid)
         for album in albums:
             albumpath    = album["path"]
@@ -455,7 +450,18 @@ class MusicDBDatabase(object):
             albumpath[0] = newpath
             albumpath    = os.sep.join(albumpath)
             if self.fs.IsDirectory(albumpath):
-                self.UpdateAlbum(album["id"], albumpath)
+                albumupdate, songupdates = self.__CollectAlbumUpdate(album["id"], albumpath)
+                albumupdates.append((album["id"], albumupdate, songupdates))
+
+        # Commit the artist and all its albums and songs at once
+        with MusicDatabaseLock.Write(), self.db.Transaction():
+            artist     = self.db.GetArtistById(artistid)
+            artist["path"] = newpath
+            artist["name"] = os.path.basename(newpath)
+            self.db.WriteArtist(artist)
+
+            for albumid, albumupdate, songupdates in albumupdates:
+                self.__WriteAlbumUpdate(albumid, albumupdate, songupdates)
 
         return None
 
@@ -471,14 +477,15 @@ class MusicDBDatabase(object):
             #. Analyze the path of one of those songs using :meth:`~mdbapi.database.MusicDBDatabase.AnalysePath`
             #. If *artistid* is not given as parameter, it gets read from the database identifying the artist by its path.
             #. Set directory attributes and ownership using :meth:`~mdbapi.database.MusicDBDatabase.FixAttributes`
-            #. Create new entry for the new album in the database and get the default values
-            #. Add each song of the album to the database by calling :meth:`~mdbapi.database.MusicDBDatabase.AddSong`
-            #. Write all collected information of the album into the database
+            #. Collect the information of each song of the album by calling :meth:`~mdbapi.database.MusicDBDatabase.CollectSongInformation`
+            #. Add the album with all its songs and lyrics in one transaction via :meth:`lib.db.musicdb.MusicDatabase.AddFullAlbum`
 
-        If adding the songs to the database raises an exception, that song gets skipped.
+        If collecting the information of a song raises an exception, that song gets skipped.
         The *numofsongs* value for the album is the number of actual existing songs for this album in the database.
         It is save to add the failed song later by using the :meth:`~mdbapi.database.MusicDBDatabase.AddSong` method.
 
+        If writing to the database fails, the whole album gets rolled back and nothing changes in the database.
+
         Args:
             albumpath (str): Absolute path, or path relative to the music root directory, to the album that shall be added to the database.
             artistid (int): Optional, default value is ``None``. The ID of the artist this album belongs to.
@@ -491,6 +498,7 @@ class MusicDBDatabase(object):
             ValueError: If album already exists in the database
             AssertionError: If there is no artist for this album in the database
             AssertionError: If loading metadata from one of the song files failed
+            Exception: If writing the album into the database failed. Nothing was added in this case.
 
         """
         # remove the leading part to the music directory (it may be already removed)
@@ -549,38 +557,40 @@ class MusicDBDatabase(object):
             logging.warning("Fixing file attributes failed with error: %s \033[1;30m(leaving permissions as they are)",
                     str(e))
 
-        # Add Album to database
-        self.db.AddAlbum(artistid, album["name"], album["path"])
-
-        # read the new database entry to get defaults - this is needed by the WriteAlbum-method
-        entry = self.db.GetAlbumByPath(album["path"])
-        album["id"]         = entry["id"]
-        album["artworkpath"]= entry["artworkpath"]
-        album["bgcolor"]    = entry["bgcolor"]
-        album["fgcolor"]    = entry["fgcolor"]
-        album["hlcolor"]    = entry["hlcolor"]
+        # collect all information of the albums songs
+        songs = []
+        for songpath in songpaths:
+            try:
+                song = self.CollectSongInformation(songpath)
+            except Exception as e:
+                logging.exception("CRITICAL ERROR! Reading a song of the new album \"%s\" failed with the exception \"%s\"! \033[1;30m(ignoring that song (%s) and continue with next)", str(album["name"]), str(e), str(songpath))
+                continue
 
-        # update the album entry
-        album["artistid"]   = artistid
+            if song == None:
+                continue
 
-        # now add all the albums songs to the database
-        for songpath in songpaths:
             try:
-                self.AddSong(songpath, artistid, album["id"])
+                self.FixAttributes(song["path"])
             except Exception as e:
-                logging.exception("CRITICAL ERROR! Adding a song to the new added album \"%s\" failed with the exception \"%s\"! \033[1;30m(ignoring that song (%s) and continue with next)", str(album["name"]), str(e), str(songpath))
+                logging.warning("Fixing file attributes failed with error: %s \033[1;30m(leaving permissions as they are)",
+                        str(e))
+
+            song["artistid"] = artistid
+            if song["lyrics"]:
+                song["lyricsstate"] = SONG_LYRICSSTATE_FROMFILE
+            songs.append(song)
 
-        # get some final information after adding the songs
-        songs = self.db.GetSongsByAlbumId(album["id"])
         numofcds = 0
         for song in songs:
             if song["cd"] > numofcds:
                 numofcds = song["cd"]
 
+        album["artistid"]   = artistid
         album["numofsongs"] = len(songs)
         album["numofcds"]   = numofcds
 
-        self.db.WriteAlbum(album)
+        # Add album and songs to database - all or nothing
+        self.db.AddFullAlbum(album, songs)
         return None
 
 
@@ -616,12 +626,26 @@ class MusicDBDatabase(object):
         Raises:
             AssertionError: When the new path is invalid
         """
-        album = self.db.GetAlbumById(albumid)
         try:
             newpath = self.fs.RemoveRoot(newpath) # remove the path to the musicdirectory
         except:
             pass
 
+        # Read the files before locking the database
+        albumupdate, songupdates = self.__CollectAlbumUpdate(albumid, newpath)
+
+        # Commit the album and all its songs at once
+        with MusicDatabaseLock.Write(), self.db.Transaction():
+            self.__WriteAlbumUpdate(albumid, albumupdate, songupdates)
+
+        return None
+
+
+    def __CollectAlbumUpdate(self, albumid, newpath):
+        # Reads the meta data of the album and the checksums of its songs.
+        # Returns the changed album entries and a list of (songid, changed song entries).
+        # Nothing gets written, so the database does not need to be locked while the files get read.
+        album = {}
         album["path"] = newpath
 
         # get all songs from the albums - this is important to collect all infos for the album entry
@@ -637,8 +661,8 @@ class MusicDBDatabase(object):
         album["name"]    = fsmeta["album"]
         album["release"] = fsmeta["release"]
         album["origin"]  = tagmeta["origin"]
-        self.db.WriteAlbum(album)
 
+        songupdates = []
         songs = self.db.GetSongsByAlbumId(albumid)
         for song in songs:
             songpath    = song["path"]
@@ -652,9 +676,77 @@ class MusicDBDatabase(object):
             # It may faile because not only the albumname changed,
             # but also the files inside
             if self.fs.IsFile(songpath):
-                self.UpdateSong(song["id"], songpath)
+                songupdates.append((song["id"], self.__CollectSongUpdate(songpath)))
 
-        return None
+        return album, songupdates
+
+
+    def __WriteAlbumUpdate(self, albumid, albumupdate, songupdates):
+        # Writes the entries collected by __CollectAlbumUpdate.
+        # The caller must hold the write lock.
+        album = self.db.GetAlbumById(albumid)
+        for key, value in albumupdate.items():
+            album[key] = value
+        self.db.WriteAlbum(album)
+
+        for songid, songupdate in songupdates:
+            self.__WriteSongUpdate(songid, songupdate)
+
+
+
+    def CollectSongInformation(self, songpath):
+        """
+        This method collects all information for a new song entry from the song file and its path.
+        The returned dictionary has all keys of a MusicDB Song entry except ``id``.
+        The ``artistid`` and ``albumid`` entries are set to ``None``.
+        Additionally, there is the key ``"lyrics"`` with the lyrics from the files meta data, or ``None``.
+
+        Args:
+            songpath (str): Path of the song relative to the music root directory
+
+        Returns:
+            A song dictionary, or ``None`` if the file is not a valid song file
+
+        Raises:
+            AssertionError: If analyzing the path fails
+        """
+        try:
+            self.meta.Load(songpath)
+        except Exception:
+            logging.debug("Metadata of file %s cannot be load. Assuming this is not a song file!", str(songpath))
+            return None
+
+        tagmeta = self.meta.GetAllMetadata()
+        fsmeta  = self.AnalysePath(songpath)
+        if fsmeta == None:
+            raise AssertionError("Invalid path-format: " + songpath)
+
+        # Collect all data needed for the song-entry (except the song ID)
+        # Remember! The filesystem is always right
+        song = {}
+        song["artistid"]    = None
+        song["albumid"]     = None
+        song["path"]        = songpath
+        song["number"]      = fsmeta["songnumber"]
+        song["cd"]          = fsmeta["cdnumber"]
+        song["disabled"]    = 0
+        song["playtime"]    = tagmeta["playtime"]
+        song["bitrate"]     = tagmeta["bitrate"]
+        song["likes"]       = 0
+        song["dislikes"]    = 0
+        song["qskips"]      = 0
+        song["qadds"]       = 0
+        song["qremoves"]    = 0
+        song["favorite"]    = 0
+        song["qrndadds"]    = 0
+        song["lyricsstate"] = SONG_LYRICSSTATE_EMPTY
+        song["checksum"]    = self.fs.Checksum(songpath)
+        song["lastplayed"]  = 0
+        song["lyrics"]      = tagmeta["lyrics"]
+
+        # FIX: THE FILESYSTEM IS _ALWAYS_ RIGHT! - WHAT THE FUCK!
+        song["name"] = fsmeta["song"] 
+        return song
 
 
 
@@ -703,42 +795,14 @@ class MusicDBDatabase(object):
             raise ValueError("Song \"" + song["name"] + "\" does already exist in the database.")
 
         # Get all information from the songpath and its meta data
-        try:
-            self.meta.Load(songpath)
-        except Exception:
-            logging.debug("Metadata of file %s cannot be load. Assuming this is not a song file!", str(songpath))
+        song = self.CollectSongInformation(songpath)
+        if song == None:
             # Ignore this file, it is not a valid song file
             return None
 
-        tagmeta = self.meta.GetAllMetadata()
-        fsmeta  = self.AnalysePath(songpath)
-        if fsmeta == None:
-            raise AssertionError("Invalid path-format: " + songpath)
-
-        # Collect all data needed for the song-entry (except the song ID)
-        # Remember! The filesystem is always right
-        song = {}
+        fsmeta = self.AnalysePath(songpath)
         song["artistid"]    = artistid # \_ In case they are None yet, they will be updated later in the code
         song["albumid"]     = albumid  # /
-        song["path"]        = songpath
-        song["number"]      = fsmeta["songnumber"]
-        song["cd"]          = fsmeta["cdnumber"]
-        song["disabled"]    = 0
-        song["playtime"]    = tagmeta["playtime"]
-        song["bitrate"]     = tagmeta["bitrate"]
-        song["likes"]       = 0
-        song["dislikes"]    = 0
-        song["qskips"]      = 0
-        song["qadds"]       = 0
-        song["qremoves"]    = 0
-        song["favorite"]    = 0
-        song["qrndadds"]    = 0
-        song["lyricsstate"] = SONG_LYRICSSTATE_EMPTY
-        song["checksum"]    = self.fs.Checksum(songpath)
-        song["lastplayed"]  = 0
-
-        # FIX: THE FILESYSTEM IS _ALWAYS_ RIGHT! - WHAT THE FUCK!
-        song["name"] = fsmeta["song"] 
 
         # artistid may be not given by the arguments of this method.
         # In this case, it must be searched in the database
@@ -778,21 +842,23 @@ class MusicDBDatabase(object):
             logging.warning("Fixing file attributes failed with error: %s \033[1;30m(leaving permissions as they are)",
                     str(e))
 
-        # add to database
-        retval = self.db.AddFullSong(song)
-        if retval == False:
-            raise AssertionError("Adding song %s failed!", song["path"])
+        # Commit the song, the album update and the lyrics at once
+        with MusicDatabaseLock.Write(), self.db.Transaction():
+            # add to database
+            retval = self.db.AddFullSong(song)
+            if retval == False:
+                raise AssertionError("Adding song %s failed!", song["path"])
 
-        if newalbumentry:
-            self.db.WriteAlbum(newalbumentry)
+            if newalbumentry:
+                self.db.WriteAlbum(newalbumentry)
 
-        # Add lyrics for this song
-        if tagmeta["lyrics"] != None:
-            try:
-                self.db.SetLyrics(song["id"], tagmeta["lyrics"], SONG_LYRICSSTATE_FROMFILE)
-            except Exception as e:
-                logging.warning("Adding lyrics for song %s failed with error \"%s\". \033[1;30m(Does not break anything)",
-                        song["name"], str(e))
+            # Add lyrics for this song
+            if song["lyrics"] != None:
+                try:
+                    self.db.SetLyrics(song["id"], song["lyrics"], SONG_LYRICSSTATE_FROMFILE)
+                except Exception as e:
+                    logging.warning("Adding lyrics for song %s failed with error \"%s\". \033[1;30m(Does not break anything)",
+                            song["name"], str(e))
 
         return None
 
@@ -838,14 +904,24 @@ class MusicDBDatabase(object):
             newpath = self.fs.RemoveRoot(newpath) # remove the path to the musicdirectory
         except:
             pass
-        song     = self.db.GetSongById(songid)
-        songpath = newpath
 
-        # Get all information from the songpath and its meta data
+        # Read the file before locking the database
+        songupdate = self.__CollectSongUpdate(newpath)
+
+        # Commit the song and its album at once
+        with MusicDatabaseLock.Write(), self.db.Transaction():
+            self.__WriteSongUpdate(songid, songupdate)
+        return None
+
+
+    def __CollectSongUpdate(self, songpath):
+        # Reads the meta data and the checksum of a song file.
+        # Returns the changed song entries.
+        # Nothing gets written, so the database does not need to be locked while the file gets read.
         try:
             self.meta.Load(songpath)
         except Exception as e:
-            logging.excpetion("Metadata of file %s cannot be load. Error: %s", str(songpath), str(e))
+            logging.exception("Metadata of file %s cannot be load. Error: %s", str(songpath), str(e))
             raise e
 
         tagmeta = self.meta.GetAllMetadata()
@@ -854,6 +930,7 @@ class MusicDBDatabase(object):
             raise AssertionError("Invalid path-format: " + songpath)
 
         # Remember! The filesystem is always right
+        song = {}
         song["path"]     = songpath
         song["name"]     = fsmeta["song"] 
         song["number"]   = fsmeta["songnumber"]
@@ -861,7 +938,15 @@ class MusicDBDatabase(object):
         song["playtime"] = tagmeta["playtime"]
         song["bitrate"]  = tagmeta["bitrate"]
         song["checksum"] = self.fs.Checksum(songpath)
+        return song
 
+
+    def __WriteSongUpdate(self, songid, songupdate):
+        # Writes the entries collected by __CollectSongUpdate and fixes the album information.
+        # The caller must hold the write lock.
+        song = self.db.GetSongById(songid)
+        for key, value in songupdate.items():
+            song[key] = value
         self.db.WriteSong(song)
 
         # Fix album information
@@ -875,7 +960,6 @@ class MusicDBDatabase(object):
         album["numofsongs"] = len(songs)
         album["numofcds"]   = numofcds
         self.db.WriteAlbum(album)
-        return None
 
 
 
@@ -897,12 +981,14 @@ class MusicDBDatabase(object):
         Return:
             ``None``
         """
-        tracker = TrackerDatabase(self.cfg.tracker.dbpath)
+        tracker = TrackerDatabase(self.cfg.tracker.host, self.cfg.tracker.port, self.cfg.tracker.name, self.cfg.tracker.user, self.cfg.tracker.password, self.cfg.tracker.charset, self.cfg.database)
 
         # remove from music.db
         self.db.RemoveSong(songid)
         # remove from tracker.db
         tracker.RemoveSong(songid)
+        # remove from the relation graph, if it is loaded in this process
+        RelationGraph(self.cfg).RemoveNode("song", songid)
 
         return None
 
@@ -929,10 +1015,12 @@ class MusicDBDatabase(object):
         Return:
             ``None``
         """
-        songs = self.db.GetSongsByAlbumId(albumid)
-        for song in songs:
-            self.RemoveSong(song["id"])
-        self.db.RemoveAlbum(albumid)
+        # Commit the removal of all songs and the album at once
+        with MusicDatabaseLock.Write(), self.db.Transaction():
+            songs = self.db.GetSongsByAlbumId(albumid)
+            for song in songs:
+                self.RemoveSong(song["id"])
+            self.db.RemoveAlbum(albumid)
         return None
 
 
@@ -958,10 +1046,12 @@ class MusicDBDatabase(object):
         Return:
             ``None``
         """
-        albums = self.db.GetAlbumsByArtistId(artistid)
-        for album in albums:
-            self.RemoveAlbum(album["id"])
-        self.db.RemoveArtist(artistid)
+        # Commit the removal of all albums and the artist at once
+        with MusicDatabaseLock.Write(), self.db.Transaction():
+            albums = self.db.GetAlbumsByArtistId(artistid)
+            for album in albums:
+                self.RemoveAlbum(album["id"])
+            self.db.RemoveArtist(artistid)
         return None
 
 
@@ -42,7 +42,7 @@ class Lycra(object):
         logging.debug("Crawler path is %s", CRAWLERPATH)
 
         self.config     = config
-        self.lycradb    = LycraDatabase(self.config.lycra.dbpath)
+        self.lycradb    = LycraDatabase(self.config.lycra.host, self.config.lycra.port, self.config.lycra.name, self.config.lycra.user, self.config.lycra.password, self.config.lycra.charset, self.config.database)
         self.fs         = Filesystem(CRAWLERPATH)
         self.crawlers   = None
 
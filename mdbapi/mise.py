@@ -90,15 +90,10 @@ class MusicDBMicroSearchEngine(object):
         """
         t_start = datetime.datetime.now()
 
-        # 1. get all data from the database
-        artists = self.db.GetAllArtists()
-        albums  = self.db.GetAllAlbums()
-        songs   = self.db.GetAllSongs()
-
-        # 2. build caches
-        self.artistcache = self.__BuildCache(artists)
-        self.albumcache  = self.__BuildCache(albums)
-        self.songcache   = self.__BuildCache(songs)
+        # Build caches while streaming the data from the database
+        self.artistcache = self.__BuildCache(self.db.IterateArtists())
+        self.albumcache  = self.__BuildCache(self.db.IterateAlbums())
+        self.songcache   = self.__BuildCache(self.db.IterateSongs())
 
         t_stop = datetime.datetime.now()
         logging.debug("Updating MiSE caches took %s.", str(t_stop - t_start))
@@ -107,24 +102,21 @@ class MusicDBMicroSearchEngine(object):
 
 
 
-    # data has to be a list of dicts with "id" and "name" as elements
+    # data has to be an iterable of dicts with "id" and "name" as elements
     def __BuildCache(self, data):
-        # first, sort the data
-        data = sorted(data, key = lambda k: k["name"].lower())
-
-        # now create a cache with the id and the normalized name
+        # create a cache with the id and the normalized name
+        # only the names are kept, not the whole entries
         cache = []
         for item in data:
             itemname = item["name"]
             itemid   = item["id"]
 
             # optimize name to make it faulttollerant
-            itemname = self.NormalizeString(itemname)
-
-            # add to cache
-            cache.append((itemname, itemid))
+            cache.append((item["name"].lower(), self.NormalizeString(itemname), itemid))
 
-        return cache
+        # sort by name, then remove the sort key
+        cache.sort(key = lambda k: k[0])
+        return [(itemname, itemid) for _, itemname, itemid in cache]
 
 
 
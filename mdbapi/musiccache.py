@@ -185,12 +185,12 @@ class MusicCache(object):
 
         Args:
             cartistpaths (list): a list of artist directories in the cache
-            mdbartists (list): A list of artist rows from the Music Database
+            mdbartists: A list or iterator (:meth:`lib.db.musicdb.MusicDatabase.IterateArtists`) of artist rows from the Music Database
 
         Returns:
             *Nothing*
         """
-        artistids = [artist["id"] for artist in mdbartists]
+        artistids = {artist["id"] for artist in mdbartists}
         cachedids = [int(path)    for path   in cartistpaths]
 
         for cachedid in cachedids:
@@ -206,13 +206,13 @@ class MusicCache(object):
 
         Args:
             calbumpaths (list): a list of album directories in the cache (scheme: "ArtistID/AlbumID")
-            mdbalbums (list): A list of album rows from the Music Database
+            mdbalbums: A list or iterator (:meth:`lib.db.musicdb.MusicDatabase.IterateAlbums`) of album rows from the Music Database
 
         Returns:
             *Nothing*
         """
         # create "artistid/albumid" paths
-        validpaths = [os.path.join(str(album["artistid"]), str(album["id"])) for album in mdbalbums]
+        validpaths = {os.path.join(str(album["artistid"]), str(album["id"])) for album in mdbalbums}
 
         for cachedpath in calbumpaths:
             if cachedpath not in validpaths:
@@ -227,17 +227,17 @@ class MusicCache(object):
 
         Args:
             csongpaths (list): a list of song files in the cache (scheme: "ArtistID/AlbumID/SongID:Checksum.mp3")
-            mdbsongs (list): A list of song rows from the Music Database
+            mdbsongs: A list or iterator (:meth:`lib.db.musicdb.MusicDatabase.IterateSongs`) of song rows from the Music Database
 
         Returns:
             *Nothing*
         """
         # create song paths
-        validpaths = []
+        validpaths = set()
         for song in mdbsongs:
             path = self.GetSongPath(song)
             if path:
-                validpaths.append(path)
+                validpaths.add(path)
 
         for cachedpath in csongpaths:
             if cachedpath not in validpaths:
@@ -51,26 +51,27 @@ The blacklists get maintained by the :class:`~Randy` class.
 Each instance of this class accesses the same global blacklist.
 
 The blacklist is implemented as a dictionary with the keys ``"songs"``, ``"albums"`` and ``"artists"``.
-Their values are lists holding the IDs of the songs, albums and artists.
+Their values are :class:`~BlacklistRing` objects holding the IDs of the songs, albums and artists.
+Pushing an ID and checking if an ID is on a blacklist takes constant time.
+
+The blacklists get stored in the MusicDB State Directory (see :meth:`lib.cfg.mdbstate.MDBState.SaveBlacklists`).
+To not block the caller of :meth:`~Randy.AddSongToBlacklist` by writing files,
+the blacklists get written by a background timer *BLACKLIST_SAVEDELAY* seconds after the first change.
+All changes in the meantime get written together.
+When the server shuts down, :func:`~SaveBlacklists` must be called to store the latest changes.
 
 Song Selection Algorithm
 ------------------------
 
 Selecting a random song is done in two stages, the `Database Stage`_ and the `Blacklist Stage`_
-The first stage selects a song from a limited set of songs, the second stage checks if the song is on a blacklist.
-In each stage, a song can be rejected and the algorithm starts at the beginning.
-
-
-.. warning::
-
-    The process of trying to get a good song gets repeated until a good song is found.
-    If over constraint, this ends in an infinite loop!
+The first stage creates the set of possible songs, the *candidate pool*.
+The second stage draws songs from this pool until one is found that is not on a blacklist.
 
 
 Database Stage
 ^^^^^^^^^^^^^^
 
-In the first stage, a song gets chosen by the database via :meth:`lib.db.musicdb.MusicDatabase.GetRandomSong`.
+In the first stage, the candidate pool gets created out of the candidates of :meth:`lib.db.musicdb.MusicDatabase.GetRandomCandidates`.
 There are 4 parameters that define the constraints applied on set of possible songs:
 
     - The activated genres as maintained by the :mod:`lib.cfg.mdbstate` module.
@@ -87,34 +88,271 @@ Some of them can be configured in the MusicDB configuration file:
         nohated=True
         minsonglen=120
 
-Because the database only takes album tags into account, the song tags gets checked afterwards.
-If the song has a confirmed genre tag, and if this tag does not match the filter, the song gets rejected.
+Because the database only takes album tags into account, the song tags get checked as well.
+If the song has a confirmed genre tag, and if this tag does not match the filter, the song does not get into the pool.
 Song genres set by the Music AI (see :doc:`/mdbapi/musicai`) will be ignored because the AI may be wrong.
 
+The pool holds the song ID, album ID and artist ID of each song.
+It gets kept in memory for each genre filter and is shared by all instances of the :class:`~Randy` class.
+A pool gets recreated when the genre filter changes,
+or when the candidates of the database got invalidated because songs or tags changed
+(see :meth:`lib.db.musicdb.MusicDatabase.GetRandomCandidatesGeneration`).
+
 
 Blacklist Stage
 ^^^^^^^^^^^^^^^
 
-The selected song from the first stage now gets compared to the three blacklists.
+In the second stage, songs get drawn from the pool *without replacement* and compared to the three blacklists.
 If the song, or its album or artist, is listed in one of blacklist, 
 then the song, a song from the same album or from the same artist was played recently.
-So, the chosen song gets dropped and the finding-process starts again.
+So, the drawn song gets dropped and the next one gets drawn.
+A dropped song cannot be drawn again, so each song of the pool gets checked at most once.
+Because the pool contains the album and artist IDs, no database access is necessary for these checks.
+
+If all songs of the pool are on a blacklist, the blacklists get ignored and a random song of the pool gets chosen.
 
 Is the blacklist length set to 0, the specific blacklist is disabled
 
 If a song is found. The oldest entries of the blacklist get dropped, and the new song, album, artist get pushed on top of the list.
+
+
+Weighted Mode
+-------------
+
+In *weighted mode*, the `Blacklist Stage`_ does not draw each song of the pool with the same probability.
+Instead, the probability of a song is proportional to a weight derived from its statistics:
+
+    * Loved songs get multiplied by *favoriteweight*, hated songs get divided by it
+    * The ratio of likes and dislikes: ``sqrt((likes + 1) / (dislikes + 1))``
+    * An exponential recency decay: ``1 - 2^(-age / halflife)``,
+      with *age* being the time since the song was played the last time.
+      So a song that was just played is unlikely to be chosen again, and regains half of its weight after *recencyhalflife* days.
+
+    .. code-block:: ini
+
+        [Randy]
+        mode=weighted
+        favoriteweight=2.0
+        recencyhalflife=30
+
+This mode requires the ``numpy`` module.
+The statistics of all songs of a pool get read once with :meth:`lib.db.musicdb.MusicDatabase.GetSongStatistics`
+and are stored as ``numpy`` arrays next to the pool.
+Drawing a song is a binary search on the cumulative sum of the weights.
+When the statistics of songs change, only their weights get updated (see :meth:`lib.db.musicdb.MusicDatabase.GetSongStatisticChanges`).
+The recency of all songs gets updated every hour.
+
+Songs on a blacklist get dropped like in uniform mode.
+If too many drawn songs are on a blacklist, the song gets drawn uniformly.
+
+
+Prefetching
+-----------
+
+To keep the database out of the path of :meth:`~Randy.GetSong`, a background thread keeps a small buffer of random songs.
+These songs already passed the `Database Stage`_ and the `Blacklist Stage`_.
+The size of the buffer can be configured:
+
+    .. code-block:: ini
+
+        [Randy]
+        prefetch=3
+
+When set to ``0``, prefetching is disabled.
+
+A prefetched song gets checked against the blacklists again when it gets taken,
+because the blacklists may have changed in the meantime.
+The whole buffer gets dropped when the genre filter or the candidates of the database changed,
+or when :meth:`~Randy.InvalidatePrefetch` gets called.
+If there is no valid prefetched song, the song gets selected the usual way.
+The hit rate of the buffer can be read via :meth:`~Randy.GetPrefetchStatistics`.
+
+
+Relation Mode
+-------------
+
+By default, Randy chooses each song uniformly from the set of possible songs.
+In *relation mode*, the next song gets chosen from the songs that were played together with the previous song.
+The relations are tracked by the :class:`~mdbapi.tracker.Tracker` (see :doc:`/mdbapi/tracker`).
+The probability of a related song to get chosen is proportional to the weight of the relation.
+
+    .. code-block:: ini
+
+        [Randy]
+        mode=relations
+        neighbours=20
+        neighbourrefresh=600
+
+To keep the Tracker Database out of the song selection, Randy uses a global *neighbour table*.
+For each song it holds the IDs of the *neighbours* strongest related songs that fulfill the constraints of the `Database Stage`_,
+and the cumulative weights of the relations.
+So selecting a related song is a binary search on a short list.
+
+The table gets created out of the in-memory relation graph (see :doc:`/mdbapi/relationgraph`) and the candidate list of
+:meth:`lib.db.musicdb.MusicDatabase.GetRandomCandidates`.
+The table gets always recreated in a background thread, so that choosing a song never waits for it.
+When the genre filter, the constraints or the candidates changed
+(see :meth:`lib.db.musicdb.MusicDatabase.GetRandomCandidatesGeneration`),
+the table does not get used until it was recreated. Meanwhile the songs get chosen the usual way.
+Otherwise it gets recreated every *neighbourrefresh* seconds, so that new relations get considered.
+Meanwhile the old table gets used.
+
+A related song must still pass the genre check of the song tags and the `Blacklist Stage`_.
+If the previous song has no related songs, or none of them passes the checks,
+a song gets chosen the usual way as described in `Song Selection Algorithm`_.
 """
 
 import logging
 import threading        # for Lock
 import datetime
+import random
+import time
+from array              import array
+from bisect             import bisect_right
+from itertools          import accumulate
+from collections        import deque
 from lib.cfg.musicdb    import MusicDBConfig
 from lib.db.musicdb     import MusicDatabase
 from lib.cfg.mdbstate   import MDBState
+from mdbapi.relationgraph import RelationGraph
+
+try:
+    import numpy
+except ModuleNotFoundError:
+    NumpyFound = False
+else:
+    NumpyFound = True
 
 BlacklistLock = threading.Lock()
 Blacklist     = None
 
+BlacklistSaveLock   = threading.Lock()     # Serializes writing the blacklist files
+BlacklistWriter     = {"timer": None, "mdbstate": None, "version": 0, "saved": 0}  # Protected by BlacklistLock
+BLACKLIST_SAVEDELAY = 5     # Seconds to wait for further changes before the blacklists get written
+
+CandidatePoolsLock = threading.Lock()
+CandidatePools     = {}     # constraints → {"generation": …, "songs": array, "albums": array, "artists": array}
+CANDIDATEPOOLS_MAXSETS = 8  # Maximum number of cached genre filters
+
+WeightsLock       = threading.Lock()    # Protects the weights of all candidate pools
+WEIGHTS_MAXAGE    = 3600    # Seconds after that the recency of all weights gets updated
+WEIGHTS_MINRECENCY= 0.01    # Minimum recency factor, so that recently played songs do not get a weight of 0
+WEIGHTED_MAXDRAWS = 100     # Weighted draws before falling back to uniform draws
+
+PrefetchCondition = threading.Condition()
+Prefetch          = None    # {"key": constraints, "generation": candidates generation, "songs": deque of (songid, albumid, artistid)}
+PrefetchThread    = None
+PrefetchStats     = {"hits": 0, "misses": 0, "stale": 0, "invalidations": 0, "prefetched": 0}
+
+NeighbourTableLock   = threading.Lock()
+NeighbourTable       = None # {"key": constraints, "generation": candidates generation, "timestamp": creation time, "songs": {songid: (songids, cumweights)}}
+NeighbourTableThread = None # Thread that recreates the table in background
+
+
+
+class BlacklistRing(object):
+    """
+    This class implements a FIFO of fixed size with a constant time membership test.
+    The FIFO is a ring buffer that is always full.
+    Initially it is filled with ``None`` entries.
+    Pushing a new entry drops the oldest one.
+
+    Beside the ring buffer, the number of occurrences of each entry gets counted.
+    So ``entry in ring`` does not need to search the buffer.
+
+    Args:
+        size (int): Number of entries of the ring buffer
+        entries: Optional list of entries to push, oldest first. Only the last *size* entries remain.
+    """
+
+    def __init__(self, size, entries=None):
+        self.ring   = deque([None] * size, maxlen=size)
+        self.counts = {None: size} if size > 0 else {}
+        if size > 0 and entries:
+            for entry in entries[-size:]:
+                self.Push(entry)
+
+
+    def Push(self, entry):
+        """
+        Appends an entry to the ring buffer and drops the oldest one.
+        If the size of the ring buffer is ``0``, nothing happens.
+
+        Args:
+            entry: The entry to push, usually an ID
+
+        Returns:
+            *Nothing*
+        """
+        if not self.ring.maxlen:
+            return
+
+        dropped = self.ring[0]
+        count   = self.counts[dropped] - 1
+        if count > 0:
+            self.counts[dropped] = count
+        else:
+            del self.counts[dropped]
+
+        self.ring.append(entry)
+        self.counts[entry] = self.counts.get(entry, 0) + 1
+
+
+    def ToSet(self):
+        """
+        Returns:
+            A new set with all entries of the ring buffer
+        """
+        return set(self.counts)
+
+
+    def __contains__(self, entry):
+        return entry in self.counts
+
+
+    def __iter__(self):
+        return iter(self.ring)
+
+
+    def __len__(self):
+        return len(self.ring)
+
+
+
+def SaveBlacklists():
+    """
+    This function writes the blacklists into the MusicDB State Directory if they changed since they were written the last time.
+    Usually this is done by a background timer after :meth:`Randy.AddSongToBlacklist` was called.
+    This function must be called when the server shuts down, so that the latest changes do not get lost.
+
+    Returns:
+        *Nothing*
+    """
+    global BlacklistLock
+    global Blacklist
+    global BlacklistSaveLock
+    global BlacklistWriter
+
+    with BlacklistSaveLock:
+        with BlacklistLock:
+            if BlacklistWriter["timer"]:
+                BlacklistWriter["timer"].cancel()
+                BlacklistWriter["timer"] = None
+
+            if not Blacklist or BlacklistWriter["version"] == BlacklistWriter["saved"]:
+                return
+
+            version  = BlacklistWriter["version"]
+            mdbstate = BlacklistWriter["mdbstate"]
+            lists    = {key: list(Blacklist[key]) for key in Blacklist}
+
+        try:
+            mdbstate.SaveBlacklists(lists)
+        except Exception as e:
+            logging.error("Saving the blacklists failed with error: \"%s\"!", str(e))
+            return
+        BlacklistWriter["saved"] = version
+
 
 
 class Randy(object):
@@ -148,6 +386,17 @@ class Randy(object):
         self.songbllen   = self.cfg.randy.songbllen
         self.albumbllen  = self.cfg.randy.albumbllen
         self.artistbllen = self.cfg.randy.artistbllen
+        self.mode        = self.cfg.randy.mode
+        self.neighbours  = self.cfg.randy.neighbours
+        self.refresh     = self.cfg.randy.neighbourrefresh
+        self.prefetch    = self.cfg.randy.prefetch
+        self.favoriteweight  = self.cfg.randy.favoriteweight
+        self.halflife        = self.cfg.randy.recencyhalflife
+        self.lastdraws       = 0    # Number of songs drawn from the pool by the last GetSong call
+
+        if self.mode == "weighted" and not NumpyFound:
+            logging.error("Weighted mode requires the numpy module! \033[1;30m(Falling back to random mode)")
+            self.mode = "random"
 
         # Check blacklist and create new one if there is none yet
         global Blacklist
@@ -158,58 +407,27 @@ class Randy(object):
                 # try to load the blacklist from MusicDB State
                 loadedlists = self.mdbstate.LoadBlacklists()
 
-                # First, create a clean blacklist
-                Blacklist = {}
-                Blacklist["songs"]   = [None] * self.songbllen
-                Blacklist["albums"]  = [None] * self.albumbllen
-                Blacklist["artists"] = [None] * self.artistbllen
-                
-                # Now fill the blacklist considering changes in their size
+                # Create the blacklists. If their sizes changed, only the latest loaded entries remain.
+                sizes = {"songs": self.songbllen, "albums": self.albumbllen, "artists": self.artistbllen}
                 for key in loadedlists:
-                    if key not in ["songs", "albums", "artists"]:
+                    if key not in sizes:
                         logging.error("Unexpected key \"%s\" in loaded blacklist dictionary! \033[1;30(Will be discard)", str(key))
-                        continue
-
-                    dst = Blacklist[key]
-                    src = loadedlists[key]
-                    if not src:
-                        continue    # when there are no entries loaded, keep the generated list of None-entries
-
-                    # The following python magic inserts as much of src at the end of dst, as fits.
-                    # if src must be cut, the first elements get removed
-                    # So, case 1: len(dst) > len(src)
-                    #   dst = [None, None, None, None, None]
-                    #   src = [1, 2, 3]
-                    #   Results in [None, None, 1, 2, 3]
-                    #
-                    # Case 2: len(dst) < len(src)
-                    #   dst = [None, None]
-                    #   src = [1, 2, 3]
-                    #   Results in [2, 3]
-                    #
-                    # >>> l = [1,2,3]
-                    # >>> d = [0]*3
-                    # >>> d[-len(l):] = l[-len(d):]
-                    # >>> l
-                    # [1, 2, 3]
-                    # >>> d
-                    # [1, 2, 3]
-                    # >>> d = [0]*2
-                    # >>> d[-len(l):] = l[-len(d):]
-                    # >>> l
-                    # [1, 2, 3]
-                    # >>> d
-                    # [2, 3]
-                    # >>> d = [0]*4
-                    # >>> d[-len(l):] = l[-len(d):]
-                    # >>> l
-                    # [1, 2, 3]
-                    # >>> d
-                    # [0, 1, 2, 3]
-                    # >>> 
-                    dst = dst[-len(src):] = src[-len(dst):]
-
-                    Blacklist[key] = dst
+
+                Blacklist = {}
+                for key in sizes:
+                    # when there are no entries loaded, the ring buffer stays filled with None-entries
+                    Blacklist[key] = BlacklistRing(sizes[key], loadedlists.get(key))
+
+        # Start prefetching random songs if not already done by another instance
+        global PrefetchCondition
+        global Prefetch
+        global PrefetchThread
+
+        with PrefetchCondition:
+            if self.prefetch > 0 and not PrefetchThread:
+                Prefetch = {"key": None, "generation": None, "songs": deque()}
+                PrefetchThread = threading.Thread(target=self.__PrefetchWorker, daemon=True)
+                PrefetchThread.start()
 
 
 
@@ -219,7 +437,8 @@ class Randy(object):
         If the song is ``None`` nothing happens.
 
         This method should be the only place where the blacklist gets changed.
-        After adding a song, the lists get stored in the MusicDB State Directory to be persistent
+        After adding a song, the lists get stored in the MusicDB State Directory to be persistent.
+        This is done in background after a short delay, so that several changes get written together (see `Blacklist`_).
 
         Args:
             song (dict): A song from the :class:`~lib.db.musicdb.MusicDatabase`
@@ -233,100 +452,695 @@ class Randy(object):
         global BlacklistLock
         global Blacklist
 
+        global BlacklistWriter
+
         with BlacklistLock:
-            if self.artistbllen > 0:
-                Blacklist["artists"].pop(0)
-                Blacklist["artists"].append(song["artistid"])
+            Blacklist["artists"].Push(song["artistid"])
+            Blacklist["albums"].Push(song["albumid"])
+            Blacklist["songs"].Push(song["id"])
+
+            # Save blacklists to files in background
+            BlacklistWriter["version"] += 1
+            BlacklistWriter["mdbstate"] = self.mdbstate
+            if not BlacklistWriter["timer"]:
+                BlacklistWriter["timer"] = threading.Timer(BLACKLIST_SAVEDELAY, SaveBlacklists)
+                BlacklistWriter["timer"].daemon = True
+                BlacklistWriter["timer"].start()
+
+
+
+    def __HasFilteredGenre(self, song, filterlist):
+        # GetRandomSong only looks for album genres.
+        # The song genre may be different and not in the set of the filerlist.
+        songgenres = self.db.GetTargetTags("song", song["id"], MusicDatabase.TAG_CLASS_GENRE)
+        # Create a set of tagnames if there are tags for this song.
+        # Ignore AI set tags because they may be wrong
+        if songgenres:
+            tagnames = { songgenre["name"] for songgenre in songgenres if songgenre["approval"] >= 1 }
+        else:
+            tagnames = { }
+
+        # If the tag name set was successfully created, compare it with the selected genres
+        if tagnames:
+            if not tagnames & set(filterlist):
+                logging.debug("song is of different genre than album and not in activated genres. (Song genres: %s)", str(tagnames))
+                return False
+        return True
+
+
+
+    def __IsBlacklisted(self, songid, albumid, artistid):
+        global BlacklistLock
+        global Blacklist
+
+        with BlacklistLock:
+            if self.artistbllen > 0 and artistid in Blacklist["artists"]:
+                logging.debug("artist on blacklist")
+                return True
+            if self.albumbllen > 0 and albumid in Blacklist["albums"]:
+                logging.debug("album on blacklist")
+                return True
+            if self.songbllen > 0 and songid in Blacklist["songs"]:
+                logging.debug("song on blacklist")
+                return True
+        return False
+
+
+
+    def __ConstraintsKey(self, filterlist):
+        return (tuple(sorted(str(entry) for entry in filterlist)), self.nodisabled, self.nohated, self.minlen)
+
+
+
+    def __CreateCandidatePool(self, filterlist):
+        # The generation must be read before the candidates, so a concurrent change leads to a new pool with the next call
+        generation = self.db.GetRandomCandidatesGeneration()
+        entries    = self.db.GetRandomCandidates(filterlist, self.nodisabled, self.nohated, self.minlen, withparents=True)
+
+        # GetRandomCandidates only looks for album genres.
+        # The song genre may be different and not in the set of the filerlist.
+        if filterlist:
+            tagmap = self.db.GetTargetTagsForMany("song", [entry[0] for entry in entries], MusicDatabase.TAG_CLASS_GENRE)
+        else:
+            tagmap = {}
+        filterset = set(filterlist)
+
+        pool = {}
+        pool["generation"] = generation
+        pool["songs"]      = array("l")
+        pool["albums"]     = array("l")
+        pool["artists"]    = array("l")
+        for songid, albumid, artistid in entries:
+            songgenres = tagmap.get(songid)
+            # Ignore AI set tags because they may be wrong
+            if songgenres:
+                tagnames = { songgenre["name"] for songgenre in songgenres if songgenre["approval"] >= 1 }
+                if tagnames and not tagnames & filterset:
+                    continue
+
+            pool["songs"].append(songid)
+            pool["albums"].append(albumid)
+            pool["artists"].append(artistid)
+
+        logging.debug("Candidate pool with %i of %i candidates created", len(pool["songs"]), len(entries))
+        return pool
+
+
+
+    def __GetCandidatePool(self, filterlist):
+        global CandidatePoolsLock
+        global CandidatePools
+
+        key        = (self.db.candidateskey,) + self.__ConstraintsKey(filterlist)
+        generation = self.db.GetRandomCandidatesGeneration()
+        with CandidatePoolsLock:
+            pool = CandidatePools.get(key)
+        if pool and pool["generation"] == generation:
+            return pool
+
+        pool = self.__CreateCandidatePool(filterlist)
+        with CandidatePoolsLock:
+            if len(CandidatePools) >= CANDIDATEPOOLS_MAXSETS:
+                CandidatePools.clear()
+            CandidatePools[key] = pool
+        return pool
+
+
+
+    def __GetBlacklistSets(self, exclude=None):
+        # Returns a snapshot of the blacklists as sets of song, album and artist IDs.
+        # exclude is an optional list of (songid, albumid, artistid) tuples that get added to the sets.
+        global BlacklistLock
+        global Blacklist
+
+        with BlacklistLock:
+            songs   = Blacklist["songs"].ToSet()
+            albums  = Blacklist["albums"].ToSet()
+            artists = Blacklist["artists"].ToSet()
+
+        for songid, albumid, artistid in exclude or []:
+            songs.add(songid)
             if self.albumbllen > 0:
-                Blacklist["albums"].pop(0)
-                Blacklist["albums"].append(song["albumid"])
-            if self.songbllen > 0:
-                Blacklist["songs"].pop(0)
-                Blacklist["songs"].append(song["id"])
+                albums.add(albumid)
+            if self.artistbllen > 0:
+                artists.add(artistid)
+        return songs, albums, artists
+
+
+
+    def __DrawSong(self, pool, exclude=None):
+        # Draws a song from the pool depending on the mode, see __DrawFromPool
+        if self.mode == "weighted":
+            return self.__DrawWeighted(pool, exclude)
+        return self.__DrawFromPool(pool, exclude)
+
+
 
-            # Save blacklists to files 
-            self.mdbstate.SaveBlacklists(Blacklist)
+    def __DrawFromPool(self, pool, exclude=None):
+        # Draws songs without replacement until one is not on a blacklist.
+        # Instead of shuffling the pool, the swaps of a Fisher-Yates shuffle get recorded in a dictionary.
+        # So the shared pool does not change and only the drawn songs need memory.
+        # exclude is an optional list of (songid, albumid, artistid) tuples that get handled like blacklisted songs.
+        # Returns the index of the song in the pool and the number of draws, or None if all songs are on a blacklist.
+        songs, albums, artists = self.__GetBlacklistSets(exclude)
 
+        remaining = len(pool["songs"])
+        swapped   = {}
+        draws     = 0
+        while remaining > 0:
+            position   = random.randrange(remaining)
+            index      = swapped.get(position, position)
+            remaining -= 1
+            swapped[position] = swapped.get(remaining, remaining)
+            draws     += 1
 
+            if pool["artists"][index] in artists:
+                continue
+            if pool["albums"][index] in albums:
+                continue
+            if pool["songs"][index] in songs:
+                continue
+            return index, draws
 
-    def GetSong(self):
+        return None, draws
+
+
+
+    @staticmethod
+    def ComputeWeights(favorite, likes, dislikes, lastplayed, now, favoriteweight=2.0, halflife=30):
+        """
+        This method computes the weights of songs for the weighted mode as described in `Weighted Mode`_.
+        All arguments except *now*, *favoriteweight* and *halflife* are ``numpy`` arrays of the same length.
+
+        Args:
+            favorite: Favorite state of each song (``-1``, ``0`` or ``1``)
+            likes: Number of likes of each song
+            dislikes: Number of dislikes of each song
+            lastplayed: Unix time each song was played the last time (``0`` for never)
+            now (int): Current unix time
+            favoriteweight (float): Factor for loved songs, and its inverse for hated songs
+            halflife (int): Time in days after that a played song regains half of its weight. ``0`` disables the recency decay.
+
+        Returns:
+            A ``numpy`` array with the weight of each song
+        """
+        weights  = numpy.power(float(favoriteweight), favorite.astype(numpy.float64))
+        weights *= numpy.sqrt((numpy.maximum(likes, 0) + 1.0) / (numpy.maximum(dislikes, 0) + 1.0))
+        if halflife > 0:
+            age      = numpy.maximum(now - lastplayed, 0) / (halflife * 86400.0)
+            weights *= numpy.maximum(1.0 - numpy.exp2(-age), WEIGHTS_MINRECENCY)
+        return weights
+
+
+
+    def __UpdateWeights(self, pool, songids):
+        # Reads the statistics of the songs in songids, or of all songs of the pool if songids is None,
+        # and updates their weights. The caller must hold the WeightsLock.
+        if songids == None:
+            pool["positions"] = {songid: index for index, songid in enumerate(pool["songs"])}
+            pool["stats"]     = numpy.zeros((4, len(pool["songs"])), dtype=numpy.int64)
+            pool["weights"]   = numpy.zeros(len(pool["songs"]), dtype=numpy.float64)
+            rows = self.db.GetSongStatistics()
+        else:
+            rows = self.db.GetSongStatistics([songid for songid in songids if songid in pool["positions"]])
+
+        positions = pool["positions"]
+        stats     = pool["stats"]
+        indices   = []
+        for songid, favorite, likes, dislikes, lastplayed in rows:
+            index = positions.get(songid)
+            if index == None:
+                continue
+            stats[:, index] = (favorite, likes, dislikes, lastplayed)
+            indices.append(index)
+
+        if songids != None and not indices:
+            return  # None of the changed songs is in the pool
+
+        now = int(time.time())
+        if songids == None:
+            indices = slice(None)
+            pool["weighttime"] = now
+        pool["weights"][indices] = self.ComputeWeights(stats[0, indices], stats[1, indices], stats[2, indices], stats[3, indices],
+                now, self.favoriteweight, self.halflife)
+        pool["cumweights"] = numpy.cumsum(pool["weights"])
+
+
+
+    def __GetCumulativeWeights(self, pool):
+        # Returns the cumulative weights of the songs in the pool.
+        # The weights get created with the first call and updated for songs whose statistics changed since the last call.
+        global WeightsLock
+
+        with WeightsLock:
+            sequence, songids = self.db.GetSongStatisticChanges(pool.get("sequence"))
+            if songids == None or "cumweights" not in pool:
+                self.__UpdateWeights(pool, None)
+                logging.debug("Weights of %i songs created", len(pool["songs"]))
+            elif songids:
+                self.__UpdateWeights(pool, songids)
+            elif time.time() - pool["weighttime"] > WEIGHTS_MAXAGE:
+                # Only the recency changed, the statistics are still up to date
+                stats = pool["stats"]
+                pool["weighttime"] = int(time.time())
+                pool["weights"]    = self.ComputeWeights(stats[0], stats[1], stats[2], stats[3],
+                        pool["weighttime"], self.favoriteweight, self.halflife)
+                pool["cumweights"] = numpy.cumsum(pool["weights"])
+            pool["sequence"] = sequence
+            return pool["cumweights"]
+
+
+
+    def __DrawWeighted(self, pool, exclude=None):
+        # Draws songs with a probability proportional to their weight until one is not on a blacklist.
+        # The positions of several draws get computed at once by a binary search on the cumulative weights.
+        # If all of them are on a blacklist, the song gets drawn uniformly without replacement.
+        # Returns the index of the song in the pool and the number of draws, or None if all songs are on a blacklist.
+        songs, albums, artists = self.__GetBlacklistSets(exclude)
+        cumweights = self.__GetCumulativeWeights(pool)
+
+        if len(cumweights) > 0 and cumweights[-1] > 0:
+            points  = numpy.random.random_sample(WEIGHTED_MAXDRAWS) * cumweights[-1]
+            indices = numpy.minimum(numpy.searchsorted(cumweights, points, side="right"), len(cumweights) - 1)
+            for draws, index in enumerate(indices.tolist(), 1):
+                if pool["artists"][index] in artists:
+                    continue
+                if pool["albums"][index] in albums:
+                    continue
+                if pool["songs"][index] in songs:
+                    continue
+                return index, draws
+
+        logging.debug("No weighted draw passed the blacklists \033[1;30m(Drawing uniformly)")
+        index, draws = self.__DrawFromPool(pool, exclude)
+        return index, draws + WEIGHTED_MAXDRAWS
+
+
+
+    def GetSong(self, previoussongid=None):
         """
         This method chooses a random song in a two-stage process as described in the module description.
 
+        In relation mode (``[Randy]->mode=relations``) a song related to *previoussongid* gets chosen via :meth:`~GetRelatedSong` first.
+        If there is no such song, a prefetched song gets taken (see `Prefetching`_).
+        If there is none, the two-stage process gets applied.
+
+        The number of songs drawn from the candidate pool is available in the attribute ``lastdraws`` afterwards.
+        It is ``0`` if the song was not drawn from the pool.
+
+        Args:
+            previoussongid (int): ID of the song the new song will follow, or ``None``
+
         Returns:
             A song from the :class:`~lib.db.musicdb.MusicDatabase` or ``None`` if an error occurred.
         """
-        global BlacklistLock
-        global Blacklist
-
+        self.lastdraws = 0
         filterlist = self.mdbstate.GetFilterList()
         if not filterlist:
             logging.warning("No Genre selected! \033[1;30m(Selecting random song from the whole collection)")
 
-        # Get Random Song - this may take several tries 
+        if self.mode == "relations" and previoussongid != None:
+            song = self.GetRelatedSong(previoussongid, filterlist)
+            if song:
+                self.AddSongToBlacklist(song)
+                return song
+
+        song = self.__TakePrefetchedSong(filterlist)
+        if song:
+            self.AddSongToBlacklist(song)
+            logging.debug("Randy took a prefetched song: \033[0;36m%s", song["path"])
+            return song
+
         logging.debug("Randy starts looking for a random song …")
         t_start = datetime.datetime.now()
-        song    = None
-        while not song:
-            # STAGE 1: Get Mathematical random song (under certain constraints)
+
+        # STAGE 1: Get the set of possible songs
+        try:
+            pool = self.__GetCandidatePool(filterlist)
+        except Exception as e:
+            logging.error("Getting the candidate pool failed with error: \"%s\"!", str(e))
+            return None
+
+        if len(pool["songs"]) == 0:
+            logging.error("There is no song fulfilling the constraints! \033[1;30m(Check the stage 1 constraints)")
+            return None
+
+        # STAGE 2: Make randomness feeling random by skipping songs that were recently played
+        try:
+            index, draws = self.__DrawSong(pool)
+        except Exception as e:
+            logging.error("Drawing a song from the candidate pool failed with error: \"%s\"!", str(e))
+            return None
+        self.lastdraws = draws
+        if index == None:
+            logging.warning("All %i songs fulfilling the constraints are on a blacklist! \033[1;30m(Ignoring the blacklists)", draws)
+            index = random.randrange(len(pool["songs"]))
+
+        song = self.db.GetSongById(pool["songs"][index])
+        if not song:
+            logging.error("Song %i of the candidate pool does not exist!", pool["songs"][index])
+            return None
+
+        # New song found \o/
+        # Add song into blacklists
+        self.AddSongToBlacklist(song)
+
+        t_stop = datetime.datetime.now()
+        logging.debug("Randy found the following song after %s and %i draws: \033[0;36m%s", str(t_stop-t_start), draws, song["path"])
+        return song
+
+
+
+    def __PrefetchWorker(self):
+        # Runs in its own thread with its own database connection.
+        # Keeps the prefetch buffer filled as long as the buffer is not full.
+        global PrefetchCondition
+        global Prefetch
+
+        try:
+            database = MusicDatabase(self.cfg.database.host, self.cfg.database.port, self.cfg.database.name,
+                    self.cfg.database.user, self.cfg.database.password, self.cfg.database.charset, self.cfg.database)
+            randy    = Randy(self.cfg, database)
+        except Exception as e:
+            logging.error("Starting the prefetch thread failed with error: \"%s\"! \033[1;30m(Songs will not be prefetched)", str(e))
+            return
+
+        while True:
+            with PrefetchCondition:
+                while len(Prefetch["songs"]) >= self.prefetch:
+                    PrefetchCondition.wait()
+
             try:
-                song = self.db.GetRandomSong(filterlist, self.nodisabled, self.nohated, self.minlen)
+                success = randy.__PrefetchSong()
             except Exception as e:
-                logging.error("Getting random song failed with error: \"%s\"!", str(e))
-                return None
+                logging.error("Prefetching a random song failed with error: \"%s\"!", str(e))
+                success = False
 
-            if not song:
-                logging.error("There is no song fulfilling the constraints! \033[1;30m(Check the stage 1 constraints)")
-                return None
+            if not success:
+                # Nothing to prefetch, try again later or when something changed
+                with PrefetchCondition:
+                    PrefetchCondition.wait(10)
 
-            logging.debug("Candidate for next song: \033[0;35m" + song["path"])
 
-            # GetRandomSong only looks for album genres.
-            # The song genre may be different and not in the set of the filerlist.
-            try:
 
-                songgenres = self.db.GetTargetTags("song", song["id"], MusicDatabase.TAG_CLASS_GENRE)
-                # Create a set of tagnames if there are tags for this song.
-                # Ignore AI set tags because they may be wrong
-                if songgenres:
-                    tagnames = { songgenre["name"] for songgenre in songgenres if songgenre["approval"] >= 1 }
-                else:
-                    tagnames = { }
-
-                # If the tag name set was successfully created, compare it with the selected genres
-                if tagnames:
-                    if not tagnames & set(filterlist):
-                        logging.debug("song is of different genre than album and not in activated genres. (Song genres: %s)", str(tagnames))
-                        song = None
-                        continue
+    def __PrefetchSong(self):
+        # Draws one song from the candidate pool and appends it to the prefetch buffer.
+        # Songs, albums and artists that are already in the buffer are handled like blacklisted ones.
+        # Returns True if a song was prefetched.
+        global PrefetchCondition
+        global Prefetch
+        global PrefetchStats
 
-            except Exception as e:
-                logging.error("Song tag check failed with exception: \"%s\"!", str(e))
+        filterlist = self.mdbstate.GetFilterList()
+        key        = self.__ConstraintsKey(filterlist)
+        pool       = self.__GetCandidatePool(filterlist)
+        if len(pool["songs"]) == 0:
+            return False
+
+        with PrefetchCondition:
+            if Prefetch["key"] != key or Prefetch["generation"] != pool["generation"]:
+                Prefetch["songs"].clear()
+                Prefetch["key"]        = key
+                Prefetch["generation"] = pool["generation"]
+            exclude = list(Prefetch["songs"])
+
+        index, draws = self.__DrawSong(pool, exclude)
+        if index == None:
+            return False
+
+        entry = (pool["songs"][index], pool["albums"][index], pool["artists"][index])
+        with PrefetchCondition:
+            # The constraints may have changed while drawing
+            if Prefetch["key"] != key or Prefetch["generation"] != pool["generation"]:
+                return True
+            Prefetch["songs"].append(entry)
+            PrefetchStats["prefetched"] += 1
+
+        logging.debug("Randy prefetched song %i after %i draws", entry[0], draws)
+        return True
+
+
+
+    def __TakePrefetchedSong(self, filterlist):
+        # Returns a prefetched song that is still valid, or None.
+        # A song is valid if the constraints and the candidates did not change since prefetching it,
+        # and if it did not get on a blacklist in the meantime.
+        global PrefetchCondition
+        global Prefetch
+        global PrefetchStats
+
+        if self.prefetch <= 0 or not Prefetch:
+            return None
+
+        key        = self.__ConstraintsKey(filterlist)
+        generation = self.db.GetRandomCandidatesGeneration()
+
+        with PrefetchCondition:
+            if Prefetch["key"] != key or Prefetch["generation"] != generation:
+                if Prefetch["songs"]:
+                    Prefetch["songs"].clear()
+                    PrefetchStats["invalidations"] += 1
+                PrefetchStats["misses"] += 1
+                PrefetchCondition.notify_all()
                 return None
 
+            entry = None
+            while Prefetch["songs"]:
+                candidate = Prefetch["songs"].popleft()
+                if self.__IsBlacklisted(*candidate):
+                    PrefetchStats["stale"] += 1
+                    continue
+                entry = candidate
+                break
 
-            # STAGE 2: Make randomness feeling random by checking if the song was recently played
-            with BlacklistLock:
-                if self.artistbllen > 0 and song["artistid"] in Blacklist["artists"]:
-                    logging.debug("artist on blacklist")
-                    song = None
+            if entry:
+                PrefetchStats["hits"] += 1
+            else:
+                PrefetchStats["misses"] += 1
+            PrefetchCondition.notify_all()
+
+        if not entry:
+            return None
+
+        song = self.db.GetSongById(entry[0])
+        if not song:
+            logging.error("Prefetched song %i does not exist!", entry[0])
+            return None
+        return song
+
+
+
+    def InvalidatePrefetch(self):
+        """
+        This method drops all prefetched songs.
+        It must be called when the genre filter or other constraints changed
+        (for example by :meth:`lib.ws.mdbwsi.MusicDBWebSocketInterface.SetMDBState`).
+
+        The prefetched songs also get dropped automatically when their constraints do not match
+        the constraints of the next :meth:`~GetSong` call.
+        Invalidating them early avoids that the prefetching thread works on an outdated filter.
+
+        Returns:
+            *Nothing*
+        """
+        global PrefetchCondition
+        global Prefetch
+        global PrefetchStats
+
+        with PrefetchCondition:
+            if not Prefetch:
+                return
+            Prefetch["songs"].clear()
+            Prefetch["key"]        = None
+            Prefetch["generation"] = None
+            PrefetchStats["invalidations"] += 1
+            PrefetchCondition.notify_all()
+
+
+
+    def GetPrefetchStatistics(self):
+        """
+        Returns a dictionary with the keys ``size``, ``capacity``, ``hits``, ``misses``, ``hitrate``, ``stale``, ``invalidations`` and ``prefetched``.
+
+        *hits* and *misses* count the :meth:`~GetSong` calls that could or could not take a prefetched song.
+        *stale* counts prefetched songs that got on a blacklist before they were taken.
+
+        Returns:
+            A dictionary with the prefetch statistics
+        """
+        global PrefetchCondition
+        global Prefetch
+        global PrefetchStats
+
+        with PrefetchCondition:
+            stats = dict(PrefetchStats)
+            stats["size"]     = len(Prefetch["songs"]) if Prefetch else 0
+            stats["capacity"] = self.prefetch
+        lookups = stats["hits"] + stats["misses"]
+        if lookups > 0:
+            stats["hitrate"] = stats["hits"] / lookups
+        else:
+            stats["hitrate"] = 0.0
+        return stats
+
+
+
+    @staticmethod
+    def CreateNeighbourTable(graph, candidates, size):
+        """
+        This method creates a neighbour table as described in the module description.
+
+        Args:
+            graph: A :class:`~mdbapi.relationgraph.RelationGraph` instance
+            candidates: A list of song IDs that are allowed to be chosen
+            size (int): Maximum number of related songs per song
+
+        Returns:
+            A dictionary that maps a song ID to a tuple of related song IDs and a tuple of the cumulative weights of the relations.
+            Songs without allowed related songs are not in the dictionary.
+        """
+        candidates = set(candidates)
+        table      = {}
+        for songid in graph.GetNodeIds("song"):
+            songids = []
+            weights = []
+            for neighbour, weight in graph.GetNeighbours("song", songid):
+                if neighbour not in candidates:
                     continue
-                if self.albumbllen > 0 and song["albumid"] in Blacklist["albums"]:
-                    logging.debug("album on blacklist")
-                    song = None
+                songids.append(neighbour)
+                weights.append(weight)
+                if len(songids) >= size:
+                    break
+
+            if songids:
+                table[songid] = (tuple(songids), tuple(accumulate(weights)))
+        return table
+
+
+
+    @staticmethod
+    def ChooseNeighbour(entry, rng=random):
+        """
+        This method chooses a song out of an entry of the neighbour table.
+        The probability of each song is proportional to the weight of its relation.
+
+        Args:
+            entry: A tuple of song IDs and cumulative weights as created by :meth:`~CreateNeighbourTable`
+            rng: A ``random.Random`` instance or the ``random`` module
+
+        Returns:
+            A song ID
+        """
+        songids, cumweights = entry
+        index = bisect_right(cumweights, rng.random() * cumweights[-1])
+        return songids[min(index, len(songids)-1)]
+
+
+
+    def __UpdateNeighbourTable(self, key, filterlist):
+        global NeighbourTableLock
+        global NeighbourTable
+
+        t_start = time.time()
+        try:
+            # The generation must be read before the candidates, so a concurrent change leads to a new table
+            generation = self.db.GetRandomCandidatesGeneration()
+            candidates = self.db.GetRandomCandidates(filterlist, self.nodisabled, self.nohated, self.minlen)
+            songs      = self.CreateNeighbourTable(RelationGraph(self.cfg), candidates, self.neighbours)
+        except Exception as e:
+            logging.error("Creating the neighbour table failed with error: \"%s\"!", str(e))
+            return None
+
+        table = {"key": key, "generation": generation, "timestamp": time.time(), "songs": songs}
+        with NeighbourTableLock:
+            NeighbourTable = table
+
+        logging.debug("Neighbour table with %i songs created after %.3fs", len(songs), time.time() - t_start)
+        return table
+
+
+
+    def __GetNeighbourTable(self, filterlist):
+        # Returns a neighbour table for the current constraints and candidates, or None if there is none yet.
+        # A missing or mismatching table gets created in background, so the caller never waits for it.
+        # An outdated one gets recreated in background as well but can be used meanwhile.
+        global NeighbourTableLock
+        global NeighbourTable
+        global NeighbourTableThread
+
+        key        = self.__ConstraintsKey(filterlist)
+        generation = self.db.GetRandomCandidatesGeneration()
+        with NeighbourTableLock:
+            table = NeighbourTable
+            if table and table["key"] == key and table["generation"] == generation:
+                outdated = time.time() - table["timestamp"] > self.refresh
+            else:
+                table    = None
+                outdated = True
+
+            if outdated and not (NeighbourTableThread and NeighbourTableThread.is_alive()):
+                NeighbourTableThread = threading.Thread(target=self.__UpdateNeighbourTable, args=(key, filterlist), daemon=True)
+                NeighbourTableThread.start()
+
+        return table
+
+
+
+    def GetRelatedSong(self, previoussongid, filterlist=None):
+        """
+        This method chooses a song that is related to the song with the ID *previoussongid* using the neighbour table
+        as described in `Relation Mode`_.
+        The Tracker Database does not get accessed.
+
+        The chosen song must pass the song genre check and must not be on a blacklist.
+        Otherwise another related song gets chosen.
+        After as many tries as there are related songs, ``None`` gets returned.
+
+        The song does not get added to the blacklist.
+
+        Args:
+            previoussongid (int): ID of the song the new song will follow
+            filterlist: List of genre names as returned by :meth:`lib.cfg.mdbstate.MDBState.GetFilterList`. If ``None``, the current filter gets used.
+
+        Returns:
+            A song from the :class:`~lib.db.musicdb.MusicDatabase` or ``None`` if there is no suitable related song, or the neighbour table is not ready yet.
+        """
+        if filterlist == None:
+            filterlist = self.mdbstate.GetFilterList()
+
+        table = self.__GetNeighbourTable(filterlist)
+        if not table:
+            logging.debug("Neighbour table is not ready yet")
+            return None
+
+        entry = table["songs"].get(previoussongid)
+        if not entry:
+            logging.debug("There are no related songs for song %s", str(previoussongid))
+            return None
+
+        t_start = datetime.datetime.now()
+        for tries in range(len(entry[0])):
+            songid = self.ChooseNeighbour(entry)
+            song   = self.db.GetSongById(songid)
+            if not song:
+                continue
+
+            try:
+                if not self.__HasFilteredGenre(song, filterlist):
                     continue
-                if self.songbllen > 0 and song["id"] in Blacklist["songs"]:
-                    logging.debug("song on blacklist")
-                    song = None
-                    continue 
+            except Exception as e:
+                logging.error("Song tag check failed with exception: \"%s\"!", str(e))
+                return None
 
-        # New song found \o/
-        # Add song into blacklists
-        self.AddSongToBlacklist(song)
+            if self.__IsBlacklisted(song["id"], song["albumid"], song["artistid"]):
+                continue
 
-        t_stop = datetime.datetime.now()
-        logging.debug("Randy found the following song after %s : \033[0;36m%s", str(t_stop-t_start), song["path"])
-        return song
+            t_stop = datetime.datetime.now()
+            logging.debug("Randy found the following related song after %s : \033[0;36m%s", str(t_stop-t_start), song["path"])
+            return song
+
+        logging.debug("None of the related songs of song %s passed the checks", str(previoussongid))
+        return None
 
 
 
@@ -0,0 +1,791 @@
+# MusicDB,  a music manager with web-bases UI that focus on music.
+# Copyright (C) 2017,2018  Ralf Stemmer <ralf.stemmer@gmx.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+This module keeps the relations of the Tracker Database (see :doc:`/mdbapi/tracker`) in memory.
+So the related songs or artists can be looked up without accessing the database.
+
+The relation graph consists of two parts:
+
+    * A global graph for the song relations and one for the artist relations, each stored in a :class:`~RelationMatrix`
+    * A class :class:`~RelationGraph` that provides methods to query and update those global graphs
+
+The graphs get loaded from the Tracker Database once via :meth:`~RelationGraph.Load`.
+The MusicDB Server does this when it gets started (see :doc:`/mdbapi/server`).
+Afterwards the :class:`~mdbapi.tracker.Tracker` keeps them up to date.
+All instances of the :class:`~RelationGraph` class access the same global graphs.
+
+Relation Matrix
+---------------
+
+The relations of one target are stored as sparse adjacency matrix in *compressed sparse row* (CSR) format.
+There are three arrays:
+
+    indptr:
+        For each node the index of its first neighbour in *indices*.
+        The neighbours of the node in row *r* are stored at ``indices[indptr[r]:indptr[r+1]]``.
+
+    indices:
+        The IDs of the neighbours.
+        The neighbours of each node are sorted by their weight, the strongest relation first.
+
+    weights:
+        The weight of each relation in the same order as *indices*.
+
+The relations are undirected, so each relation is stored twice - once for each direction.
+A dictionary maps the song or artist IDs to their row in *indptr*.
+
+Because the arrays cannot be changed efficiently, new relations get collected in a small dictionary.
+When it grows above 5% of the number of relations in the arrays, the arrays get rebuilt.
+Nodes without changes are answered directly from the arrays,
+so getting the *k* strongest relations is a slice of the arrays.
+
+Rebuilding the arrays takes seconds for large graphs.
+So it is done in a background thread on a snapshot of the matrix (see :meth:`~RelationMatrix.Snapshot`)
+while the global graph stays usable.
+Changes made in the meantime get recorded and applied to the new matrix before it replaces the old one.
+Adding a relation, for example by the :class:`~mdbapi.tracker.Tracker` when a song ended, never waits for a rebuild.
+
+Example:
+
+    .. code-block:: python
+
+        cfg   = MusicDBConfig("./musicdb.ini")
+        graph = RelationGraph(cfg)
+        graph.Load()
+
+        for songid, weight in graph.GetNeighbours("song", 1000, 10):
+            print("Related song ID: %d; Weight: %d"%(songid, weight))
+
+        path = graph.RandomWalk("song", 1000, 5)
+"""
+
+import logging
+import random
+import threading
+from array              import array
+from bisect             import bisect_right
+from lib.cfg.musicdb    import MusicDBConfig
+from lib.db.musicdb     import MusicDatabase
+from lib.db.trackerdb   import TrackerDatabase
+
+GraphLock = threading.Lock()
+Graphs    = None    # {"song": RelationMatrix, "artist": RelationMatrix}
+
+
+
+class RelationMatrix(object):
+    """
+    This class stores the relations of one target as sparse adjacency matrix in CSR format.
+    It is not thread safe. The :class:`~RelationGraph` class protects the global matrices with a lock.
+
+    Args:
+        relations: An iterable of ``(ida, idb, weight)`` tuples like :meth:`lib.db.trackerdb.TrackerDatabase.IterateRelations` yields them
+    """
+    MINOVERLAY = 1000   # Minimum number of changes before the arrays get rebuilt
+
+    def __init__(self, relations=()):
+        self.Build(relations)
+
+
+
+    def Build(self, relations):
+        """
+        This method (re)builds the arrays out of the given relations.
+        Relations with a weight less than 1 and relations of a node to itself get ignored.
+        Pending changes get dropped.
+
+        Args:
+            relations: An iterable of ``(ida, idb, weight)`` tuples
+
+        Returns:
+            *Nothing*
+        """
+        # Collect both directions of each relation
+        sources = array("l")
+        targets = array("l")
+        values  = array("l")
+        degrees = {}
+        for ida, idb, weight in relations:
+            if weight < 1 or ida == idb:
+                continue
+            sources.append(ida); targets.append(idb); values.append(weight)
+            sources.append(idb); targets.append(ida); values.append(weight)
+            degrees[ida] = degrees.get(ida, 0) + 1
+            degrees[idb] = degrees.get(idb, 0) + 1
+
+        # Assign rows and their ranges
+        self.rows   = {}
+        self.indptr = array("l", [0])
+        for row, nodeid in enumerate(degrees):
+            self.rows[nodeid] = row
+            self.indptr.append(self.indptr[-1] + degrees[nodeid])
+
+        # Fill rows
+        self.indices = array("l", bytes(targets.itemsize * len(targets)))
+        self.weights = array("l", bytes(values.itemsize  * len(values)))
+        nextfree     = self.indptr[:-1]
+        for source, target, weight in zip(sources, targets, values):
+            row = self.rows[source]
+            self.indices[nextfree[row]] = target
+            self.weights[nextfree[row]] = weight
+            nextfree[row] += 1
+
+        # Sort each row by weight, strongest relation first
+        for row in range(len(self.rows)):
+            start, end = self.indptr[row], self.indptr[row+1]
+            if end - start < 2:
+                continue
+            entries = sorted(zip(self.indices[start:end], self.weights[start:end]), key=lambda e: (-e[1], e[0]))
+            self.indices[start:end] = array("l", [e[0] for e in entries])
+            self.weights[start:end] = array("l", [e[1] for e in entries])
+
+        # Cumulative weights for weighted random selection of a neighbour
+        self.cumweights = array("q")
+        total = 0
+        for weight in self.weights:
+            total += weight
+            self.cumweights.append(total)
+
+        self.overlay     = {}   # nodeid → {neighbourid: weight difference}
+        self.numchanges  = 0
+        self.changelog   = None # (ida, idb, weight) of the changes since the last snapshot, None if there is no snapshot
+
+
+
+    def __Row(self, nodeid):
+        # Returns (start, end) in the arrays. (0, 0) if the node has no row.
+        row = self.rows.get(nodeid)
+        if row == None:
+            return 0, 0
+        return self.indptr[row], self.indptr[row+1]
+
+
+
+    def __Merged(self, nodeid):
+        # Returns all neighbours of a node with changes as {neighbourid: weight}
+        start, end = self.__Row(nodeid)
+        neighbours = dict(zip(self.indices[start:end], self.weights[start:end]))
+        for neighbour, difference in self.overlay[nodeid].items():
+            weight = neighbours.get(neighbour, 0) + difference
+            if weight > 0:
+                neighbours[neighbour] = weight
+            else:
+                neighbours.pop(neighbour, None)
+        return neighbours
+
+
+
+    def GetNeighbours(self, nodeid, k=None):
+        """
+        Args:
+            nodeid (int): ID of a node
+            k (int): Maximum number of neighbours to return. ``None`` for all.
+
+        Returns:
+            A list of ``(neighbourid, weight)`` tuples, sorted by weight, strongest relation first
+        """
+        if nodeid in self.overlay:
+            neighbours = sorted(self.__Merged(nodeid).items(), key=lambda e: (-e[1], e[0]))
+            return neighbours[:k]
+
+        start, end = self.__Row(nodeid)
+        if k != None:
+            end = min(end, start + k)
+        return list(zip(self.indices[start:end], self.weights[start:end]))
+
+
+
+    def GetWeight(self, ida, idb):
+        """
+        Args:
+            ida (int): ID of one node
+            idb (int): ID of the other node
+
+        Returns:
+            The weight of the relation. ``0`` if the nodes are not related.
+        """
+        if ida in self.overlay:
+            return self.__Merged(ida).get(idb, 0)
+
+        start, end = self.__Row(ida)
+        try:
+            return self.weights[self.indices.index(idb, start, end)]
+        except ValueError:
+            return 0
+
+
+
+    def GetRandomNeighbour(self, nodeid, rng=random):
+        """
+        Selects a neighbour of a node.
+        The probability of a neighbour getting selected is proportional to the weight of its relation.
+
+        Args:
+            nodeid (int): ID of a node
+            rng: A ``random.Random`` instance or the ``random`` module
+
+        Returns:
+            The ID of the selected neighbour, or ``None`` if the node has no neighbours
+        """
+        if nodeid in self.overlay:
+            neighbours = self.__Merged(nodeid)
+            if not neighbours:
+                return None
+            return rng.choices(list(neighbours.keys()), list(neighbours.values()))[0]
+
+        start, end = self.__Row(nodeid)
+        if start == end:
+            return None
+
+        base  = self.cumweights[start-1] if start > 0 else 0
+        total = self.cumweights[end-1] - base
+        index = bisect_right(self.cumweights, base + rng.random() * total, start, end)
+        return self.indices[min(index, end-1)]
+
+
+
+    def AddWeight(self, ida, idb, weight):
+        """
+        Adds *weight* to the relation of two nodes.
+        A negative weight decreases the relation.
+        When the weight of the relation is not greater than ``0`` anymore, the relation gets removed.
+
+        Args:
+            ida (int): ID of one node
+            idb (int): ID of the other node
+            weight (int): Weight to add
+
+        Returns:
+            *Nothing*
+        """
+        if ida == idb or weight == 0:
+            return
+
+        # A relation cannot become negative
+        if weight < 0:
+            weight = max(weight, -self.GetWeight(ida, idb))
+            if weight == 0:
+                return
+
+        for source, target in [(ida, idb), (idb, ida)]:
+            changes = self.overlay.setdefault(source, {})
+            changes[target] = changes.get(target, 0) + weight
+
+        self.numchanges += 1
+        if self.changelog != None:
+            self.changelog.append((ida, idb, weight))
+
+
+
+    def NeedsRebuild(self):
+        """
+        Returns:
+            ``True`` if there are so many pending changes that the arrays should be rebuilt and no snapshot for a rebuild was taken yet
+        """
+        return self.changelog == None and self.numchanges > max(self.MINOVERLAY, len(self.indices) // 20)
+
+
+
+    def Snapshot(self):
+        """
+        Returns a copy of the matrix that can be rebuilt without blocking this matrix.
+        The copy shares the arrays with this matrix, because they never get changed after they were built.
+        Only the pending changes get copied.
+
+        From now on, all changes of this matrix get recorded.
+        After building a new matrix out of the relations of the snapshot (see :meth:`~IterateRelations`),
+        the recorded changes must be applied to it via :meth:`~ApplyChangelog`.
+
+        Returns:
+            A :class:`~RelationMatrix`
+        """
+        snapshot = RelationMatrix.__new__(RelationMatrix)
+        snapshot.rows       = self.rows
+        snapshot.indptr     = self.indptr
+        snapshot.indices    = self.indices
+        snapshot.weights    = self.weights
+        snapshot.cumweights = self.cumweights
+        snapshot.overlay    = {nodeid: dict(changes) for nodeid, changes in self.overlay.items()}
+        snapshot.numchanges = self.numchanges
+        snapshot.changelog  = None
+
+        self.changelog = []
+        return snapshot
+
+
+
+    def ApplyChangelog(self, matrix):
+        """
+        Applies the changes recorded since :meth:`~Snapshot` was called to *matrix*.
+
+        Args:
+            matrix: The :class:`~RelationMatrix` built out of the snapshot
+
+        Returns:
+            *Nothing*
+        """
+        for ida, idb, weight in self.changelog:
+            matrix.AddWeight(ida, idb, weight)
+
+
+
+    def IterateRelations(self):
+        """
+        Returns:
+            A generator of all relations as ``(ida, idb, weight)`` tuples with ``ida < idb``, including the pending changes
+        """
+        for nodeid in list(self.rows.keys()) + [n for n in self.overlay if n not in self.rows]:
+            for neighbour, weight in self.GetNeighbours(nodeid):
+                if nodeid < neighbour:
+                    yield (nodeid, neighbour, weight)
+
+
+
+    def GetStatistics(self):
+        """
+        Returns:
+            A dictionary with the number of ``nodes`` and ``relations`` in the arrays, the number of pending ``changes`` and the ``memory`` used by the arrays in bytes
+        """
+        stats = {}
+        stats["nodes"]     = len(self.rows)
+        stats["relations"] = len(self.indices) // 2
+        stats["changes"]   = self.numchanges
+        stats["memory"]    = sum(a.itemsize * len(a) for a in [self.indptr, self.indices, self.weights, self.cumweights])
+        return stats
+
+
+
+class RelationGraph(object):
+    """
+    This class provides access to the global in-memory relation graphs.
+
+    The methods that update the graph do nothing as long as the graph was not loaded.
+    Then the Tracker Database is the only source of the relations and the graph will be up to date when it gets loaded.
+    The methods that query the graph load it if it was not loaded yet.
+
+    Each method has a *target* argument that must be ``"song"`` or ``"artist"``.
+
+    Args:
+        config: :class:`~lib.cfg.musicdb.MusicDBConfig` object holding the MusicDB Configuration
+
+    Raises:
+        TypeError: When the arguments are not of the correct type.
+    """
+
+    def __init__(self, config):
+        if type(config) != MusicDBConfig:
+            raise TypeError("config argument not of type MusicDBConfig")
+
+        self.cfg = config
+
+
+
+    def Load(self, reload=False):
+        """
+        This method loads the song and artist relations from the Tracker Database into the global graphs.
+        If the graphs are already loaded, nothing will be done unless *reload* is ``True``.
+
+        When the tracker is disabled (``[debug]->disabletracker``), the Tracker Database does not get accessed and the graphs stay empty.
+
+        Args:
+            reload (bool): Load the relations even if the graphs were loaded before
+
+        Returns:
+            ``True`` on success, ``False`` if loading the relations failed
+        """
+        global Graphs
+        global GraphLock
+
+        with GraphLock:
+            if Graphs != None and not reload:
+                return True
+
+        graphs = {"song": RelationMatrix(), "artist": RelationMatrix()}
+        if not self.cfg.debug.disabletracker:
+            try:
+                trackerdb = TrackerDatabase(self.cfg.tracker.host, self.cfg.tracker.port, self.cfg.tracker.name, self.cfg.tracker.user, self.cfg.tracker.password, self.cfg.tracker.charset, self.cfg.database)
+                for target in graphs:
+                    graphs[target].Build(trackerdb.IterateRelations(target))
+            except Exception as e:
+                logging.error("Loading the relation graph failed with error \"%s\"!", str(e))
+                return False
+
+        # Relations that were added while loading get lost.
+        # This is fine because it happens only during startup or when reloading the caches.
+        with GraphLock:
+            Graphs = graphs
+
+        logging.debug("Relation graph loaded: %i song relations, %i artist relations",
+                graphs["song"].GetStatistics()["relations"], graphs["artist"].GetStatistics()["relations"])
+        return True
+
+
+
+    def __RebuildIfNecessary(self, target):
+        # Must be called with GraphLock held.
+        # Starts a background thread that rebuilds the matrix when it has too many pending changes.
+        global Graphs
+
+        matrix = Graphs[target]
+        if not matrix.NeedsRebuild():
+            return
+
+        snapshot = matrix.Snapshot()
+        thread   = threading.Thread(target=self.__Rebuild, args=(target, matrix, snapshot), daemon=True)
+        thread.start()
+
+
+
+    def __Rebuild(self, target, matrix, snapshot):
+        global Graphs
+        global GraphLock
+
+        try:
+            newmatrix = RelationMatrix(list(snapshot.IterateRelations()))
+        except Exception as e:
+            logging.exception("Rebuilding the %s relation graph failed with error \"%s\"!", target, str(e))
+            with GraphLock:
+                matrix.changelog = None     # The next change tries again
+            return
+
+        with GraphLock:
+            # The graph may have been reloaded in the meantime
+            if Graphs == None or Graphs[target] is not matrix:
+                return
+            matrix.ApplyChangelog(newmatrix)
+            Graphs[target] = newmatrix
+            self.__RebuildIfNecessary(target)
+
+        logging.debug("%s relation graph rebuilt: %i relations", target, newmatrix.GetStatistics()["relations"])
+
+
+
+    def IsLoaded(self):
+        """
+        Returns:
+            ``True`` if the global graphs are loaded, otherwise ``False``
+        """
+        global Graphs
+        return Graphs != None
+
+
+
+    def __GetMatrix(self, target):
+        global Graphs
+        if target not in ["song", "artist"]:
+            raise ValueError("Unknown target \"%s\"! Only \"song\" and \"artist\" allowed."%(str(target)))
+        if Graphs == None and not self.Load():
+            return RelationMatrix()     # Loading failed, so there are no relations known
+        return Graphs[target]
+
+
+
+    def AddRelation(self, target, ida, idb, weight=1):
+        """
+        This method increments the weight of a relation between two songs or artists.
+        It does not access the Tracker Database.
+        Use :meth:`lib.db.trackerdb.TrackerDatabase.AddRelation` to store the relation.
+
+        Args:
+            target (str): ``song`` or ``artist``
+            ida (int): Song ID or Artist ID, depending on the target string
+            idb (int): Song ID or Artist ID, depending on the target string
+            weight (int): Weight that gets added to the relation. Negative values decrease the relation.
+
+        Returns:
+            *Nothing*
+
+        Raises:
+            ValueError: If *target* not ``"song"`` or ``"artist"``
+        """
+        global Graphs
+        global GraphLock
+
+        if target not in ["song", "artist"]:
+            raise ValueError("Unknown target \"%s\"! Only \"song\" and \"artist\" allowed."%(str(target)))
+
+        with GraphLock:
+            if Graphs == None:
+                return
+            Graphs[target].AddWeight(ida, idb, weight)
+            self.__RebuildIfNecessary(target)
+
+
+
+    def RemoveRelation(self, target, ida, idb):
+        """
+        This method removes the relation between two songs or artists from the graph.
+
+        Args:
+            target (str): ``song`` or ``artist``
+            ida (int): Song ID or Artist ID, depending on the target string
+            idb (int): Song ID or Artist ID, depending on the target string
+
+        Returns:
+            The weight of the removed relation. ``0`` if there was no relation or the graph is not loaded.
+
+        Raises:
+            ValueError: If *target* not ``"song"`` or ``"artist"``
+        """
+        global Graphs
+        global GraphLock
+
+        if target not in ["song", "artist"]:
+            raise ValueError("Unknown target \"%s\"! Only \"song\" and \"artist\" allowed."%(str(target)))
+
+        with GraphLock:
+            if Graphs == None:
+                return 0
+            weight = Graphs[target].GetWeight(ida, idb)
+            Graphs[target].AddWeight(ida, idb, -weight)
+            self.__RebuildIfNecessary(target)
+        return weight
+
+
+
+    def RemoveSongRelations(self, musicdb, songida, songidb):
+        """
+        This method does the same to the graph as :meth:`lib.db.trackerdb.TrackerDatabase.RemoveSongRelations` does to the Tracker Database.
+        The song relation gets removed and its weight gets subtracted from the relation of the artists of the two songs.
+
+        Args:
+            musicdb: An instance of the music database to look up the artists of the songs
+            songida (int): ID of one song
+            songidb (int): ID of the other one
+
+        Returns:
+            *Nothing*
+
+        Raises:
+            TypeError: Invalid *musicdb* argument
+        """
+        if type(musicdb) != MusicDatabase:
+            raise TypeError("Invalid argument. musicdb not of type MusicDatabase")
+
+        weight = self.RemoveRelation("song", songida, songidb)
+        if weight == 0:
+            return
+
+        artistida = musicdb.GetSongById(songida)["artistid"]
+        artistidb = musicdb.GetSongById(songidb)["artistid"]
+        self.AddRelation("artist", artistida, artistidb, -weight)
+
+
+
+    def RemoveNode(self, target, nodeid):
+        """
+        This method removes all relations of a song or an artist from the graph.
+        This is useful in case a song or artist gets removed from the database.
+        Like :meth:`lib.db.trackerdb.TrackerDatabase.RemoveSong`, the artist relations do not get updated when a song gets removed.
+
+        Args:
+            target (str): ``song`` or ``artist``
+            nodeid (int): Song ID or Artist ID, depending on the target string
+
+        Returns:
+            *Nothing*
+
+        Raises:
+            ValueError: If *target* not ``"song"`` or ``"artist"``
+        """
+        global Graphs
+        global GraphLock
+
+        if target not in ["song", "artist"]:
+            raise ValueError("Unknown target \"%s\"! Only \"song\" and \"artist\" allowed."%(str(target)))
+
+        with GraphLock:
+            if Graphs == None:
+                return
+            matrix = Graphs[target]
+            for neighbour, weight in matrix.GetNeighbours(nodeid):
+                matrix.AddWeight(nodeid, neighbour, -weight)
+            self.__RebuildIfNecessary(target)
+
+
+
+    def GetNeighbours(self, target, nodeid, k=None):
+        """
+        This method returns the songs or artists related to *nodeid*.
+
+        Args:
+            target (str): ``song`` or ``artist``
+            nodeid (int): Song ID or Artist ID, depending on the target string
+            k (int): Maximum number of relations to return. ``None`` returns all of them.
+
+        Returns:
+            A list of ``(id, weight)`` tuples, sorted by weight, strongest relation first. The list is empty if there are no relations.
+
+        Raises:
+            ValueError: If *target* not ``"song"`` or ``"artist"``
+        """
+        global GraphLock
+        matrix = self.__GetMatrix(target)
+        with GraphLock:
+            return matrix.GetNeighbours(nodeid, k)
+
+
+
+    def GetWeight(self, target, ida, idb):
+        """
+        Args:
+            target (str): ``song`` or ``artist``
+            ida (int): Song ID or Artist ID, depending on the target string
+            idb (int): Song ID or Artist ID, depending on the target string
+
+        Returns:
+            The weight of the relation between *ida* and *idb*. ``0`` if they are not related.
+
+        Raises:
+            ValueError: If *target* not ``"song"`` or ``"artist"``
+        """
+        global GraphLock
+        matrix = self.__GetMatrix(target)
+        with GraphLock:
+            return matrix.GetWeight(ida, idb)
+
+
+
+    def GetTwoHopNeighbours(self, target, nodeid, k=None):
+        """
+        This method returns the songs or artists that are not related to *nodeid* directly, but to one of its neighbours.
+        The score of such a node is the sum of the products of the weights along all paths of length two from *nodeid* to that node.
+
+        Args:
+            target (str): ``song`` or ``artist``
+            nodeid (int): Song ID or Artist ID, depending on the target string
+            k (int): Maximum number of nodes to return. ``None`` returns all of them.
+
+        Returns:
+            A list of ``(id, score)`` tuples, sorted by score, highest score first
+
+        Raises:
+            ValueError: If *target* not ``"song"`` or ``"artist"``
+        """
+        global GraphLock
+        matrix = self.__GetMatrix(target)
+        scores = {}
+        with GraphLock:
+            neighbours = matrix.GetNeighbours(nodeid)
+            direct     = set(n for n, _ in neighbours)
+            for neighbour, weighta in neighbours:
+                for secondhop, weightb in matrix.GetNeighbours(neighbour):
+                    if secondhop == nodeid or secondhop in direct:
+                        continue
+                    scores[secondhop] = scores.get(secondhop, 0) + weighta * weightb
+
+        results = sorted(scores.items(), key=lambda e: (-e[1], e[0]))
+        return results[:k]
+
+
+
+    def RandomWalk(self, target, startid, length, rng=random):
+        """
+        This method walks randomly along the relations starting at *startid*.
+        In each step the next node gets chosen with a probability proportional to the weight of the relation.
+        The walk ends early when a node without relations is reached.
+
+        Args:
+            target (str): ``song`` or ``artist``
+            startid (int): Song ID or Artist ID to start from
+            length (int): Maximum number of steps
+            rng: A ``random.Random`` instance or the ``random`` module
+
+        Returns:
+            A list of IDs visited, beginning with *startid*
+
+        Raises:
+            ValueError: If *target* not ``"song"`` or ``"artist"``
+        """
+        global GraphLock
+        matrix = self.__GetMatrix(target)
+        path   = [startid]
+        with GraphLock:
+            for step in range(length):
+                nextid = matrix.GetRandomNeighbour(path[-1], rng)
+                if nextid == None:
+                    break
+                path.append(nextid)
+        return path
+
+
+
+    def GetNodeIds(self, target):
+        """
+        Args:
+            target (str): ``song`` or ``artist``
+
+        Returns:
+            A list of all song or artist IDs that have at least one relation
+
+        Raises:
+            ValueError: If *target* not ``"song"`` or ``"artist"``
+        """
+        global GraphLock
+        matrix = self.__GetMatrix(target)
+        with GraphLock:
+            nodeids = set(matrix.rows.keys())
+            nodeids.update(matrix.overlay.keys())
+            return [nodeid for nodeid in nodeids if matrix.GetNeighbours(nodeid, 1)]
+
+
+
+    def SetRelations(self, target, relations):
+        """
+        This method replaces all relations of the song or artist graph by *relations*.
+        The Tracker Database does not get accessed.
+        This can be used to work with relations from other sources, for example synthetic relations for benchmarks.
+
+        Args:
+            target (str): ``song`` or ``artist``
+            relations: An iterable of ``(ida, idb, weight)`` tuples
+
+        Returns:
+            *Nothing*
+
+        Raises:
+            ValueError: If *target* not ``"song"`` or ``"artist"``
+        """
+        global Graphs
+        global GraphLock
+
+        if target not in ["song", "artist"]:
+            raise ValueError("Unknown target \"%s\"! Only \"song\" and \"artist\" allowed."%(str(target)))
+
+        matrix = RelationMatrix(relations)
+        with GraphLock:
+            if Graphs == None:
+                Graphs = {"song": RelationMatrix(), "artist": RelationMatrix()}
+            Graphs[target] = matrix
+
+
+
+    def GetStatistics(self):
+        """
+        Returns:
+            A dictionary with the keys ``"song"`` and ``"artist"`` with the statistics of each graph (see :meth:`RelationMatrix.GetStatistics`), or ``None`` if the graph is not loaded
+        """
+        global Graphs
+        global GraphLock
+        with GraphLock:
+            if Graphs == None:
+                return None
+            return {target: Graphs[target].GetStatistics() for target in Graphs}
+
+
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
@@ -38,6 +38,7 @@ If the server is not started, the objects are all ``None``.
 
     * :class:`lib.db.musicdb.MusicDatabase` as ``database``
     * :class:`mdbapi.mise.MusicDBMicroSearchEngine` as ``mise``
+    * :class:`mdbapi.relationgraph.RelationGraph` as ``relationgraph``
     * :class:`lib.cfg.musicdb.MusicDBConfig` as ``cfg``
 
 The following example shows how to use the pipe interface:
@@ -62,7 +63,9 @@ from lib.pidfile        import *
 from lib.namedpipe      import NamedPipe
 from lib.ws.server      import MusicDBWebSocketServer
 from mdbapi.mise        import MusicDBMicroSearchEngine
+from mdbapi.relationgraph import RelationGraph
 from mdbapi.stream      import StartStreamingThread, StopStreamingThread
+from mdbapi.randy       import SaveBlacklists
 import logging
 
 # Global objects
@@ -70,6 +73,7 @@ import logging
 # Instances
 database    = None  # music.db object
 mise        = None  # micro search engine object
+relationgraph = None  # in-memory tracker relations
 cfg         = None  # overall configuration file
 pipe        = None  # Named pipe for server commands
 # WS Server
@@ -110,7 +114,9 @@ def UpdateCaches():
 
     On server side:
     
+        * The entity cache of the database gets cleared by calling :meth:`lib.db.musicdb.MusicDatabase.InvalidateCache`
         * The MiSE Cache gets updated by calling :meth:`mdbapi.mise.MusicDBMicroSearchEngine.UpdateCache`
+        * The relation graph gets reloaded by calling :meth:`mdbapi.relationgraph.RelationGraph.Load`
 
 
     To inform the clients a broadcast packet get sent with the following content: ``{method:"broadcast", fncname:"sys:refresh", fncsig:"UpdateCaches", arguments:null, pass:null}``
@@ -125,13 +131,24 @@ def UpdateCaches():
             }
     """
     global mise
+    global relationgraph
     global tlswsserver
+    global database
+
+    # The database may have been changed by another process
+    try:
+        database.InvalidateCache()
+    except Exception as e:
+        logging.warning("Unexpected error clearing the entity cache: %s \033[0;33m(will be ignored)\033[0m", str(e))
 
     try:
         mise.UpdateCache()
     except Exception as e:
         logging.warning("Unexpected error updating MiSE cache: %s \033[0;33m(will be ignored)\033[0m", str(e))
 
+    # The tracker database may have been changed by another process as well
+    relationgraph.Load(reload=True)
+
     try:
         packet = {}
         packet["method"]      = "broadcast"
@@ -166,6 +183,7 @@ def Initialize(configobj, databaseobj):
         #. Assign the *configobj* and *databaseobj* to global variables ``cfg`` and ``database`` to share them between multiple connections
         #. Seed Python's random number generator
         #. Instantiate a global :meth:`mdbapi.mise.MusicDBMicroSearchEngine` object
+        #. Load the relation graph via :meth:`mdbapi.relationgraph.RelationGraph.Load` (see :doc:`/mdbapi/relationgraph` for details)
         #. Start the Streaming Thread via :meth:`mdbapi.stream.StartStreamingThread` (see :doc:`/mdbapi/stream` for details)
         #. Update MiSE cache via :meth:`mdbapi.mise.MusicDBMicroSearchEngine.UpdateCache`
         #. Create FIFO file for named pipe
@@ -201,6 +219,11 @@ def Initialize(configobj, databaseobj):
     global mise
     mise   = MusicDBMicroSearchEngine(database)
 
+    logging.debug("Loading relation graph…")
+    global relationgraph
+    relationgraph = RelationGraph(cfg)
+    relationgraph.Load()
+
     # Start/Connect all interfaces
     logging.debug("Starting Streaming Thread…")
     StartStreamingThread(cfg, database)
@@ -260,6 +283,7 @@ def Shutdown():
     The following things happen when this function gets called:
 
         #. Stop the Streaming Thread via :meth:`mdbapi.stream.StopStreamingThread`
+        #. Store pending changes of the blacklists via :func:`mdbapi.randy.SaveBlacklists`
         #. Removing FIFO file for named pipe
         #. Stop the websocket server
 
@@ -279,6 +303,9 @@ def Shutdown():
     
     logging.debug("Stopping Streaming Thread…")
     StopStreamingThread()
+
+    logging.debug("Saving blacklists…")
+    SaveBlacklists()
     
     if tlswsserver:
         logging.debug("Stopping TLS WS Server…")
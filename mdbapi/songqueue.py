@@ -26,6 +26,8 @@ Queue Management
 ----------------
 
 An entry this queue is a tuple of an entry ID and a song ID as maintained by the :class:`~lib.db.musicdb.MusicDatabase` class.
+The entries are stored in a :class:`~QueueList`, a linked list with an index from the entry ID to the entry.
+So finding, removing and moving an entry as well as switching to the next song do not depend on the length of the queue.
 
 Some features of this queue are:
 
@@ -39,6 +41,49 @@ Furthermore this module cooperates the Randy module (see: :doc:`/mdbapi/randy`)
 When the queue runs empty, a new random song gets append to the queue.
 
 
+Persistence
+-----------
+
+The queue gets stored in the MusicDB State Directory as an append-only operation log (``songqueue.log``).
+Each change of the queue appends one line to the log, independent of the length of the queue:
+
+    * ``add,last,<entryid>,<songid>`` and ``add,next,<entryid>,<songid>`` for :meth:`~SongQueue.AddSong`
+    * ``next`` for :meth:`~SongQueue.NextSong`
+    * ``remove,<entryid>`` for :meth:`~SongQueue.RemoveSong`
+    * ``move,<entryid>,<afterid>`` for :meth:`~SongQueue.MoveSong`
+
+When loading the queue, the operations get replayed on an empty queue.
+
+When the log has more than *SONGQUEUE_MAXLOGLENGTH* lines and more than four times the lines the queue has entries,
+the log gets compacted by :meth:`~SongQueue.Save`:
+The log gets replaced by a new one that only contains an ``add`` operation for each entry of the current queue.
+The new log gets written into a temporary file that atomically replaces the old log.
+So the stored queue is never lost, even if MusicDB crashes while saving it.
+If the last line of the log is incomplete due to a crash, it gets ignored.
+
+For compatibility, the queue also gets written into ``songqueue.csv`` when the log gets compacted.
+If there is no log, the queue gets loaded from this file.
+
+
+Versions
+--------
+
+Each change of the queue increments the version of the queue.
+The last *QUEUECHANGES_MAXLEN* changes are kept in memory together with the version they lead to.
+So a client that knows the queue of a certain version can follow the queue by only applying the changes
+returned by :meth:`~SongQueue.GetQueueChanges`, instead of reading the whole queue again.
+The queue and its version can be read at once via :meth:`~SongQueue.GetVersionedQueue`.
+
+A change is one of the following tuples:
+
+    * ``("insert", entryid, songid, afterid)``: A new entry got inserted behind the entry *afterid*. If *afterid* is ``None``, the entry is the first one.
+    * ``("remove", entryid)``: The entry got removed
+    * ``("move", entryid, afterid)``: The entry got moved behind the entry *afterid*
+    * ``("advance", entryid)``: The current song, the first entry, got removed because the next song gets played
+
+The version is not persistent. It starts at 0 when MusicDB starts.
+
+
 Event Management
 ----------------
 
@@ -58,7 +103,9 @@ A return value gets not handled.
 The following events exist:
 
     QueueChanged:
-        Gets triggered when the Song Queue changes
+        Gets triggered when the Song Queue changes.
+        The argument is the version of the queue after the change (see `Versions`_).
+        Multiple changes may be reported by one event.
 
     SongChanged:
         When the current playing song changes.
@@ -85,21 +132,211 @@ Examples
 import uuid
 import logging
 import threading    # for RLock
+from collections        import deque
 from lib.cfg.musicdb    import MusicDBConfig
 from lib.cfg.mdbstate   import MDBState
 from lib.db.musicdb     import MusicDatabase
 from mdbapi.randy       import Randy
 
-Queue     = None
+Queue     = None    # QueueList
 QueueLock = threading.RLock() # RLock allows nested calls. It locks only different threads.
 Callbacks = []  # For events like QueueChanged or SongChanged
 
+QueueLogLength = 0  # Number of operations in the stored log
+SONGQUEUE_MAXLOGLENGTH = 1000 # Minimum number of operations before the log gets compacted
+
+QUEUECHANGES_MAXLEN = 100   # Number of changes that can be requested via GetQueueChanges
+QueueVersion = 0            # Gets incremented by each change of the queue
+QueueChanges = deque(maxlen=QUEUECHANGES_MAXLEN)  # (version, change) of the last changes
+
+
+
+class QueueList(object):
+    """
+    This class implements an ordered list of queue entries ``(entryid, songid)``.
+    The entries are nodes of a doubly linked list.
+    Additionally, a dictionary maps each entry ID to its node.
+    So looking up, removing, inserting and moving an entry by its entry ID takes constant time.
+
+    Iterating over the list returns the entries as tuples ``(entryid, songid)`` in order.
+    ``queue[0]`` and ``queue[-1]`` return the first and last entry in constant time.
+    Other indices need to walk through the list.
+
+    This class is not thread safe.
+    The :class:`~SongQueue` class protects it by its lock.
+
+    Args:
+        entries: Optional list of ``(entryid, songid)`` tuples to append
+
+    Example:
+
+        .. code-block:: python
+
+            queue = QueueList([(1, 1000), (2, 1001)])
+            queue.Append(3, 1002)
+            queue.MoveAfter(1, 3)
+            print(list(queue))  # [(2, 1001), (3, 1002), (1, 1000)]
+    """
+
+    def __init__(self, entries=None):
+        # A node is a list [previous node, next node, entry ID, song ID].
+        # The root node links the last and the first node, so there are no special cases for the ends of the list.
+        self.root    = [None, None, None, None]
+        self.root[0] = self.root
+        self.root[1] = self.root
+        self.nodes   = {}
+        for entryid, songid in entries or []:
+            self.Append(entryid, songid)
+
+
+    def __len__(self):
+        return len(self.nodes)
+
+
+    def __iter__(self):
+        node = self.root[1]
+        while node is not self.root:
+            yield (node[2], node[3])
+            node = node[1]
+
+
+    def __contains__(self, entryid):
+        return entryid in self.nodes
+
+
+    def __getitem__(self, index):
+        if type(index) != int:
+            raise TypeError("Index must be an integer!")
+        if index < 0:
+            index += len(self.nodes)
+        if index < 0 or index >= len(self.nodes):
+            raise IndexError("Queue index out of range")
+
+        # Walk from the nearer end
+        if index < len(self.nodes) // 2:
+            node = self.root[1]
+            for i in range(index):
+                node = node[1]
+        else:
+            node = self.root[0]
+            for i in range(len(self.nodes) - 1 - index):
+                node = node[0]
+        return (node[2], node[3])
+
+
+    def __Link(self, previous, entryid, songid):
+        if entryid in self.nodes:
+            raise ValueError("Entry %s is already in the queue"%(str(entryid)))
+        node = [previous, previous[1], entryid, songid]
+        previous[1][0] = node
+        previous[1]    = node
+        self.nodes[entryid] = node
+
+
+    def __Unlink(self, node):
+        node[0][1] = node[1]
+        node[1][0] = node[0]
+
+
+    def Append(self, entryid, songid):
+        """
+        Appends an entry at the end of the list.
+
+        Raises:
+            ValueError: When the entry ID is already in the list
+        """
+        self.__Link(self.root[0], entryid, songid)
+
+
+    def InsertAfter(self, afterid, entryid, songid):
+        """
+        Inserts an entry behind the entry *afterid*.
+        If *afterid* is ``None``, the entry gets inserted at the beginning of the list.
+
+        Returns:
+            ``False`` if *afterid* is not in the list, otherwise ``True``
+
+        Raises:
+            ValueError: When the entry ID is already in the list
+        """
+        if afterid == None:
+            previous = self.root
+        else:
+            previous = self.nodes.get(afterid)
+            if previous == None:
+                return False
+        self.__Link(previous, entryid, songid)
+        return True
+
+
+    def PopFirst(self):
+        """
+        Removes the first entry.
+
+        Returns:
+            The removed entry as tuple ``(entryid, songid)``
+
+        Raises:
+            IndexError: When the list is empty
+        """
+        if not self.nodes:
+            raise IndexError("pop from empty queue")
+        node = self.root[1]
+        self.__Unlink(node)
+        del self.nodes[node[2]]
+        return (node[2], node[3])
+
+
+    def Remove(self, entryid):
+        """
+        Removes the entry *entryid*.
+
+        Returns:
+            ``False`` if the entry is not in the list, otherwise ``True``
+        """
+        node = self.nodes.pop(entryid, None)
+        if node == None:
+            return False
+        self.__Unlink(node)
+        return True
+
+
+    def MoveAfter(self, entryid, afterid):
+        """
+        Moves the entry *entryid* behind the entry *afterid*.
+
+        Returns:
+            ``False`` if one of the entries is not in the list or if both IDs are the same, otherwise ``True``
+        """
+        node     = self.nodes.get(entryid)
+        previous = self.nodes.get(afterid)
+        if node == None or previous == None or node is previous:
+            return False
+
+        self.__Unlink(node)
+        node[0] = previous
+        node[1] = previous[1]
+        previous[1][0] = node
+        previous[1]    = node
+        return True
+
+
+    def GetSongId(self, entryid):
+        """
+        Returns:
+            The song ID of the entry *entryid*, or ``None`` if the entry is not in the list
+        """
+        node = self.nodes.get(entryid)
+        if node == None:
+            return None
+        return node[3]
+
 
 
 class SongQueue(object):
     """
     This class implements a queue to manage songs to play.
-    Whenever the queue changes, it gets stored in the MusicDB State Directory
+    Whenever the queue changes, the change gets stored in the MusicDB State Directory (see `Persistence`_).
 
     When the constructor detects that there is no queue yet (not even an empty one),
     it tries to load the stored queue.
@@ -133,7 +370,7 @@ class SongQueue(object):
                     self.Load()
                 except Exception as e:
                     logging.warning("Loading song queue failed with error: %s. \033[1;30m(Creating an empty one)", str(e))
-                    Queue = []
+                    Queue = QueueList()
 
 
 
@@ -209,13 +446,15 @@ class SongQueue(object):
         See :meth:`~TriggerEvent` with event name ``"QueueChanged"``.
         More details in the module description at the top of this document.
 
-        This method also tries to save the queue into the MusicDB State Directory.
+        The change itself already got stored when the queue was changed (see `Persistence`_).
+        The argument of the event is the current version of the queue (see `Versions`_).
         """
-        try:
-            self.Save()
-        except Exception as e:
-            logging.warning("Saving the current song queue failed with error: %s. \033[1;30m(Continuing without saving)", str(e))
-        self.TriggerEvent("QueueChanged")
+        global QueueLock
+        global QueueVersion
+
+        with QueueLock:
+            version = QueueVersion
+        self.TriggerEvent("QueueChanged", version)
 
     def Event_SongChanged(self):
         """
@@ -234,31 +473,172 @@ class SongQueue(object):
 
     def Save(self):
         """
-        Save the current queue into a csv file in the MusicDB State Directory.
-        Therefor the :meth:`lib.cfg.mdbstate.MDBState.SaveSongQueue` gets used.
+        Save the current queue into the MusicDB State Directory.
+        The operation log gets replaced by a compacted one via :meth:`lib.cfg.mdbstate.MDBState.WriteSongQueueLog`.
+        Furthermore the queue gets stored as csv file via :meth:`lib.cfg.mdbstate.MDBState.SaveSongQueue`.
+
+        Usually there is no need to call this method, because each change gets stored in the log
+        and the log gets compacted automatically.
 
         Returns:
             *Nothing*
         """
         global Queue
         global QueueLock
+        global QueueLogLength
 
         with QueueLock:
-            self.mdbstate.SaveSongQueue(Queue)
+            self.mdbstate.WriteSongQueueLog([("add", "last", entryid, songid) for entryid, songid in Queue])
+            QueueLogLength = len(Queue)
+            if Queue:
+                self.mdbstate.SaveSongQueue(Queue)
+
 
     def Load(self):
         """
         This method loads the last stored song queue for the MusicDB State Directory
-        via :meth:`lib.cfg.mdbstate.MDBState.LoadSongQueue`.
+        by replaying the operation log read via :meth:`lib.cfg.mdbstate.MDBState.ReadSongQueueLog`.
+        Invalid operations get ignored.
+
+        If there is no log, the queue gets loaded via :meth:`lib.cfg.mdbstate.MDBState.LoadSongQueue`.
+        Afterwards the log gets compacted via :meth:`~Save`.
+
+        The loaded queue gets a new version without any changes that lead to it.
 
         Returns:
             *Nothing*
         """
         global Queue
         global QueueLock
+        global QueueLogLength
+        global QueueVersion
+        global QueueChanges
 
         with QueueLock:
-            Queue = self.mdbstate.LoadSongQueue()
+            QueueVersion += 1
+            QueueChanges.clear()
+
+            operations = self.mdbstate.ReadSongQueueLog()
+            if operations == None:
+                Queue = QueueList(self.mdbstate.LoadSongQueue())
+            else:
+                Queue = QueueList()
+                for operation in operations:
+                    try:
+                        self.__Modify(operation)
+                    except Exception as e:
+                        logging.warning("Invalid entry in stored Song Queue log: \"%s\"! \033[1;30m(Entry will be ignored)", ",".join(operation))
+
+            # Start with a compacted log. This also removes an incomplete last line.
+            try:
+                self.Save()
+            except Exception as e:
+                logging.warning("Compacting the song queue log failed with error: %s. \033[1;30m(Continuing without saving)", str(e))
+                QueueLogLength = len(operations) if operations else 0
+
+
+    def __Modify(self, operation):
+        # Applies an operation as described in the module description to the queue.
+        # This is the only place where the queue gets changed, for changes as well as for replaying the log.
+        # The caller must hold the QueueLock.
+        # Returns False if the operation cannot be applied.
+        global Queue
+
+        name = operation[0]
+        if name == "add":
+            position = operation[1]
+            entry    = (int(operation[2]), int(operation[3]))
+            if position == "next":
+                Queue.InsertAfter(Queue[0][0] if Queue else None, *entry)
+            elif position == "last":
+                Queue.Append(*entry)
+            else:
+                raise ValueError("Invalid position \"%s\""%(str(position)))
+
+        elif name == "next":
+            if len(Queue) == 0:
+                return False
+            Queue.PopFirst()
+
+        elif name == "remove":
+            entryid = int(operation[1])
+            return Queue.Remove(entryid)
+
+        elif name == "move":
+            entryid = int(operation[1])
+            afterid = int(operation[2])
+
+            if entryid not in Queue:
+                logging.warning("Cannot find element with entryid %i in the queue!\033[1;30m (Doning nothing)", entryid)
+                return False
+            if afterid not in Queue:
+                logging.warning("Cannot find element with afterid %i in the queue!\033[1;30m (Doning nothing)", afterid)
+                return False
+
+            return Queue.MoveAfter(entryid, afterid)
+
+        else:
+            raise ValueError("Unknown operation \"%s\""%(str(name)))
+
+        return True
+
+
+    def __DescribeChange(self, operation):
+        # Returns the change as described in the module description (see Versions) an operation will do.
+        # Positions get resolved to entry IDs, so the change can be applied without knowing the position of the current song.
+        # The caller must hold the QueueLock, and must call this method before the operation gets applied.
+        global Queue
+
+        name = operation[0]
+        if name == "add":
+            if not Queue:
+                afterid = None
+            elif operation[1] == "next":
+                afterid = Queue[0][0]
+            else:
+                afterid = Queue[-1][0]
+            return ("insert", int(operation[2]), int(operation[3]), afterid)
+
+        elif name == "next":
+            return ("advance", Queue[0][0] if Queue else None)
+
+        elif name == "remove":
+            return ("remove", int(operation[1]))
+
+        elif name == "move":
+            return ("move", int(operation[1]), int(operation[2]))
+
+        return None
+
+
+    def __Change(self, operation):
+        # Applies an operation to the queue, records the change and appends it to the log.
+        # The caller must hold the QueueLock, so that the order of the operations in the log is the order they were applied.
+        global Queue
+        global QueueLogLength
+        global QueueVersion
+        global QueueChanges
+
+        change = self.__DescribeChange(operation)
+        if not self.__Modify(operation):
+            return False
+
+        QueueVersion += 1
+        QueueChanges.append((QueueVersion, change))
+
+        try:
+            self.mdbstate.AppendSongQueueLog(operation)
+            QueueLogLength += 1
+        except Exception as e:
+            logging.warning("Appending to the song queue log failed with error: %s. \033[1;30m(Saving the whole queue instead)", str(e))
+            QueueLogLength = None
+
+        if QueueLogLength == None or QueueLogLength > max(SONGQUEUE_MAXLOGLENGTH, 4 * len(Queue)):
+            try:
+                self.Save()
+            except Exception as e:
+                logging.warning("Saving the current song queue failed with error: %s. \033[1;30m(Continuing without saving)", str(e))
+        return True
 
 
 
@@ -392,11 +772,10 @@ class SongQueue(object):
                 return (None, None)
 
             # Get next song
-            if len(Queue) == 1:
-                Queue.pop(0)
+            self.__Change(("next",))
+            if len(Queue) == 0:
                 entry = (None, None)
-            else:   # > 1
-                Queue.pop(0)
+            else:
                 entry = Queue[0]
 
             # Make sure the queue never runs empty
@@ -434,7 +813,92 @@ class SongQueue(object):
 
         """
         global Queue
-        return list(Queue)
+        global QueueLock
+
+        with QueueLock:
+            return list(Queue)
+
+
+
+    def GetVersionedQueue(self):
+        """
+        This method returns a copy of the song queue together with its version (see `Versions`_).
+        The queue is the same list as returned by :meth:`~GetQueue`.
+
+        Returns:
+            A tuple ``(version, queue)``
+
+        Example:
+
+            .. code-block:: python
+
+                version, queue = songqueue.GetVersionedQueue()
+
+                # … later
+                result = songqueue.GetQueueChanges(version)
+        """
+        global Queue
+        global QueueLock
+        global QueueVersion
+
+        with QueueLock:
+            return (QueueVersion, list(Queue))
+
+
+
+    def GetQueueChanges(self, version):
+        """
+        This method returns all changes of the queue since *version*.
+        Each change is a tuple ``(version, change)`` with the version the queue had after the change.
+        The changes are described in the module description (see `Versions`_).
+
+        Only the last *QUEUECHANGES_MAXLEN* changes are available.
+        If there are changes missing, ``None`` gets returned.
+        Then the whole queue must be read again via :meth:`~GetVersionedQueue`.
+
+        Args:
+            version (int): The version of the queue known by the caller
+
+        Returns:
+            A tuple ``(version, changes)`` with the current version and a list of the changes since *version*, or ``None``
+
+        Raises:
+            TypeError: When ``version`` is not of type ``int``
+
+        Example:
+
+            .. code-block:: python
+
+                version, queue = songqueue.GetVersionedQueue()
+
+                songqueue.NextSong()
+
+                result = songqueue.GetQueueChanges(version)
+                if result == None:
+                    version, queue = songqueue.GetVersionedQueue()
+                else:
+                    version, changes = result
+                    print(changes)  # [(version, ("advance", entryid)), …]
+        """
+        if type(version) != int:
+            raise TypeError("Version must be an integer!")
+
+        global QueueLock
+        global QueueVersion
+        global QueueChanges
+
+        with QueueLock:
+            if version == QueueVersion:
+                return (QueueVersion, [])
+
+            # From the future (before a restart) or too old
+            if version > QueueVersion:
+                return None
+            if not QueueChanges or QueueChanges[0][0] > version + 1:
+                return None
+
+            changes = [(v, change) for v, change in QueueChanges if v > version]
+            return (QueueVersion, changes)
 
 
 
@@ -473,13 +937,10 @@ class SongQueue(object):
         global QueueLock
 
         with QueueLock:
-            if position == "next":
-                Queue.insert(1, (entryid, songid))
-            elif position == "last":
-                Queue.append((entryid, songid))
-            else:
+            if position not in ["next", "last"]:
                 logging.warning("Position must have the value \"next\" or \"last\". Given was \"%s\". \033[1;30m(Doing nothing)", str(position))
                 return
+            self.__Change(("add", position, entryid, songid))
 
         self.Event_QueueChanged()
 
@@ -496,6 +957,7 @@ class SongQueue(object):
 
         When there is an album ID, the randoms song gets selected from that album using :meth:`mdbapi.randy.Randy.GetSongFromAlbum`.
         If the album ID is ``None``, the method :meth:`mdbapi.randy.Randy.GetSong` will be used to get a random song from the activated genres.
+        The song that will be played before the new one gets passed to Randy, so that it can choose a related song (see :doc:`/mdbapi/randy`).
 
         After selecting the random song, the :meth:`~AddSong` method gets used to insert the new song into the queue.
         If there is no song found by Randy, then nothing gets added to the queue and ``False`` will be returned.
@@ -518,7 +980,15 @@ class SongQueue(object):
         if albumid:
             mdbsong = self.randy.GetSongFromAlbum(albumid)
         else:
-            mdbsong = self.randy.GetSong()
+            global Queue
+            global QueueLock
+            with QueueLock:
+                previoussongid = None
+                if Queue and position == "next":
+                    previoussongid = Queue[0][1]
+                elif Queue:
+                    previoussongid = Queue[-1][1]
+            mdbsong = self.randy.GetSong(previoussongid)
 
         if not mdbsong:
             return False
@@ -548,9 +1018,9 @@ class SongQueue(object):
         global QueueLock
 
         with QueueLock:
-            for eid, songid in Queue:
-                if eid == entryid:
-                    return songid
+            songid = Queue.GetSongId(entryid)
+        if songid != None:
+            return songid
 
         logging.debug("Cannot find the requested entry %s! \033[1;30m(Returning None)", str(entryid))
         return None
@@ -591,7 +1061,7 @@ class SongQueue(object):
                 logging.warning("The entry ID addresses the current song. This entry cannot be removed!")
                 return False
 
-            Queue = [entry for entry in Queue if entry[0] != entryid]
+            self.__Change(("remove", entryid))
 
             # Make sure the queue never runs empty
             if len(Queue) < 2:
@@ -635,28 +1105,9 @@ class SongQueue(object):
                 logging.warning("The entry ID addresses the current song. This entry cannot be moved!")
                 return False
 
-            # Get Positions
-            frompos = [pos for pos, entry in enumerate(Queue) if entry[0] == entryid]
-            topos   = [pos for pos, entry in enumerate(Queue) if entry[0] == afterid]
-
-            if not frompos:
-                logging.warning("Cannot find element with entryid %i in the queue!\033[1;30m (Doning nothing)", entryid)
-                return False
-            if not topos:
-                logging.warning("Cannot find element with afterid %i in the queue!\033[1;30m (Doning nothing)", afterid)
+            if not self.__Change(("move", entryid, afterid)):
                 return False
 
-            frompos = frompos[0]
-            topos   = topos[0]
-
-            # When topos is behind frompos, decrement topos because if shifts one entry down due to popping the frompos-element from the list
-            if topos < frompos:
-                topos += 1
-
-            # Move element
-            entry = Queue.pop(frompos)
-            Queue.insert(topos, entry)
-
         self.Event_QueueChanged()
         return True
 
@@ -63,6 +63,38 @@ It contains the following information:
     * ``isplaying`` (bool): ``True`` when streaming, otherwise ``False``
 
 
+Lookahead
+^^^^^^^^^
+
+Creating the GStreamer Pipeline to transcode a song takes some time.
+To avoid a gap between two songs, the thread starts transcoding the next song of the queue
+*STREAM_LOOKAHEAD* seconds before the current song ends.
+The frames get stored in a :class:`lib.stream.mp3stream.BufferedMP3Stream` with at most *STREAM_BUFFERFRAMES* frames.
+
+While the lookahead is active, the thread checks every second if the next entry of the queue is still the prepared one.
+If the queue changed, the prepared stream gets canceled and the new next song gets prepared.
+When the current song is finished and the prepared entry became the current song,
+its frames get streamed right after the last frame of the previous song.
+Otherwise the song gets transcoded when its streaming starts, as without lookahead.
+
+
+Song Sources
+^^^^^^^^^^^^
+
+Transcoding a song via GStreamer is not necessary when there is already an mp3 file with the encoding of the stream
+(MPEG Layer III, 320kb/s, 44.1kHz, stereo or joint stereo, constant bit rate).
+Such a file gets streamed directly via :class:`lib.stream.mp3file.MP3FileStream`
+that reads the frames from the file mapped into memory.
+
+:meth:`~OpenSong` looks for such a file in the following order:
+
+    #. The song in the :doc:`/mdbapi/musiccache` (``[music]->cache``), if the cache directory exists
+    #. The song file itself, if it is an mp3 file
+
+If there is no compatible file, the song gets transcoded.
+The CPU time of both ways can be compared with the ``stream`` benchmark of the :doc:`/mod/benchmark` module.
+
+
 Command Queue
 -------------
 
@@ -128,6 +160,7 @@ Example:
 """
 
 
+import os
 import time
 import logging
 import threading
@@ -136,6 +169,8 @@ from lib.cfg.musicdb    import MusicDBConfig
 from lib.db.musicdb     import MusicDatabase
 from mdbapi.songqueue      import SongQueue
 from mdbapi.randy       import Randy
+from lib.stream.mp3stream   import BufferedMP3Stream
+from lib.stream.mp3file     import MP3FileStream
 
 
 Config          = None
@@ -145,6 +180,9 @@ RunThread       = False
 CommandQueue    = []
 State           = {}
 
+STREAM_LOOKAHEAD    = 10    # Seconds before the end of a song when the next song gets prepared
+STREAM_BUFFERFRAMES = 500   # Maximum number of prepared frames (~13s at 320kb/s)
+
 
 
 #####################################################################
@@ -242,9 +280,13 @@ def StreamingThread():
         * ``TimeChanged``: To update the current streaming progress of a song
 
     The ``TimeChanged`` event gets triggered approximately every second.
+
+    Near the end of a song, the next song of the queue gets prepared as described in `Lookahead`_.
+    Songs that are available as mp3 file with the encoding of the stream do not get transcoded (see `Song Sources`_).
     """
     from lib.stream.icecast import IcecastInterface
     from mdbapi.tracker     import Tracker
+    from mdbapi.musiccache  import MusicCache
 
     global Config
     global RunThread
@@ -252,11 +294,17 @@ def StreamingThread():
     global State
 
     # Create all interfaces that are needed by this Thread
-    musicdb = MusicDatabase(Config.database.path)
+    musicdb = MusicDatabase(Config.database.host, Config.database.port, Config.database.name, Config.database.user, Config.database.password, Config.database.charset, Config.database)
     tracker = Tracker(Config, musicdb)
     filesystem = Filesystem(Config.music.path)
     queue   = SongQueue(Config, musicdb)
     randy   = Randy(Config, musicdb)
+    # The MP3 cache is optional
+    if os.path.isdir(Config.music.cache):
+        musiccache = MusicCache(Config, musicdb)
+    else:
+        logging.info("There is no MP3 cache at %s. \033[1;30m(Songs will not be streamed from the cache)", Config.music.cache)
+        musiccache = None
     icecast = IcecastInterface(
             port      = Config.icecast.port,
             user      = Config.icecast.user,
@@ -265,12 +313,15 @@ def StreamingThread():
             )
     icecast.Mute()
 
+    lookahead = None    # (entryid, path, stream) of the prepared next song
+
     while RunThread:
         # Sleep a bit to reduce the load on the CPU. If disconnected, sleep a bit longer
-        if State["isconnected"]:
-            time.sleep(0.1)
-        else:
+        # When the next song is already prepared, continue without a gap.
+        if not State["isconnected"]:
             time.sleep(2)
+        elif lookahead == None:
+            time.sleep(0.1)
 
         # Check connection to Icecast, and connect if disconnected.
         isconnected = icecast.IsConnected()
@@ -293,7 +344,18 @@ def StreamingThread():
             continue
 
         mdbsong  = musicdb.GetSongById(currentsongid)
-        songpath = filesystem.AbsolutePath(mdbsong["path"])
+
+        # Use the prepared stream if the prepared entry is the current one
+        mp3stream = None
+        if lookahead != None:
+            if lookahead[0] == currententryid:
+                songpath, mp3stream = lookahead[1], lookahead[2]
+            elif lookahead[2]:
+                lookahead[2].Cancel()
+            lookahead = None
+
+        if mp3stream == None:
+            songpath, mp3stream = OpenSong(mdbsong, filesystem, musiccache)
 
 
         # Stream song
@@ -301,7 +363,7 @@ def StreamingThread():
         logging.debug("Start streaming %s", songpath)
         timeplayed    = 0
         lasttimestamp = time.time()
-        for frameinfo in icecast.StreamFile(songpath):
+        for frameinfo in icecast.StreamFile(songpath, mp3stream):
             # Send every second the estimated time position of the song.
             if not frameinfo["muted"]:
                 timeplayed += frameinfo["header"]["frametime"]
@@ -311,6 +373,10 @@ def StreamingThread():
                 Event_TimeChanged(timeplayed/1000)
                 lasttimestamp = timestamp
 
+                # Prepare the next song when the current one is about to end
+                if mdbsong["playtime"] - timeplayed/1000 <= STREAM_LOOKAHEAD:
+                    lookahead = UpdateLookahead(queue, musicdb, filesystem, musiccache, lookahead)
+
             # Check if the thread shall be exit
             if not RunThread:
                 break
@@ -344,12 +410,118 @@ def StreamingThread():
                 State["isconnected"] = False
                 Event_StatusChanged()
 
+        # Stop transcoding if the song got not streamed completely
+        if mp3stream:
+            mp3stream.Cancel()
+
         # Current song completely streamed. Get next one.
         # When the song was stopped to shutdown the server, do not skip to the next one
         # In case the loop stopped because of an Icecast error, stay at the last song.
         if RunThread and icecast.IsConnected():
             queue.NextSong()
 
+    if lookahead != None and lookahead[2]:
+        lookahead[2].Cancel()
+
+    # Write the relations the tracker may still have buffered
+    tracker.Shutdown()
+
+
+
+def OpenSong(mdbsong, filesystem, musiccache, buffered=False):
+    """
+    This function opens the source of the frames of a song as described in `Song Sources`_.
+
+    If there is an mp3 file with the encoding of the stream, a :class:`lib.stream.mp3file.MP3FileStream` for that file gets returned.
+    Otherwise the song must be transcoded.
+    Then, if *buffered* is ``True``, a :class:`lib.stream.mp3stream.BufferedMP3Stream` gets returned that already started transcoding.
+    If *buffered* is ``False``, no stream gets returned,
+    so that :meth:`lib.stream.icecast.IcecastInterface.StreamFile` transcodes the song while streaming.
+
+    The returned stream must be canceled via its ``Cancel`` method when it is not needed anymore.
+
+    Args:
+        mdbsong: The song entry from the database
+        filesystem: A :class:`~lib.filesystem.Filesystem` instance for the music directory
+        musiccache: A :class:`mdbapi.musiccache.MusicCache` instance, or ``None`` if there is no MP3 cache
+        buffered (bool): Start transcoding in background when the song must be transcoded
+
+    Returns:
+        A tuple ``(path, stream)`` with the absolute path of the file that gets streamed and the stream, or ``None`` instead of the stream
+    """
+    songpath = filesystem.AbsolutePath(mdbsong["path"])
+
+    paths = []
+    if musiccache and mdbsong["checksum"]:
+        cachepath = musiccache.GetSongPath(mdbsong, absolute=True)
+        if cachepath:
+            paths.append(cachepath)
+    if songpath.lower().endswith(".mp3"):
+        paths.append(songpath)
+
+    for path in paths:
+        if not os.path.isfile(path):
+            continue
+
+        try:
+            mp3stream = MP3FileStream(path)
+        except Exception as e:
+            logging.warning("Opening \"%s\" failed with error: %s \033[1;30m(Trying next source)", path, str(e))
+            continue
+
+        if mp3stream.IsCompatible():
+            return (path, mp3stream)
+        mp3stream.Cancel()
+
+    if buffered:
+        return (songpath, BufferedMP3Stream(songpath, STREAM_BUFFERFRAMES))
+    return (songpath, None)
+
+
+
+def UpdateLookahead(queue, musicdb, filesystem, musiccache, lookahead):
+    """
+    This function prepares the next song of the queue as described in `Lookahead`_.
+    It gets called by the :meth:`~StreamingThread` approximately every second near the end of the current song.
+
+    If the prepared entry is still the next entry of the queue, nothing happens.
+    Otherwise the prepared stream gets canceled and the new next entry gets opened via :meth:`~OpenSong`.
+
+    Args:
+        queue: A :class:`mdbapi.songqueue.SongQueue` instance
+        musicdb: A :class:`~lib.db.musicdb.MusicDatabase` instance
+        filesystem: A :class:`~lib.filesystem.Filesystem` instance for the music directory
+        musiccache: A :class:`mdbapi.musiccache.MusicCache` instance, or ``None`` if there is no MP3 cache
+        lookahead: The tuple ``(entryid, path, stream)`` returned by the last call, or ``None``
+
+    Returns:
+        A tuple ``(entryid, path, stream)`` with the entry ID of the prepared song and the return values of :meth:`~OpenSong`, or ``None``
+    """
+    entries = queue.GetQueue()
+    if len(entries) > 1:
+        nextentryid, nextsongid = entries[1]
+    else:
+        nextentryid, nextsongid = None, None
+
+    if lookahead != None:
+        if lookahead[0] == nextentryid:
+            return lookahead
+
+        logging.debug("Next song in queue changed. \033[1;30m(Canceling the prepared one)")
+        if lookahead[2]:
+            lookahead[2].Cancel()
+
+    if nextentryid == None:
+        return None
+
+    mdbsong = musicdb.GetSongById(nextsongid)
+    if not mdbsong:
+        return None
+
+    songpath, mp3stream = OpenSong(mdbsong, filesystem, musiccache, buffered=True)
+    logging.debug("Preparing %s", songpath)
+    return (nextentryid, songpath, mp3stream)
+
 
 
 #####################################################################
@@ -73,8 +73,9 @@ class MusicDBTags(object):
 
         histogram = {}
         # Get genres of all songs on the album
+        tagmap = self.db.GetTargetTagsForMany("song", [song["id"] for song in songs])
         for song in songs:
-            tags = self.db.GetTargetTags("song", song["id"])
+            tags = tagmap.get(song["id"])
             if not tags:
                 continue
 
@@ -25,6 +25,9 @@ The Tracker consists of two parts:
     * The **Tracker** class (:class:`~mdbapi.tracker.Tracker`) tracking songs with an internal queue that holds the last played songs.
     * The **Tracker Database** (:class:`~lib.db.trackerdb.TrackerDatabase`) that stores the tracked song relations.
 
+Each new relation also gets added to the in-memory relation graph (see :doc:`/mdbapi/relationgraph`),
+so the graph stays up to date without reloading it from the database.
+
 Example:
 
     .. code-block:: python
@@ -37,13 +40,25 @@ Example:
         tracker.AddSong("Unicorn/2000 - Honey Horn/13 Rainbow Song.mp3")
         tracker.AddSong("Truther/2013 - Real Album/23 Illuminati.mp3")
 
+Buffering
+---------
+
+When ``[tracker]->buffered`` is ``True`` in the MusicDB Configuration,
+the relations do not get written to the database immediately.
+They get collected in memory and a background thread writes them every ``[tracker]->flushinterval`` seconds
+via :meth:`lib.db.trackerdb.TrackerDatabase.AddRelations`.
+So :meth:`~mdbapi.tracker.Tracker.AddSong` never waits for the database.
+Before shutting down, :meth:`~mdbapi.tracker.Tracker.Shutdown` must be called to write the remaining relations.
+
 """
 
 import logging
 import time
+import threading
 from lib.db.musicdb     import MusicDatabase
 from lib.db.trackerdb   import TrackerDatabase
 from lib.cfg.musicdb    import MusicDBConfig
+from mdbapi.relationgraph import RelationGraph
 
 
 
@@ -80,15 +95,107 @@ class Tracker(object):
         self.lastsongid = None
         self.lastaction = time.time()
 
+        # Buffer for relations that were not written to the database yet: (target, ida, idb) -> weight
+        self.buffered      = config.tracker.buffered
+        self.flushinterval = config.tracker.flushinterval
+        self.buffer        = {}
+        self.bufferlock    = threading.Lock()
+        self.flushthread   = None
+        self.stopflushing  = threading.Event()
+
         # When tracking is disabled, don't even instantiate the databases.
         # Tracking is disabled for a reason, so protect the databases as good as possible!
         if not self.disabled:
-            self.trackerdb = TrackerDatabase(config.tracker.dbpath)
+            self.trackerdb = TrackerDatabase(config.tracker.host, config.tracker.port, config.tracker.name, config.tracker.user, config.tracker.password, config.tracker.charset, config.database)
+            self.graph     = RelationGraph(config)
             if musicdb:
                 self.musicdb = musicdb
             else:
-                self.musicdb = MusicDatabase(config.database.path)
+                self.musicdb = MusicDatabase(config.database.host, config.database.port, config.database.name, config.database.user, config.database.password, config.database.charset, config.database)
+
+            if self.buffered:
+                self.flushthread = threading.Thread(target=self.__FlushThread, daemon=True)
+                self.flushthread.start()
+
+
+
+    def __FlushThread(self):
+        # Event.wait returns True when Shutdown was called
+        while not self.stopflushing.wait(self.flushinterval):
+            self.Flush()
+
+
+
+    def Flush(self):
+        """
+        This method writes all buffered relations to the tracker database.
+        If writing fails, the relations stay in the buffer and will be written with the next flush.
+        When buffering is disabled, there is nothing to do.
+
+        Returns:
+            ``True`` on success. ``False`` in case an error occurred.
+        """
+        with self.bufferlock:
+            buffer      = self.buffer
+            self.buffer = {}
+
+        if not buffer:
+            return True
+
+        relations = {"song": [], "artist": []}
+        for (target, ida, idb), weight in buffer.items():
+            relations[target].append((ida, idb, weight))
+
+        try:
+            for target in ["song", "artist"]:
+                self.trackerdb.AddRelations(target, relations[target])
+                relations[target] = []  # written
+        except Exception as e:
+            logging.error("trackerdb.AddRelations failed with error \"%s\"! \033[1;30m(Relations will be written with the next flush)", str(e))
+            # Put the relations that were not written back into the buffer
+            with self.bufferlock:
+                for target in ["song", "artist"]:
+                    for ida, idb, weight in relations[target]:
+                        key = (target, ida, idb)
+                        self.buffer[key] = self.buffer.get(key, 0) + weight
+            return False
+
+        logging.debug("Flushed %i buffered relations", len(buffer))
+        return True
+
+
+
+    def Shutdown(self):
+        """
+        This method stops the background thread that flushes the buffered relations and writes the remaining relations.
+        It must be called before the tracker gets destroyed, otherwise buffered relations get lost.
+
+        Returns:
+            ``True`` on success. ``False`` in case an error occurred.
+        """
+        if self.flushthread:
+            self.stopflushing.set()
+            self.flushthread.join()
+            self.flushthread = None
+
+        if self.disabled:
+            return True
+        return self.Flush()
+
+
+
+    def __StoreRelation(self, target, ida, idb):
+        if not self.buffered:
+            self.trackerdb.AddRelation(target, ida, idb)
+        elif ida != idb:
+            if ida > idb:
+                idb, ida = ida, idb
+            with self.bufferlock:
+                key = (target, ida, idb)
+                self.buffer[key] = self.buffer.get(key, 0) + 1
 
+        # A buffered relation is in the graph before it is in the database
+        self.graph.AddRelation(target, ida, idb)
 
 
 
@@ -107,7 +214,9 @@ class Tracker(object):
         This is the case when there was previously a song added.
 
         If there is a relation to track then the songs get loaded from the :class:`lib.db.musicdb.MusicDatabase` to get the artist IDs.
-        The relation gets added to the tracker database by calling :meth:`lib.db.trackerdb.TrackerDatabase.AddRelation`
+        The relation gets added to the tracker database by calling :meth:`lib.db.trackerdb.TrackerDatabase.AddRelation`.
+        If buffering is enabled, the relation gets added to the buffer instead (see :meth:`~Flush`).
+        In both cases the relation gets added to the relation graph via :meth:`mdbapi.relationgraph.RelationGraph.AddRelation`.
 
         Args:
             songid: song ID of the song that gets currently played, ``None`` to cut the chain of consecutive songs.
@@ -164,8 +273,8 @@ class Tracker(object):
 
         # store relation
         try:
-            self.trackerdb.AddRelation("song",   self.lastsongid, songid)
-            self.trackerdb.AddRelation("artist", artistida, artistidb)
+            self.__StoreRelation("song",   self.lastsongid, songid)
+            self.__StoreRelation("artist", artistida, artistidb)
         except Exception as e:
             logging.error("trackerdb.AddRelation failed with error \"%s\"!", str(e))
             return False
@@ -753,7 +753,11 @@ class add(MDBModule, MusicDBDatabase):
             return
         else:
             self.cli.PrintText("\033[1;34mImport album \033[0;36m%s\n"%(newalbumpath))
-            self.AddAlbum(newalbumpath, artist["id"])
+            try:
+                self.AddAlbum(newalbumpath, artist["id"])
+            except Exception as e:
+                self.cli.PrintText("\033[1;31mImporting album failed with error: %s \033[1;30m(Nothing was added to the database)\033[0m\n"%(str(e)))
+                return
 
         # set origin
         album = self.db.GetAlbumByPath(newalbumpath)
@@ -0,0 +1,774 @@
+# MusicDB,  a music manager with web-bases UI that focus on music.
+# Copyright (C) 2017  Ralf Stemmer <ralf.stemmer@gmx.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+This command line module runs benchmarks on a synthetic music library.
+
+The synthetic library gets created in a separate database (default: ``musicdbbenchmark``) on the same server
+that is configured in the ``[database]`` section of the MusicDB Configuration.
+The database must exist and must have the same tables as the MusicDB database.
+If it contains less songs than requested, artists, albums and songs with generated names get added.
+**Never use the real MusicDB database for benchmarking!**
+
+The following benchmarks are available:
+
+    reads:
+        Multiple threads read random songs, albums, artists and tags for *duration* seconds.
+        This is done once for each number of threads given via ``--threads``.
+        The read throughput gets measured once with the shared read lock of the database classes
+        and once with an exclusive lock like it was used before introducing the :class:`lib.db.database.ReadWriteLock`.
+
+    import:
+        Imports ``--albums`` synthetic albums with 20 songs and lyrics each, in two ways:
+        Statement by statement like it was done before (:meth:`~lib.db.musicdb.MusicDatabase.AddAlbum`,
+        :meth:`~lib.db.musicdb.MusicDatabase.AddFullSong` and :meth:`~lib.db.musicdb.MusicDatabase.SetLyrics` for each song)
+        and in one transaction per album via :meth:`~lib.db.musicdb.MusicDatabase.AddFullAlbum`.
+
+    random:
+        Measures the latency of :meth:`~lib.db.musicdb.MusicDatabase.GetRandomSong` with a genre filter
+        for each library size (number of albums) given via ``--sizes``.
+        The library grows to each size and every album gets a random genre tag.
+        The former implementation that filtered all albums in Python and queried the songs of each album
+        gets compared to the current one that selects from a candidate list created by a single query.
+        For the current implementation, the first selection (creating the candidate list)
+        and the following selections (using the cached list) are measured separately.
+
+    memory:
+        Loads all artists, albums and songs of a library with ``--songs`` songs and measures the memory via :mod:`tracemalloc`.
+        The former way of reading the rows with a dictionary cursor and creating one more dictionary per row
+        gets compared to the tuple cursor and the compact row objects of :mod:`lib.db.records`.
+        The memory still in use after loading and the peak while loading are reported.
+
+    relations:
+        Measures the selection latency of the relation mode of :class:`mdbapi.randy.Randy` on a library with ``--songs`` songs.
+        Each song gets ``--relations`` synthetic relations to random songs.
+        They get loaded into the relation graph via :meth:`mdbapi.relationgraph.RelationGraph.SetRelations`,
+        so neither the Tracker Database nor the blacklists of the MusicDB State get touched.
+        The time to create the neighbour table gets reported, as well as the latency of choosing a related song
+        from the neighbour table, choosing one by filtering the relations of the graph on each selection,
+        and choosing a song uniformly via :meth:`~lib.db.musicdb.MusicDatabase.GetRandomSong`.
+        Each selection includes reading the chosen song.
+
+    randy:
+        Simulates :meth:`mdbapi.randy.Randy.GetSong` on a library with ``--songs`` songs,
+        ``--songsperalbum`` songs per album and ``--albumsperartist`` albums per artist.
+        The genres of the albums are skewed: The probability of the *n*-th genre is proportional to ``1/n^skew`` (``--skew``).
+        A fraction of the songs (``--songtags``) gets a confirmed song genre that may differ from the album genre.
+        Tags only get set to albums and songs that have no tags yet.
+        For each mode in ``--modes`` and each number of activated genres in ``--filters`` (the rarest genres get activated),
+        ``--picks`` songs get chosen.
+        The genre filter and the blacklists are kept in a temporary MusicDB State Directory,
+        so the state of the MusicDB server does not get touched.
+        Prefetching is disabled.
+        The following is reported:
+
+            * The latency of the first pick that creates the candidate pool
+            * Percentiles of the latency of the following picks
+            * The average number of retries (songs dropped due to the blacklists) per pick
+            * The average number of database queries per pick
+            * The fraction of candidates that got chosen at least once, and the maximum number of times a song got chosen
+            * The total variation distance between the genre distribution of the chosen songs and the one of the candidates.
+              ``0`` means each genre got chosen as often as its share of the candidates.
+
+    stream:
+        Reads all frames of each audio file given via ``--files`` the two ways the Streaming Thread can get them (see :doc:`/mdbapi/stream`):
+        Transcoding the file via :class:`lib.stream.mp3stream.MP3Stream`,
+        and reading the frames directly via :class:`lib.stream.mp3file.MP3FileStream` if the file has the encoding of the stream.
+        The frames get read as fast as possible, without sending them to Icecast.
+        The used CPU time of the MusicDB process gets reported together with the CPU time per stream:
+        The fraction of one CPU core that is needed to provide the frames of one stream in real time.
+        This benchmark does not use the database.
+
+Example:
+
+    .. code-block:: bash
+
+        musicdb benchmark reads --songs 100000 --threads 1,2,4,8,16
+        musicdb benchmark import --albums 50
+        musicdb benchmark random --sizes 1000,10000,100000
+        musicdb benchmark memory --songs 200000
+        musicdb benchmark relations --songs 100000 --relations 10
+        musicdb benchmark randy --songs 200000 --skew 1.0 --filters 10,3,1 --picks 5000
+        musicdb benchmark stream --files /data/mp3cache/1/2/3:checksum.mp3,/data/music/Artist/Album/01\ Song.flac
+"""
+
+import gc
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from lib.modapi      import MDBModule
+from lib.db.database import Database
+from lib.db.musicdb  import MusicDatabase, MusicDatabaseLock, SONG_LYRICSSTATE_FROMFILE
+from lib.db.records  import Artist, Album, Song
+from lib.cfg.mdbstate import MDBState
+from mdbapi.randy    import Randy, SaveBlacklists, NumpyFound
+from mdbapi.relationgraph import RelationGraph
+
+BENCHMARK_GENRES = ["Benchmark Genre %i"%(i) for i in range(10)]
+
+
+class benchmark(MDBModule):
+    def __init__(self, config, database):
+        MDBModule.__init__(self)
+        self.cfg = config
+
+
+    @staticmethod
+    def MDBM_CreateArgumentParser(parserset, modulename):
+        parser = parserset.add_parser(modulename, help="run benchmarks on a synthetic library")
+        parser.set_defaults(module=modulename)
+        parser.add_argument("test", action="store", choices=["reads", "import", "random", "memory", "relations", "randy", "stream"], help="Benchmark to run")
+        parser.add_argument("--dbname", action="store", type=str, default="musicdbbenchmark",
+                help="Name of the database for the synthetic library (default: musicdbbenchmark)")
+        parser.add_argument("--songs", action="store", type=int, default=100000,
+                help="Number of songs of the synthetic library (default: 100000)")
+        parser.add_argument("--threads", action="store", type=str, default="1,2,4,8,16",
+                help="Comma separated list of thread counts (default: 1,2,4,8,16)")
+        parser.add_argument("--duration", action="store", type=float, default=5.0,
+                help="Duration of each run in seconds (default: 5)")
+        parser.add_argument("--albums", action="store", type=int, default=50,
+                help="Number of albums for the import benchmark (default: 50)")
+        parser.add_argument("--sizes", action="store", type=str, default="1000,10000,100000",
+                help="Comma separated list of library sizes in albums for the random benchmark (default: 1000,10000,100000)")
+        parser.add_argument("--samples", action="store", type=int, default=10,
+                help="Number of selections per method and library size for the random benchmark (default: 10)")
+        parser.add_argument("--relations", action="store", type=int, default=10,
+                help="Number of synthetic relations per song for the relations benchmark (default: 10)")
+        parser.add_argument("--songsperalbum", action="store", type=int, default=10,
+                help="Number of songs per album of a new synthetic library (default: 10)")
+        parser.add_argument("--albumsperartist", action="store", type=int, default=10,
+                help="Number of albums per artist of a new synthetic library (default: 10)")
+        parser.add_argument("--skew", action="store", type=float, default=1.0,
+                help="Skew of the genre distribution for the randy benchmark, 0 for uniform (default: 1.0)")
+        parser.add_argument("--songtags", action="store", type=float, default=0.05,
+                help="Fraction of songs with their own genre for the randy benchmark (default: 0.05)")
+        parser.add_argument("--filters", action="store", type=str, default="10,3,1",
+                help="Comma separated list of numbers of activated genres for the randy benchmark (default: 10,3,1)")
+        parser.add_argument("--modes", action="store", type=str, default="random,weighted",
+                help="Comma separated list of Randy modes for the randy benchmark (default: random,weighted)")
+        parser.add_argument("--picks", action="store", type=int, default=5000,
+                help="Number of songs to choose per mode and filter for the randy benchmark (default: 5000)")
+        parser.add_argument("--files", action="store", type=str, default="",
+                help="Comma separated list of absolute paths to audio files for the stream benchmark")
+
+
+
+    def CreateLibrary(self, database, numsongs, songsperalbum=10, albumsperartist=10):
+        """
+        Fills the benchmark database with generated artists, albums and songs until it contains *numsongs* songs.
+
+        Returns:
+            A tuple of lists with all artist IDs, album IDs and song IDs
+        """
+        result   = database.GetFromDatabase("SELECT COUNT(*) FROM songs")
+        existing = result[0][0]
+
+        if existing < numsongs:
+            print("\033[1;34mCreating synthetic library with \033[1;36m%i\033[1;34m songs …\033[0m"%(numsongs - existing))
+            t_start = time.time()
+            songnum = existing
+            while songnum < numsongs:
+                artistnum  = songnum // (songsperalbum * albumsperartist)
+                albumnum   = songnum // songsperalbum
+                artistpath = "Benchmark Artist %06i"%(artistnum)
+                albumpath  = artistpath + "/%i - Benchmark Album %07i"%(2000 + albumnum%20, albumnum)
+
+                artist = database.GetArtistByPath(artistpath)
+                if not artist:
+                    database.AddArtist(artistpath, artistpath)
+                    artist = database.GetArtistByPath(artistpath)
+
+                database.AddAlbum(artist["id"], "Benchmark Album %07i"%(albumnum), albumpath)
+                album = database.GetAlbumByPath(albumpath)
+
+                # One multi-row insert per album
+                rows   = []
+                values = []
+                for number in range(1, songsperalbum+1):
+                    rows.append("(?, ?, ?, ?, ?, 1, 0, ?, 320000)")
+                    values.extend([album["id"], artist["id"], "Benchmark Song %02i"%(number),
+                        albumpath + "/%02i Benchmark Song.mp3"%(number), number, random.randint(60, 600)])
+                sql = "INSERT INTO songs (albumid, artistid, name, path, number, cd, disabled, playtime, bitrate) VALUES "
+                sql+= ", ".join(rows)
+                database.Execute(sql, values)
+
+                songnum += songsperalbum
+                if albumnum % 100 == 0:
+                    print("\r\033[K\033[1;30m%i/%i"%(songnum, numsongs), end="", flush=True)
+
+            print("\r\033[K\033[1;32mLibrary created in %.1fs\033[0m"%(time.time() - t_start))
+
+        artistids = [entry[0] for entry in database.GetFromDatabase("SELECT artistid FROM artists")]
+        albumids  = [entry[0] for entry in database.GetFromDatabase("SELECT albumid FROM albums")]
+        songids   = [entry[0] for entry in database.GetFromDatabase("SELECT songid FROM songs")]
+        return artistids, albumids, songids
+
+
+
+    def ReadWorker(self, database, ids, deadline, exclusive, counter, index):
+        artistids, albumids, songids = ids
+        operations = 0
+        while time.time() < deadline:
+            if exclusive:
+                # Emulate the former global RLock that serialized all accesses
+                MusicDatabaseLock.AcquireWrite()
+            try:
+                database.GetSongById(random.choice(songids))
+                database.GetAlbumById(random.choice(albumids))
+                database.GetArtistById(random.choice(artistids))
+                database.GetSongsByAlbumId(random.choice(albumids))
+                database.GetTargetTags("song", random.choice(songids))
+            finally:
+                if exclusive:
+                    MusicDatabaseLock.ReleaseWrite()
+            operations += 5
+        counter[index] = operations
+
+
+
+    def RunReads(self, database, ids, threadcounts, duration):
+        print("\033[1;34m%8s  %16s  %16s  %8s  %14s\033[0m"%("threads", "shared [ops/s]", "exclusive [ops/s]", "speedup", "avg. wait [ms]"))
+        for numthreads in threadcounts:
+            throughput = {}
+            for exclusive in [False, True]:
+                counter  = [0] * numthreads
+                deadline = time.time() + duration
+                threads  = []
+                for index in range(numthreads):
+                    thread = threading.Thread(target=self.ReadWorker, args=(database, ids, deadline, exclusive, counter, index))
+                    threads.append(thread)
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                throughput[exclusive] = sum(counter) / duration
+
+            stats   = database.GetPoolStatistics()
+            speedup = throughput[False] / throughput[True] if throughput[True] else 0.0
+            print("\033[1;36m%8i  %16.1f  %17.1f  %7.2fx  %14.3f\033[0m"%(numthreads, throughput[False], throughput[True], speedup, stats["avgwaittime"]*1000))
+
+
+
+    def CreateSyntheticAlbum(self, artistid, path, numsongs=20):
+        album = {}
+        album["artistid"]   = artistid
+        album["name"]       = path.split("/")[-1]
+        album["path"]       = path
+        album["numofsongs"] = numsongs
+        album["numofcds"]   = 1
+        album["origin"]     = "CD"
+        album["release"]    = 2000
+
+        songs = []
+        for number in range(1, numsongs+1):
+            song = {}
+            song["artistid"]    = artistid
+            song["albumid"]     = None
+            song["name"]        = "Benchmark Song %02i"%(number)
+            song["path"]        = path + "/%02i Benchmark Song.mp3"%(number)
+            song["number"]      = number
+            song["cd"]          = 1
+            song["disabled"]    = 0
+            song["playtime"]    = random.randint(60, 600)
+            song["bitrate"]     = 320000
+            song["likes"]       = 0
+            song["dislikes"]    = 0
+            song["qskips"]      = 0
+            song["qadds"]       = 0
+            song["qremoves"]    = 0
+            song["favorite"]    = 0
+            song["qrndadds"]    = 0
+            song["lyricsstate"] = SONG_LYRICSSTATE_FROMFILE
+            song["checksum"]    = "%064x"%(random.getrandbits(256))
+            song["lastplayed"]  = 0
+            song["lyrics"]      = "Benchmark lyrics\n" * 40
+            songs.append(song)
+        return album, songs
+
+
+
+    def RunImport(self, database, numalbums):
+        artistpath = "Benchmark Import Artist"
+        artist     = database.GetArtistByPath(artistpath)
+        if not artist:
+            database.AddArtist(artistpath, artistpath)
+            artist = database.GetArtistByPath(artistpath)
+
+        runid  = int(time.time())
+        timing = {}
+
+        # Statement by statement
+        t_start = time.time()
+        for albumnum in range(numalbums):
+            album, songs = self.CreateSyntheticAlbum(artist["id"], artistpath + "/%i - Single %i"%(runid, albumnum))
+            database.AddAlbum(artist["id"], album["name"], album["path"])
+            entry = database.GetAlbumByPath(album["path"])
+            for song in songs:
+                song["albumid"] = entry["id"]
+                database.AddFullSong(song)
+                database.SetLyrics(song["id"], song["lyrics"], SONG_LYRICSSTATE_FROMFILE)
+            album["id"]          = entry["id"]
+            album["artworkpath"] = entry["artworkpath"]
+            album["bgcolor"]     = entry["bgcolor"]
+            album["fgcolor"]     = entry["fgcolor"]
+            album["hlcolor"]     = entry["hlcolor"]
+            database.WriteAlbum(album)
+        timing["single"] = time.time() - t_start
+
+        # Bulk
+        t_start = time.time()
+        for albumnum in range(numalbums):
+            album, songs = self.CreateSyntheticAlbum(artist["id"], artistpath + "/%i - Bulk %i"%(runid, albumnum))
+            database.AddFullAlbum(album, songs)
+        timing["bulk"] = time.time() - t_start
+
+        print("\033[1;34m%12s  %10s  %14s\033[0m"%("method", "total [s]", "per album [ms]"))
+        for method in ["single", "bulk"]:
+            print("\033[1;36m%12s  %10.2f  %14.1f\033[0m"%(method, timing[method], timing[method]*1000/numalbums))
+        print("\033[1;34mSpeedup: \033[1;36m%.2fx\033[0m"%(timing["single"] / timing["bulk"]))
+
+
+
+    def TagAlbums(self, database, skew=0.0):
+        """
+        Makes sure the benchmark genres exist and sets one random genre to each album that has no tags yet.
+        The probability of the *n*-th genre is proportional to ``1/n^skew``.
+
+        Returns:
+            A list of the genre tag IDs
+        """
+        for genre in BENCHMARK_GENRES:
+            if not database.GetTagByName(genre, MusicDatabase.TAG_CLASS_GENRE):
+                database.CreateTag(genre, MusicDatabase.TAG_CLASS_GENRE)
+        tagids = [database.GetTagByName(genre, MusicDatabase.TAG_CLASS_GENRE)["id"] for genre in BENCHMARK_GENRES]
+
+        sql    = "SELECT albumid FROM albums WHERE albumid NOT IN (SELECT albumid FROM albumtags)"
+        result = database.GetFromDatabase(sql)
+        weights = [1.0 / (n ** skew) for n in range(1, len(tagids)+1)]
+        values  = [(entry[0], tagid, 1.0, 1) for entry, tagid in zip(result, random.choices(tagids, weights, k=len(result)))]
+        if values:
+            sql = "INSERT INTO albumtags (albumid, tagid, confidence, approval) VALUES (?, ?, ?, ?)"
+            database.ExecuteMany(sql, values)
+        database.InvalidateRandomCandidates()
+        return tagids
+
+
+
+    def TagSongs(self, database, tagids, fraction):
+        """
+        Sets a random confirmed genre to the given fraction of songs.
+        Songs that already have tags do not get changed.
+        """
+        sql    = "SELECT songid FROM songs WHERE songid NOT IN (SELECT songid FROM songtags)"
+        result = database.GetFromDatabase(sql)
+        values = [(entry[0], random.choice(tagids), 1.0, 1) for entry in result if random.random() < fraction]
+        if values:
+            sql = "INSERT INTO songtags (songid, tagid, confidence, approval) VALUES (?, ?, ?, ?)"
+            database.ExecuteMany(sql, values)
+        database.InvalidateRandomCandidates()
+
+
+
+    def CountQueries(self, database):
+        """
+        Counts the calls of :meth:`~lib.db.database.Database.GetFromDatabase` of the *database* instance.
+
+        Returns:
+            A list with one element: the number of queries since calling this method
+        """
+        counter = [0]
+        getfromdatabase = database.GetFromDatabase
+        def CountingGetFromDatabase(sql, values=None):
+            counter[0] += 1
+            return getfromdatabase(sql, values)
+        database.GetFromDatabase = CountingGetFromDatabase
+        return counter
+
+
+
+    def RunRandy(self, database, modes, filtersizes, numpicks, songtags, skew):
+        tagids = self.TagAlbums(database, skew)
+        self.TagSongs(database, tagids, songtags)
+
+        # Genre of each song: its own confirmed genre, otherwise the one of its album
+        albumgenres = {entry[0]: entry[1] for entry in database.GetFromDatabase("SELECT albumid, tagid FROM albumtags")}
+        songgenres  = {entry[0]: entry[1] for entry in database.GetFromDatabase("SELECT songid, tagid FROM songtags WHERE approval >= 1")}
+
+        # Keep the genre filter and the blacklists away from the MusicDB server
+        statedir = tempfile.mkdtemp(prefix="musicdbbenchmark")
+        self.cfg.server.statedir = statedir
+        self.cfg.randy.prefetch  = 0
+        mdbstate = MDBState(statedir, database)
+        queries  = self.CountQueries(database)
+
+        print("\033[1;34m%8s  %7s  %10s  %9s  %9s  %9s  %9s  %8s  %8s  %8s  %6s  %6s\033[0m"%("mode", "genres", "candidates",
+            "first[ms]", "p50[ms]", "p90[ms]", "p99[ms]", "max[ms]", "retries", "queries", "cover", "tvd"))
+        try:
+            for mode in modes:
+                if mode == "weighted" and not NumpyFound:
+                    print("\033[1;33mSkipping weighted mode because numpy is not installed\033[0m")
+                    continue
+                self.cfg.randy.mode = mode
+
+                for filtersize in filtersizes:
+                    # Activate the rarest genres
+                    activated = BENCHMARK_GENRES[-filtersize:] if filtersize > 0 else []
+                    for genre in BENCHMARK_GENRES:
+                        mdbstate.Set("albumfilter", genre, genre in activated)
+
+                    activatedids = set(tagids[-filtersize:]) if filtersize > 0 else set()
+
+                    randy      = Randy(self.cfg, database)
+                    filterlist = mdbstate.GetFilterList()
+                    entries    = database.GetRandomCandidates(filterlist, randy.nodisabled, randy.nohated, randy.minlen, withparents=True)
+
+                    # Genre of each candidate like Randy sees it: A confirmed song genre overrides the album genre
+                    candidates = {}
+                    for songid, albumid, artistid in entries:
+                        genre = songgenres.get(songid, albumgenres.get(albumid))
+                        if activatedids and genre not in activatedids:
+                            continue
+                        candidates[songid] = genre
+
+                    database.InvalidateRandomCandidates()
+                    t_start = time.time()
+                    randy.GetSong()
+                    t_first = time.time() - t_start
+
+                    latencies = []
+                    retries   = 0
+                    picks     = {}
+                    queries[0] = 0
+                    for i in range(numpicks):
+                        t_start = time.time()
+                        song    = randy.GetSong()
+                        latencies.append(time.time() - t_start)
+                        if not song:
+                            continue
+                        retries += max(randy.lastdraws - 1, 0)
+                        picks[song["id"]] = picks.get(song["id"], 0) + 1
+                    numqueries = queries[0]
+
+                    # Genre distribution of the candidates and of the chosen songs
+                    expected = {}
+                    for genre in candidates.values():
+                        expected[genre] = expected.get(genre, 0) + 1
+                    observed = {}
+                    for songid, count in picks.items():
+                        genre = candidates.get(songid)
+                        observed[genre] = observed.get(genre, 0) + count
+                    numchosen = max(sum(picks.values()), 1)
+                    tvd = 0.5 * sum(abs(observed.get(genre, 0) / numchosen - expected.get(genre, 0) / max(len(candidates), 1))
+                            for genre in set(expected) | set(observed))
+
+                    latencies.sort()
+                    def Percentile(p):
+                        return latencies[min(int(p * len(latencies)), len(latencies)-1)] * 1000
+
+                    print("\033[1;36m%8s  %7i  %10i  %9.2f  %9.3f  %9.3f  %9.3f  %8.2f  %8.2f  %8.2f  %5.1f%%  %6.3f\033[0m"%(
+                        mode, len(activated), len(candidates), t_first * 1000,
+                        Percentile(0.5), Percentile(0.9), Percentile(0.99), latencies[-1] * 1000,
+                        retries / numpicks, numqueries / numpicks,
+                        100.0 * len(picks) / max(len(candidates), 1), tvd))
+                    if picks:
+                        print("\033[1;30m%8s  most chosen song: %i times\033[0m"%("", max(picks.values())))
+        finally:
+            SaveBlacklists()
+            shutil.rmtree(statedir, ignore_errors=True)
+
+
+
+    def LegacyRandomSong(self, database, tagids):
+        """
+        The former implementation of :meth:`~lib.db.musicdb.MusicDatabase.GetRandomSong`:
+        Filter all albums by their tags and collect the songs of each selected album.
+        Like the former implementation, the tags get read with one query per album.
+        """
+        tagids   = set(tagids)
+        albumids = database.GetAllAlbumIds()
+
+        selectedalbumids = []
+        for albumid in albumids:
+            albumtags = database.GetTargetTags("album", albumid, MusicDatabase.TAG_CLASS_GENRE)
+            if not albumtags:
+                continue
+            if not tagids & { albumtag["id"] for albumtag in albumtags }:
+                continue
+            selectedalbumids.append(albumid)
+
+        songids = database.GetSongIdsByAlbumIds(selectedalbumids, True, True, None)
+        if len(songids) == 0:
+            return None
+        return database.GetSongById(songids[random.randrange(0, len(songids))])
+
+
+
+    def RunRandom(self, database, sizes, numsamples):
+        print("\033[1;34m%8s  %14s  %14s  %14s  %10s\033[0m"%("albums", "former [ms]", "query [ms]", "cached [ms]", "speedup"))
+        for numalbums in sizes:
+            self.CreateLibrary(database, numalbums * 10)
+            tagids = self.TagAlbums(database)
+            filterlist = tagids[:2]
+
+            # Former implementation
+            t_start = time.time()
+            for i in range(numsamples):
+                self.LegacyRandomSong(database, filterlist)
+            legacy = (time.time() - t_start) / numsamples
+
+            # Creating the candidate list
+            t_start = time.time()
+            for i in range(numsamples):
+                database.InvalidateRandomCandidates()
+                database.GetRandomSong(filterlist, nodisabled=True, nohated=True)
+            query = (time.time() - t_start) / numsamples
+
+            # Selecting from the cached candidate list
+            numcached = numsamples * 100
+            t_start = time.time()
+            for i in range(numcached):
+                database.GetRandomSong(filterlist, nodisabled=True, nohated=True)
+            cached = (time.time() - t_start) / numcached
+
+            print("\033[1;36m%8i  %14.3f  %14.3f  %14.3f  %9.1fx\033[0m"%(numalbums, legacy*1000, query*1000, cached*1000, legacy / cached))
+
+
+
+    def LoadLegacy(self, database, tablename, idname, fields):
+        """
+        The former way of loading a whole table:
+        Each row gets read as dictionary and translated into another dictionary.
+        """
+        rows = []
+        for entry in database.GetFromDatabase("SELECT * FROM " + tablename):
+            row = {}
+            for field in fields:
+                if field == "id":
+                    row[field] = entry[idname]
+                else:
+                    row[field] = entry[field]
+            rows.append(row)
+        return rows
+
+
+
+    def MeasureMemory(self, function, *args):
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        rows   = function(*args)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        numrows = len(rows)
+        del rows
+        gc.collect()
+        return numrows, current - before, peak - before
+
+
+
+    def RunMemory(self, database, legacydatabase):
+        tables = []
+        tables.append(("artists", "artistid", Artist.FIELDS, database.GetAllArtists))
+        tables.append(("albums",  "albumid",  Album.FIELDS,  database.GetAllAlbums))
+        tables.append(("songs",   "songid",   Song.FIELDS,   database.GetAllSongs))
+
+        MB = 1024 * 1024
+        print("\033[1;34m%8s  %8s  %26s  %26s  %8s\033[0m"%("table", "rows", "dictionaries [MB] (peak)", "row objects [MB] (peak)", "ratio"))
+        for tablename, idname, fields, function in tables:
+            numrows, legacy, legacypeak = self.MeasureMemory(self.LoadLegacy, legacydatabase, tablename, idname, fields)
+            numrows, current, peak      = self.MeasureMemory(function)
+            ratio = legacy / current if current else 0.0
+            print("\033[1;36m%8s  %8i  %17.1f (%6.1f)  %17.1f (%6.1f)  %7.2fx\033[0m"%(
+                tablename, numrows, legacy/MB, legacypeak/MB, current/MB, peak/MB, ratio))
+
+
+
+    def RunRelations(self, database, numrelations, numsamples):
+        tagids     = self.TagAlbums(database)
+        filterlist = tagids[:2]
+        songids    = [entry[0] for entry in database.GetFromDatabase("SELECT songid FROM songs")]
+
+        # Synthetic relations with a few strong and many weak ones
+        relations = []
+        for songid in songids:
+            for i in range(numrelations):
+                relations.append((songid, random.choice(songids), int(random.paretovariate(1.5))))
+
+        graph = RelationGraph(self.cfg)
+        t_start = time.time()
+        graph.SetRelations("song", relations)
+        t_graph = time.time() - t_start
+
+        candidates = database.GetRandomCandidates(filterlist, nodisabled=True, nohated=True)
+        t_start = time.time()
+        table   = Randy.CreateNeighbourTable(graph, candidates, self.cfg.randy.neighbours)
+        t_table = time.time() - t_start
+
+        print("\033[1;34mRelation graph with \033[1;36m%i\033[1;34m relations created after \033[1;36m%.3fs\033[0m"%(len(relations), t_graph))
+        print("\033[1;34mNeighbour table with \033[1;36m%i\033[1;34m songs created after \033[1;36m%.3fs\033[0m"%(len(table), t_table))
+        if not table:
+            print("\033[1;31mNo song has related songs in the activated genres!\033[0m")
+            return
+
+        numselections = numsamples * 100
+        previous      = [random.choice(list(table.keys())) for i in range(numselections)]
+        timing        = {}
+
+        # Neighbour table
+        t_start = time.time()
+        for songid in previous:
+            database.GetSongById(Randy.ChooseNeighbour(table[songid]))
+        timing["table"] = (time.time() - t_start) / numselections
+
+        # Filtering the relations from the graph on each selection
+        t_start = time.time()
+        for songid in previous:
+            allowed    = set(database.GetRandomCandidates(filterlist, nodisabled=True, nohated=True))
+            neighbours = [n for n in graph.GetNeighbours("song", songid) if n[0] in allowed]
+            neighbour  = random.choices([n[0] for n in neighbours], [n[1] for n in neighbours])[0]
+            database.GetSongById(neighbour)
+        timing["graph"] = (time.time() - t_start) / numselections
+
+        # Uniform selection
+        t_start = time.time()
+        for songid in previous:
+            database.GetRandomSong(filterlist, nodisabled=True, nohated=True)
+        timing["uniform"] = (time.time() - t_start) / numselections
+
+        print("\033[1;34m%16s  %14s\033[0m"%("selection", "latency [µs]"))
+        for method in ["table", "graph", "uniform"]:
+            print("\033[1;36m%16s  %14.1f\033[0m"%(method, timing[method] * 1000000))
+
+
+
+    def MeasureStream(self, mp3stream):
+        playtime  = 0
+        numframes = 0
+        t_cpu     = time.process_time()   # includes the GStreamer threads
+        t_start   = time.time()
+        for frame in mp3stream.Frames():
+            playtime  += frame["header"]["frametime"]
+            numframes += 1
+        t_cpu   = time.process_time() - t_cpu
+        t_start = time.time() - t_start
+        return numframes, playtime / 1000, t_cpu, t_start
+
+
+
+    def RunStream(self, paths):
+        # GStreamer is only needed for this benchmark
+        from lib.stream.mp3stream import MP3Stream
+        from lib.stream.mp3file   import MP3FileStream
+
+        print("\033[1;34m%10s  %8s  %10s  %10s  %10s  %15s  %s\033[0m"%("source", "frames", "audio [s]", "cpu [s]", "wall [s]", "cpu/stream [%]", "file"))
+        for path in paths:
+            results = []
+            try:
+                results.append(("transcoder", self.MeasureStream(MP3Stream(path))))
+            except Exception as e:
+                print("\033[1;31mTranscoding \033[1;37m%s\033[1;31m failed with error: %s\033[0m"%(path, str(e)))
+
+            try:
+                mp3stream = MP3FileStream(path)
+            except Exception as e:
+                mp3stream = None
+            if mp3stream and mp3stream.IsCompatible():
+                results.append(("mmap", self.MeasureStream(mp3stream)))
+            else:
+                print("\033[1;30m%10s  %s\033[0m"%("mmap", "not an mp3 file with the encoding of the stream: " + path))
+            if mp3stream:
+                mp3stream.Cancel()
+
+            for source, (numframes, playtime, t_cpu, t_wall) in results:
+                cpuperstream = t_cpu / playtime * 100 if playtime else 0.0
+                print("\033[1;36m%10s  %8i  %10.1f  %10.3f  %10.3f  %15.3f  \033[1;30m%s\033[0m"%(
+                    source, numframes, playtime, t_cpu, t_wall, cpuperstream, path))
+
+
+
+    # return exit-code
+    def MDBM_Main(self, args):
+        if args.dbname == self.cfg.database.name:
+            print("\033[1;31mThe benchmark database must not be the MusicDB database!\033[0m")
+            return 1
+
+        try:
+            threadcounts = [int(x) for x in args.threads.split(",")]
+        except ValueError:
+            print("\033[1;31mInvalid list of thread counts: \033[1;37m%s\033[0m"%(args.threads))
+            return 1
+
+        try:
+            sizes = sorted([int(x) for x in args.sizes.split(",")])
+        except ValueError:
+            print("\033[1;31mInvalid list of library sizes: \033[1;37m%s\033[0m"%(args.sizes))
+            return 1
+
+        try:
+            filtersizes = [int(x) for x in args.filters.split(",")]
+        except ValueError:
+            print("\033[1;31mInvalid list of genre filter sizes: \033[1;37m%s\033[0m"%(args.filters))
+            return 1
+        if any(x < 0 or x > len(BENCHMARK_GENRES) for x in filtersizes):
+            print("\033[1;31mThe number of activated genres must be in range 0 to %i\033[0m"%(len(BENCHMARK_GENRES)))
+            return 1
+
+        if args.picks < 1:
+            print("\033[1;31mThe number of picks must be greater than 0\033[0m")
+            return 1
+
+        modes = [x.strip() for x in args.modes.split(",")]
+        if any(x not in ["random", "weighted"] for x in modes):
+            print("\033[1;31mInvalid list of modes: \033[1;37m%s\033[0m \033[1;30m(Valid modes are random and weighted)\033[0m"%(args.modes))
+            return 1
+
+        if args.test == "stream":
+            paths = [x.strip() for x in args.files.split(",") if x.strip()]
+            if not paths:
+                print("\033[1;31mThe stream benchmark needs at least one file given via \033[1;37m--files\033[0m")
+                return 1
+            self.RunStream(paths)
+            return 0
+
+        database = MusicDatabase(self.cfg.database.host, self.cfg.database.port, args.dbname,
+                self.cfg.database.user, self.cfg.database.password, self.cfg.database.charset, self.cfg.database)
+
+        if args.test == "reads":
+            ids = self.CreateLibrary(database, args.songs)
+            self.RunReads(database, ids, threadcounts, args.duration)
+        elif args.test == "import":
+            self.RunImport(database, args.albums)
+        elif args.test == "random":
+            self.RunRandom(database, sizes, args.samples)
+        elif args.test == "memory":
+            self.CreateLibrary(database, args.songs)
+            legacydatabase = Database(self.cfg.database.host, self.cfg.database.port, args.dbname,
+                    self.cfg.database.user, self.cfg.database.password, self.cfg.database.charset, self.cfg.database)
+            self.RunMemory(database, legacydatabase)
+        elif args.test == "relations":
+            self.CreateLibrary(database, args.songs)
+            self.RunRelations(database, args.relations, args.samples)
+        elif args.test == "randy":
+            self.CreateLibrary(database, args.songs, args.songsperalbum, args.albumsperartist)
+            self.RunRandy(database, modes, filtersizes, args.picks, args.songtags, args.skew)
+
+        return 0
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
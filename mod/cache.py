@@ -54,32 +54,30 @@ class cache(MDBModule, MusicCache):
         The process is done in the following steps:
 
             #. Find all files inside the cache using :meth:`mdbapi.musiccache.MusicCache.GetAllCachedFiles`
-            #. Getting all artists, albums and songs from the Music Database
-            #. Removing old artists, albums and songs from the cache using :meth:`mdbapi.musiccache.MusicCache.RemoveOldArtists`. :meth:`mdbapi.musiccache.MusicCache.RemoveOldAlbums` and :meth:`mdbapi.musiccache.MusicCache.RemoveOldSongs`
+            #. Streaming all artists, albums and songs from the Music Database and
+               removing old artists, albums and songs from the cache using :meth:`mdbapi.musiccache.MusicCache.RemoveOldArtists`. :meth:`mdbapi.musiccache.MusicCache.RemoveOldAlbums` and :meth:`mdbapi.musiccache.MusicCache.RemoveOldSongs`
             #. Calling for each song in the database :meth:`mdbapi.musiccache.MusicCache.Add` which adds none existing songs into the cache.
 
         Returns:
             *Nothing*
         """
         # Get all cached files
-        print("\033[1;35m [1/4] \033[1;34mSeaching all files inside the cache …\033[0m")
+        print("\033[1;35m [1/3] \033[1;34mSeaching all files inside the cache …\033[0m")
         cartistpaths, calbumpaths, csongpaths = self.GetAllCachedFiles()
 
-        # Get all entries from the database
-        print("\033[1;35m [2/4] \033[1;34mGetting all artists, albums and songs from the database …\033[0m")
-        mdbartists = self.db.GetAllArtists()
-        mdbalbums  = self.db.GetAllAlbums()
-        mdbsongs   = self.db.GetAllSongs()
+        # Stream all entries from the database and remove old data from the cache
+        print("\033[1;35m [2/3] \033[1;34mRemoving outdated files from the cache …\033[0m")
+        self.RemoveOldArtists(cartistpaths, self.db.IterateArtists())
+        self.RemoveOldAlbums( calbumpaths,  self.db.IterateAlbums() )
 
-        # Remove old data from the cache
-        print("\033[1;35m [3/4] \033[1;34mRemoving outdated files from the cache …\033[0m")
-        self.RemoveOldArtists(cartistpaths, mdbartists)
-        self.RemoveOldAlbums( calbumpaths,  mdbalbums )
-        self.RemoveOldSongs(  csongpaths,   mdbsongs  )
+        # The songs must be read completely before transcoding them.
+        # Otherwise the unbuffered cursor and its connection would be blocked while ffmpeg runs for each song.
+        songs = list(self.db.IterateSongs())
+        self.RemoveOldSongs(  csongpaths,   songs                   )
 
         # Refresh cache
-        print("\033[1;35m [4/4] \033[1;34mChecking for new files in the cache and adding them …\033[0;36m")
-        for song in tqdm(mdbsongs):
+        print("\033[1;35m [3/3] \033[1;34mChecking for new files in the cache and adding them …\033[0;36m")
+        for song in tqdm(songs):
             self.Add(song)
 
 
@@ -28,7 +28,7 @@ The following subcommands are provided:
         Direct interface to:
 
             * If the path addresses a song: :meth:`mdbapi.database.MusicDBDatabase.AddSong`
-            * If the path addresses a album: :meth:`mdbapi.database.MusicDBDatabase.AddAlbum`
+            * If the path addresses a album: :meth:`mdbapi.database.MusicDBDatabase.AddAlbum` (The album and all its songs get added in one transaction. If it fails, nothing gets added.)
             * If the path addresses a artist: :meth:`mdbapi.database.MusicDBDatabase.AddArtist`
 
     ``remove``:
@@ -89,18 +89,13 @@ class stats(MDBModule):
 
     # return exit-code
     def MDBM_Main(self, args):
-        # read database
-        artists      = self.database.GetAllArtists()
-        albums       = self.database.GetAllAlbums()
-        songs        = self.database.GetAllSongs()
-
-        # get stats
-        numartists   = len(artists)
-        numalbums    = len(albums)
-        numsongs     = len(songs)
-        origincounter=  self.CountOrigin(albums)
-        releasecounter= self.CountReleaseYear(albums)
-        bitratecounter= self.CountBitrate(songs)
+        # get stats - the entries get streamed from the database
+        numartists   = sum(1 for artist in self.database.IterateArtists())
+        origincounter=  self.CountOrigin(self.database.IterateAlbums())
+        releasecounter= self.CountReleaseYear(self.database.IterateAlbums())
+        bitratecounter= self.CountBitrate(self.database.IterateSongs())
+        numalbums    = sum(releasecounter.values())
+        numsongs     = sum(bitratecounter.values())
 
         # print stats
 
@@ -24,6 +24,8 @@ The following options are available:
     #. ``--dot``: :meth:`~mod.tracker.GenerateDotFile`
     #. ``--show``: :meth:`~mod.tracker.ShowRelations`
 
+The relations get read from the relation graph (see :doc:`/mdbapi/relationgraph`) that gets loaded from the Tracker Database.
+
 Examples:
 
     Create a dot-file and make a graph out of it
@@ -39,6 +41,7 @@ import argparse
 from lib.modapi         import MDBModule
 from lib.db.trackerdb   import TrackerDatabase
 from lib.filesystem     import Filesystem
+from mdbapi.relationgraph import RelationGraph
 
 
 class tracker(MDBModule):
@@ -46,7 +49,8 @@ class tracker(MDBModule):
         self.config     = config
         self.musicdb    = database
         self.fs         = Filesystem(self.config.music.path)
-        self.trackerdb  = TrackerDatabase(self.config.tracker.dbpath)
+        self.trackerdb  = TrackerDatabase(self.config.tracker.host, self.config.tracker.port, self.config.tracker.name, self.config.tracker.user, self.config.tracker.password, self.config.tracker.charset, self.config.database)
+        self.graph      = RelationGraph(self.config)
 
 
 
@@ -54,6 +58,7 @@ class tracker(MDBModule):
         """
         This method generates a dot file visualizing the relations between the target and the related songs or artists.
         Also, the weights get visualized by the thickness of the edges of the generated graph.
+        Relations between the related songs or artists themselves get looked up in the relation graph and are drawn as dashed edges.
 
         .. warning::
 
@@ -62,7 +67,7 @@ class tracker(MDBModule):
         Args:
             target (str): The target all IDs apply to. Can be ``"song"`` or ``"artist"``.
             targetid (int): ID of the song or artists, the relations belong to
-            relations: A list of relations as returned by :meth:`lib.db.tracker.TrackerDatabase.GetRelations`
+            relations: A list of relations as returned by :meth:`lib.db.trackerdb.TrackerDatabase.GetRelations`
             dotfile (str): A path to write the dotfile to.
 
         Returns:
@@ -111,6 +116,14 @@ class tracker(MDBModule):
 
             dot.write("\t\""+relation["name"]+"\" -> \""+targetname+"\" [penwidth="+str(penwidth)+"];\n")
 
+        # edges between the related songs or artists
+        names = {relation["id"]: relation["name"] for relation in relations}
+        for relation in relations:
+            for neighbourid, weight in self.graph.GetNeighbours(target, relation["id"]):
+                if neighbourid not in names or neighbourid < relation["id"]:
+                    continue
+                penwidth = max(1, int(weight/10))
+                dot.write("\t\""+relation["name"]+"\" -> \""+names[neighbourid]+"\" [penwidth="+str(penwidth)+"; style=dashed];\n")
         dot.write("}\n\n")
         dot.close()
         return True
@@ -124,7 +137,7 @@ class tracker(MDBModule):
         Args:
             target (str): The target all IDs apply to. Can be ``"song"`` or ``"artist"``.
             targetid (int): ID of the song or artists, the relations belong to
-            relations: A list of relations as returned by :meth:`lib.db.tracker.TrackerDatabase.GetRelations`
+            relations: A list of relations as returned by :meth:`lib.db.trackerdb.TrackerDatabase.GetRelations`
 
         Returns:
             ``True`` on success. If there is any error, ``False`` gets returned.
@@ -241,8 +254,11 @@ class tracker(MDBModule):
             return 1
 
         # Get target relation
-        print("\033[1;34mGetting \033[1;36m%s\033[1;34m relations from database … \033[0m"%(target))
-        relations = self.trackerdb.GetRelations(target, targetid)
+        print("\033[1;34mLoading relation graph from database … \033[0m")
+        if not self.graph.Load():
+            print("\033[1;31mLoading the relation graph failed!\033[0m")
+            return 1
+        relations = [{"id": xid, "weight": weight} for xid, weight in self.graph.GetNeighbours(target, targetid)]
         print("\033[1;36m%d\033[1;34m entries found.\033[0m"%(len(relations)))
 
         # Apply parameters
@@ -14,6 +14,21 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
+This command line module upgrades the configuration and the databases of MusicDB to the current version.
+
+Version 3 of the databases adds indices for the columns the server filters on.
+Relations in the tracker database get a unique key on their ID pairs.
+Duplicate relation pairs get merged (their weights get summed up) before the key gets created.
+
+With the ``--analyze`` option, the query plans (``EXPLAIN``) of the most frequent queries get printed
+before and after the upgrade.
+So it is possible to check if the database really uses the indices.
+
+Example:
+
+    .. code-block:: bash
+
+        musicdb upgrade --analyze
 """
 
 import argparse
@@ -23,11 +38,55 @@ import base64
 from lib.modapi         import MDBModule
 from lib.filesystem     import Filesystem
 from mdbapi.database    import MusicDBDatabase
-from lib.db.trackerdb   import TrackerDatabase
-from lib.db.lycradb     import LycraDatabase
+from lib.db.database    import Database
 from lib.cfg.musicdb    import MusicDBConfig
 
 
+MUSICDB_INDICES = [
+    "CREATE INDEX IF NOT EXISTS songs_albumid     ON songs     (albumid)",
+    "CREATE INDEX IF NOT EXISTS songs_path        ON songs     (path(255))",
+    "CREATE INDEX IF NOT EXISTS albums_artistid   ON albums    (artistid)",
+    "CREATE INDEX IF NOT EXISTS albums_path       ON albums    (path(255))",
+    "CREATE INDEX IF NOT EXISTS songtags_songid   ON songtags  (songid)",
+    "CREATE INDEX IF NOT EXISTS albumtags_albumid ON albumtags (albumid)",
+    "CREATE INDEX IF NOT EXISTS tags_nameclass    ON tags      (name(64), class)",
+    ]
+
+TRACKERDB_INDICES = [
+    "CREATE UNIQUE INDEX IF NOT EXISTS songrelations_pair        ON songrelations   (songida, songidb)",
+    "CREATE        INDEX IF NOT EXISTS songrelations_songidb     ON songrelations   (songidb)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS artistrelations_pair      ON artistrelations (artistida, artistidb)",
+    "CREATE        INDEX IF NOT EXISTS artistrelations_artistidb ON artistrelations (artistidb)",
+    ]
+
+LYCRADB_INDICES = [
+    "CREATE INDEX IF NOT EXISTS lyricscache_songid ON lyricscache (songid(32))",
+    ]
+
+# Frequent queries of the server (query, example arguments) used for the --analyze report
+MUSICDB_QUERIES = [
+    ("SELECT * FROM songs WHERE albumid = ?",               1),
+    ("SELECT * FROM songs WHERE path = ?",                  ""),
+    ("SELECT * FROM albums WHERE artistid = ?",             1),
+    ("SELECT * FROM albums WHERE path = ?",                 ""),
+    ("SELECT * FROM songtags WHERE songid = ?",             1),
+    ("SELECT * FROM albumtags WHERE albumid = ?",           1),
+    ("SELECT * FROM tags WHERE name = ? AND class = ?",     ("Other", 1)),
+    ]
+
+TRACKERDB_QUERIES = [
+    ("SELECT id, weight FROM songrelations WHERE songida = ? AND songidb = ?", (1, 2)),
+    ("SELECT songida, weight FROM songrelations WHERE songidb = ?",            1),
+    ("SELECT songidb, weight FROM songrelations WHERE songida = ?",            1),
+    ("SELECT artistida, weight FROM artistrelations WHERE artistidb = ?",      1),
+    ("SELECT artistidb, weight FROM artistrelations WHERE artistida = ?",      1),
+    ]
+
+LYCRADB_QUERIES = [
+    ("SELECT * FROM lyricscache WHERE songid = ?", "1"),
+    ]
+
+
 class upgrade(MDBModule, MusicDBDatabase):
     def __init__(self, config, database):
         MDBModule.__init__(self)
@@ -41,6 +100,7 @@ class upgrade(MDBModule, MusicDBDatabase):
     def MDBM_CreateArgumentParser(parserset, modulename):
         parser = parserset.add_parser(modulename, help="Upgrade MusicDB's internal files to the current version")
         parser.set_defaults(module=modulename)
+        parser.add_argument("--analyze", action="store_true", help="Print the query plans of frequent queries before and after the upgrade")
         return parser
 
 
@@ -59,63 +119,167 @@ class upgrade(MDBModule, MusicDBDatabase):
 
 
     def GetDatabaseVersion(self, database):
+        # Version 1 databases do not have a meta table
+        result = database.GetFromDatabase("SHOW TABLES LIKE 'meta'")
+        if not result:
+            return 1
+
+        result = database.GetFromDatabase("SELECT value FROM meta WHERE `key` = 'version'")
+        if not result:
+            raise ValueError("Database has a meta table but no version entry")
         try:
-            result = self.db.GetFromDatabase("SELECT value FROM meta WHERE key = 'version'")
-            version = int(result[0][0])
-        except Exception as e:
-            version = 0
+            version = int(result[0]["value"])
+        except ValueError:
+            raise ValueError("Unknown database version \"%s\""%(str(result[0]["value"])))
         return version
 
 
+    def OpenDatabase(self, section):
+        # Use the plain database class because the derived classes refuse to open outdated databases.
+        # It also returns the rows as dictionaries while MusicDatabase and TrackerDatabase return tuples.
+        return Database(section.host, section.port, section.name, section.user, section.password, section.charset, self.cfg.database)
+
+
     def AddMetaTableToDatabase(self, database):
         # This needs to be done for all three databases, music.db, lycra.db and tracker.db
         # to upgrade them to version 2
         try:
-            self.db.Execute("CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT, VALUE TEXT DEFAULT '')")
-            self.db.Execute("INSERT INTO meta (key, value) VALUES (\"version\", 2)")
+            database.Execute("CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY AUTOINCREMENT, `key` TEXT, VALUE TEXT DEFAULT '')")
+            database.Execute("INSERT INTO meta (`key`, value) VALUES (\"version\", 2)")
+        except Exception as e:
+            self.PrintError(str(e))
+            return False
+        return True
+
+
+    def AddIndicesToDatabase(self, database, indices):
+        # Version 3: indices for the columns the queries filter on.
+        # TEXT columns can only be indexed with a prefix length.
+        try:
+            for sql in indices:
+                database.Execute(sql)
+            database.Execute("UPDATE meta SET value = '3' WHERE `key` = 'version'")
+        except Exception as e:
+            self.PrintError(str(e))
+            return False
+        return True
+
+
+    def MergeDuplicateRelations(self, database):
+        # The unique key on the relation pairs can only be created when there are no duplicates.
+        # Duplicates get merged into the oldest entry by summing up their weights.
+        try:
+            for target in ["song", "artist"]:
+                table = target + "relations"
+                ida   = target + "ida"
+                idb   = target + "idb"
+
+                sql  = "UPDATE " + table + " AS r JOIN ("
+                sql += "SELECT MIN(id) AS id, SUM(weight) AS weight FROM " + table
+                sql += " GROUP BY " + ida + ", " + idb + " HAVING COUNT(*) > 1"
+                sql += ") AS d ON r.id = d.id SET r.weight = d.weight"
+                database.Execute(sql)
+
+                sql  = "DELETE r FROM " + table + " AS r JOIN ("
+                sql += "SELECT MIN(id) AS id, " + ida + ", " + idb + " FROM " + table
+                sql += " GROUP BY " + ida + ", " + idb
+                sql += ") AS k ON r." + ida + " = k." + ida + " AND r." + idb + " = k." + idb + " AND r.id <> k.id"
+                database.Execute(sql)
         except Exception as e:
             self.PrintError(str(e))
             return False
         return True
 
 
+    def ExplainQueries(self, database, queries):
+        plans = []
+        for sql, values in queries:
+            try:
+                plan = database.GetFromDatabase("EXPLAIN " + sql, values)
+            except Exception as e:
+                plan = str(e)
+            plans.append(plan)
+        return plans
+
+
+    def PrintAnalysis(self, databasename, queries, plansbefore, plansafter):
+        print("\033[1;35m * \033[1;34mQuery plans of \033[0;36m%s\033[0m"%(databasename))
+        for (sql, values), before, after in zip(queries, plansbefore, plansafter):
+            print("\033[1;37m   %s\033[0m"%(sql))
+            for label, plan in [("before", before), ("after", after)]:
+                if type(plan) == str:
+                    print("\033[1;34m\t%6s: \033[1;31m%s\033[0m"%(label, plan))
+                    continue
+                for step in plan:
+                    if step["key"]:
+                        color = "\033[1;32m"
+                    else:
+                        color = "\033[1;33m"
+                    print("\033[1;34m\t%6s: \033[0;36m%-16s %stype=%-6s key=%-24s\033[1;34m rows=\033[0;36m%s\033[0m"%(
+                        label, step["table"], color, step["type"], step["key"], step["rows"]))
+
+
+
     def UpgradeMusicDB(self):
         self.PrintCheckFile("music.db")
-        newversion = 2
+        musicdb    = self.OpenDatabase(self.cfg.database)
+        newversion = 3
 
         # Check version of MusicDB
-        version = self.GetDatabaseVersion(self.db)
+        try:
+            version = self.GetDatabaseVersion(musicdb)
+        except ValueError as e:
+            self.PrintError(str(e))
+            return False
 
         # Check if good
         if version == newversion:
             self.PrintGood()
             return True
 
+        if version < 1 or version > newversion:
+            self.PrintError("Unknown database version %i"%(version))
+            return False
+
         # Upgrade if too old
         self.PrintUpgrade(version, newversion)
         if version == 1:
-            retval = self.AddMetaTableToDatabase(self.db)
+            retval = self.AddMetaTableToDatabase(musicdb)
             if not retval:
                 return False
             version = 2
 
+        if version == 2:
+            retval = self.AddIndicesToDatabase(musicdb, MUSICDB_INDICES)
+            if not retval:
+                return False
+            version = 3
+
         self.PrintGood()
         return True
 
 
     def UpgradeTrackerDB(self):
         self.PrintCheckFile("tracker.db")
-        trackerdb  = TrackerDatabase(self.cfg.tracker.dbpath)
-        newversion = 2
+        trackerdb  = self.OpenDatabase(self.cfg.tracker)
+        newversion = 3
 
         # Check current version
-        version = self.GetDatabaseVersion(trackerdb)
+        try:
+            version = self.GetDatabaseVersion(trackerdb)
+        except ValueError as e:
+            self.PrintError(str(e))
+            return False
 
         # Check if good
         if version == newversion:
             self.PrintGood()
             return True
 
+        if version < 1 or version > newversion:
+            self.PrintError("Unknown database version %i"%(version))
+            return False
+
         # Upgrade if too old
         self.PrintUpgrade(version, newversion)
         if version == 1:
@@ -124,23 +288,40 @@ class upgrade(MDBModule, MusicDBDatabase):
                 return False
             version = 2
 
+        if version == 2:
+            retval = self.MergeDuplicateRelations(trackerdb)
+            if not retval:
+                return False
+            retval = self.AddIndicesToDatabase(trackerdb, TRACKERDB_INDICES)
+            if not retval:
+                return False
+            version = 3
+
         self.PrintGood()
         return True
 
 
     def UpgradeLycraDB(self):
         self.PrintCheckFile("lycra.db")
-        lycradb    = TrackerDatabase(self.cfg.lycra.dbpath)
-        newversion = 2
+        lycradb    = self.OpenDatabase(self.cfg.lycra)
+        newversion = 3
 
         # Check current version
-        version = self.GetDatabaseVersion(lycradb)
+        try:
+            version = self.GetDatabaseVersion(lycradb)
+        except ValueError as e:
+            self.PrintError(str(e))
+            return False
 
         # Check if good
         if version == newversion:
             self.PrintGood()
             return True
 
+        if version < 1 or version > newversion:
+            self.PrintError("Unknown database version %i"%(version))
+            return False
+
         # Upgrade if too old
         self.PrintUpgrade(version, newversion)
         if version == 1:
@@ -149,6 +330,12 @@ class upgrade(MDBModule, MusicDBDatabase):
                 return False
             version = 2
 
+        if version == 2:
+            retval = self.AddIndicesToDatabase(lycradb, LYCRADB_INDICES)
+            if not retval:
+                return False
+            version = 3
+
         self.PrintGood()
         return True
 
@@ -225,10 +412,26 @@ class upgrade(MDBModule, MusicDBDatabase):
     def MDBM_Main(self, args):
 
         self.UpgradeConfiguration()
-        self.UpgradeMusicDB()
-        self.UpgradeTrackerDB()
-        self.UpgradeLycraDB()
+
+        if args.analyze:
+            analysis = [
+                ("music.db",   self.OpenDatabase(self.cfg.database), MUSICDB_QUERIES),
+                ("tracker.db", self.OpenDatabase(self.cfg.tracker),  TRACKERDB_QUERIES),
+                ("lycra.db",   self.OpenDatabase(self.cfg.lycra),    LYCRADB_QUERIES)]
+            plansbefore = [self.ExplainQueries(database, queries) for _, database, queries in analysis]
+
+        success  = self.UpgradeMusicDB()
+        success &= self.UpgradeTrackerDB()
+        success &= self.UpgradeLycraDB()
         #self.UpgradeWebUIConfiguration()
+
+        if args.analyze:
+            for (name, database, queries), before in zip(analysis, plansbefore):
+                after = self.ExplainQueries(database, queries)
+                self.PrintAnalysis(name, queries, before, after)
+
+        if not success:
+            return 1
         return 0
 
 # vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
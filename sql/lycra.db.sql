@@ -4,7 +4,7 @@ CREATE TABLE IF NOT EXISTS meta
     key         TEXT,
     value       TEXT DEFAULT ''
 );
-INSERT INTO meta (key, value) VALUES ("version", 2);
+INSERT INTO meta (key, value) VALUES ("version", 3);
 
 
 CREATE TABLE IF NOT EXISTS lyricscache
@@ -17,5 +17,7 @@ CREATE TABLE IF NOT EXISTS lyricscache
     lyrics      BLOB
 );
 
+CREATE INDEX IF NOT EXISTS lyricscache_songid ON lyricscache (songid);
+
 -- vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
 
@@ -4,7 +4,7 @@ CREATE TABLE IF NOT EXISTS meta
     key         TEXT,
     value       TEXT DEFAULT ''
 );
-INSERT INTO meta (key, value) VALUES ("version", 2);
+INSERT INTO meta (key, value) VALUES ("version", 3);
 
 
 CREATE TABLE IF NOT EXISTS artists
@@ -98,5 +98,14 @@ CREATE TABLE IF NOT EXISTS songtags
     approval    INTEGER DEFAULT 1
 );
 
+
+CREATE INDEX IF NOT EXISTS songs_albumid     ON songs     (albumid);
+CREATE INDEX IF NOT EXISTS songs_path        ON songs     (path);
+CREATE INDEX IF NOT EXISTS albums_artistid   ON albums    (artistid);
+CREATE INDEX IF NOT EXISTS albums_path       ON albums    (path);
+CREATE INDEX IF NOT EXISTS songtags_songid   ON songtags  (songid);
+CREATE INDEX IF NOT EXISTS albumtags_albumid ON albumtags (albumid);
+CREATE INDEX IF NOT EXISTS tags_nameclass    ON tags      (name, class);
+
 -- vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
 
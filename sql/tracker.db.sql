@@ -4,7 +4,7 @@ CREATE TABLE IF NOT EXISTS meta
     key         TEXT,
     value       TEXT DEFAULT ''
 );
-INSERT INTO meta (key, value) VALUES ("version", 2);
+INSERT INTO meta (key, value) VALUES ("version", 3);
 
 CREATE TABLE IF NOT EXISTS songrelations
 (
@@ -22,5 +22,10 @@ CREATE TABLE IF NOT EXISTS artistrelations
     weight      INTEGER DEFAULT 1
 );
 
+CREATE UNIQUE INDEX IF NOT EXISTS songrelations_pair     ON songrelations   (songida, songidb);
+CREATE        INDEX IF NOT EXISTS songrelations_songidb  ON songrelations   (songidb);
+CREATE UNIQUE INDEX IF NOT EXISTS artistrelations_pair   ON artistrelations (artistida, artistidb);
+CREATE        INDEX IF NOT EXISTS artistrelations_artistidb ON artistrelations (artistidb);
+
 -- vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
 
@@ -1,6 +1,8 @@
 
 var currentsongid   = null; // \_ track current album and song
 var currentalbumid  = null; // /
+var queueversion    = null; // \_ queue as known by the client, updated by onQueueChanged
+var queueentries    = [];   // /
 
 function onMusicDBConnectionOpen()
 {
@@ -9,7 +11,7 @@ function onMusicDBConnectionOpen()
 
     MusicDB_Request("GetTags",      "UpdateTagsCache");
     MusicDB_Request("GetStreamState",  "UpdateStreamState");
-    MusicDB_Request("GetQueue",     "ShowQueue");
+    MusicDB_Request("GetQueueState","ShowQueue");
     MusicDB_Request("GetMDBState",  "UpdateMDBState");
     MusicDB_Request("GetFilteredArtistsWithAlbums", "ShowArtists");
 }
@@ -59,7 +61,11 @@ function onMusicDBNotification(fnc, sig, rawdata)
         }
         else if(sig == "onQueueChanged")
         {
-            MusicDB_Request("GetQueue", "ShowQueue");
+            // rawdata holds the changes since the last known version of the queue
+            if(!ApplyQueueChanges(rawdata))
+                MusicDB_Request("GetQueueState", "ShowQueue");
+            else
+                ShowQueue("RightContentBox", queueentries);
         }
     }
 }
@@ -140,6 +146,12 @@ function onMusicDBMessage(fnc, sig, args, pass)
     else if(fnc == "GetQueue" && sig == "ShowQueue")
         ShowQueue("RightContentBox", args);
 
+    else if(fnc == "GetQueueState" && sig == "ShowQueue") {
+        queueversion = args.version;
+        queueentries = args.queue;
+        ShowQueue("RightContentBox", queueentries);
+    }
+
     else if(fnc == "GetAlbum" && sig == "ShowAlbum") {
         ShowAlbum("MiddleContentBox", args.artist, args.album, args.cds, args.tags, currentsongid);
         currentalbumid = args.album.id;
@@ -174,6 +186,53 @@ function onMusicDBMessage(fnc, sig, args, pass)
 }
 
 
+// Applies the changes of an onQueueChanged notification to the known queue.
+// Returns false if the changes cannot be applied and the whole queue must be requested.
+function ApplyQueueChanges(data)
+{
+    if(data == null || data.resync || queueversion == null)
+        return false;
+
+    for(let change of data.changes)
+    {
+        if(change.version <= queueversion)
+            continue;   // already known
+        if(change.version != queueversion + 1)
+            return false;   // changes missed
+
+        let index = queueentries.findIndex(entry => entry.entryid == change.entryid);
+        if(change.operation == "insert")
+        {
+            let after = queueentries.findIndex(entry => entry.entryid == change.afterid);
+            if(change.afterid != null && after < 0)
+                return false;
+            queueentries.splice(after + 1, 0, change.entry);
+        }
+        else if(change.operation == "remove" || change.operation == "advance")
+        {
+            if(index < 0)
+                return false;
+            queueentries.splice(index, 1);
+        }
+        else if(change.operation == "move")
+        {
+            if(index < 0)
+                return false;
+            let entry = queueentries.splice(index, 1)[0];
+            let after = queueentries.findIndex(entry => entry.entryid == change.afterid);
+            if(after < 0)
+                return false;
+            queueentries.splice(after + 1, 0, entry);
+        }
+        else
+            return false;
+
+        queueversion = change.version;
+    }
+    return true;
+}
+
+
 window.onload = function ()
 {
     ConnectToMusicDB();